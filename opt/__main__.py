@@ -1,8 +1,16 @@
 import argparse
 from opt import ONNXOptimizer, Config
+from opt.config import TARGETS
 from opt.logger import setup_global_logging
+from opt.pass_manager import PassManager
+from opt.utils import get_peak_rss_mb
 
 
+def log_peak_rss(logger, stage: str):
+    peak_rss = get_peak_rss_mb()
+    if peak_rss is not None:
+        logger.info(f"Peak RSS after {stage}: {peak_rss:.1f} MB")
+
 
 def main():
     parser = argparse.ArgumentParser(description="Optimize an ONNX model and save the result.")
@@ -10,6 +18,42 @@ def main():
     parser.add_argument("output_model", help="Path where the optimized ONNX model will be saved")
     parser.add_argument("-l", "--log-level", type=int, default=1,
                         help="Log level (0=DEBUG, 1=INFO, 2=WARNING, 3=ERROR)")
+    parser.add_argument("--fixpoint", action="store_true",
+                        help="Repeat matching and fusion until no pattern matches anymore")
+    parser.add_argument("--max-iterations", type=int, default=10,
+                        help="Maximum number of rounds in fixpoint mode")
+    parser.add_argument("--match-memo", action="store_true",
+                        help="Reuse match decisions across structurally identical blocks")
+    parser.add_argument("--match-workers", type=int, default=1,
+                        help="Worker processes for pattern matching on large graphs, 0 for all CPUs")
+    parser.add_argument("--overlap-resolution", choices=["optimal", "greedy"], default="optimal",
+                        help="Keep the non-overlapping matches of maximum benefit, or the first match in topological order")
+    parser.add_argument("--profile-matching", action="store_true",
+                        help="Print per-pattern match statistics (attempts, hits, time, rejection stage)")
+    parser.add_argument("--passes", nargs="+", metavar="NAME",
+                        help="Passes to run, in order (default: every pass enabled by default). "
+                             "Available: " + ", ".join(PassManager.available()))
+    parser.add_argument("--disable-pass", action="append", default=[], metavar="NAME",
+                        help="Remove a pass from the pipeline, can be repeated")
+    parser.add_argument("--fold-max-size", type=int, default=1 << 20,
+                        help="Maximum size in bytes of a tensor created by constant folding")
+    parser.add_argument("--fold-dry-run", action="store_true",
+                        help="Report the nodes constant folding would replace without changing the graph")
+    parser.add_argument("--target", choices=TARGETS, default="tensorrt",
+                        help="Form of the fused ops: TensorRT plugins, onnxruntime contrib ops or standard ONNX ops")
+    parser.add_argument("--verify-folding", action="store_true",
+                        help="Check every BatchNormalization folding against the unfused subgraph with onnxruntime")
+    parser.add_argument("--no-shape-inference", action="store_true",
+                        help="Only use the shapes annotated in the model instead of inferring the missing ones")
+    parser.add_argument("--no-mmap", action="store_true",
+                        help="Read external data into memory instead of memory-mapping it")
+    parser.add_argument("--external-data", action="store_true",
+                        help="Save initializers as external data next to the output model "
+                             "(always done when they exceed the 2GB protobuf limit)")
+    parser.add_argument("--external-data-threshold", type=int, default=1024,
+                        help="Minimum initializer size in bytes to be saved as external data")
+    parser.add_argument("--shard-size", type=int, default=0,
+                        help="Maximum size in MB of each external data file, 0 for a single file")
     args = parser.parse_args()
     
     # 配置全局日志
@@ -19,22 +63,48 @@ def main():
     config = Config(
         allow_overlap=False,
         log_level=10,  # DEBUG级别
-        visualize=False
+        visualize=False,
+        match_memo=args.match_memo,
+        profile_matching=args.profile_matching,
+        match_workers=args.match_workers,
+        overlap_resolution=args.overlap_resolution,
+        target=args.target,
+        verify_folding=args.verify_folding,
+        fixpoint=args.fixpoint,
+        max_iterations=args.max_iterations,
+        passes=args.passes,
+        disabled_passes=args.disable_pass,
+        constant_folding_max_size=args.fold_max_size,
+        constant_folding_dry_run=args.fold_dry_run,
+        infer_shapes=not args.no_shape_inference,
+        mmap_external_data=not args.no_mmap,
+        external_data=args.external_data,
+        external_data_threshold=args.external_data_threshold,
+        external_data_shard_size=args.shard_size * 1024 * 1024 or None,
     )
     
-    optimizer = ONNXOptimizer(config=config)
+    try:
+        optimizer = ONNXOptimizer(config=config)
+    except ValueError as e:
+        logger.error(str(e))
+        return
  
     if not optimizer.load_model(args.input_model):
         logger.error(f"Failed to load model: {args.input_model}")
         return
+    log_peak_rss(logger, "load")
 
-    if optimizer.optimize():
+    optimized = optimizer.optimize()
+    if optimizer.matcher.profile is not None:
+        logger.info("Pattern match profile:\n" + optimizer.matcher.profile.format_table())
+    if optimized:
         if optimizer.save_model(args.output_model):
             logger.info(f"Optimized model saved to: {args.output_model}")
         else:
             logger.error(f"Failed to save optimized model to: {args.output_model}")
     else:
         logger.info("Optimization failed.")
+    log_peak_rss(logger, "optimize + save")
         
     # TODO
     # compare outputs of optimized onnx with previous one
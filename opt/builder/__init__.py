@@ -1,4 +1,6 @@
-from .convtrans_bn import fuse_convtrans_bn
-from .layernorm import fuse_layernorm
+from .linear_bn import fuse_linear_bn
+from .epilogue import fuse_linear_epilogue
+from .activation import fuse_activation
+from .layernorm import fuse_layernorm, fuse_rmsnorm
 from .customattn import fuse_customattn
 from .logdiv import replace_log_div
\ No newline at end of file
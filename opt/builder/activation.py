@@ -0,0 +1,82 @@
+import logging
+import onnx_graphsurgeon as gs
+
+from typing import Optional, Tuple
+from ..pattern import MatchResult
+from ..utils import TensorIndex
+from ..onnx_helper import ShapeInference
+
+logger = logging.getLogger(__name__)
+
+# activation -> target -> (op, domain, attrs, minimum opset of the default domain)
+_ACTIVATION_OPS = {
+    "Gelu": {"onnx": ("Gelu", None, {"approximate": "none"}, 20),
+             "ort": ("Gelu", "com.microsoft", {}, 1),
+             "tensorrt": ("NvGeluPlugin", None, {"approximate": "none"}, 1)},
+    "FastGelu": {"onnx": ("Gelu", None, {"approximate": "tanh"}, 20),
+                 "ort": ("FastGelu", "com.microsoft", {}, 1),
+                 "tensorrt": ("NvGeluPlugin", None, {"approximate": "tanh"}, 1)},
+    # onnxruntime has no Silu, QuickGelu is x * Sigmoid(alpha * x)
+    "Silu": {"onnx": ("Swish", None, {}, 24),
+             "ort": ("QuickGelu", "com.microsoft", {"alpha": 1.0}, 1),
+             "tensorrt": ("NvSiluPlugin", None, {}, 1)},
+}
+
+
+def activation_op(graph: gs.Graph, activation: str, target: str) -> Optional[Tuple[str, Optional[str], dict]]:
+    """(op, domain, attrs) computing `activation` on `target`, None if there is none at the opset of `graph`."""
+    ops = _ACTIVATION_OPS.get(activation)
+    if ops is None:
+        return None
+    op, domain, attrs, min_opset = ops[target]
+    if graph.opset < min_opset:
+        logger.debug(f"{op} needs opset {min_opset}, the graph has opset {graph.opset}.")
+        return None
+    return op, domain, dict(attrs)
+
+
+def _elementwise_shape(node: gs.Node):
+    """the output has the type of x"""
+    x = node.inputs[0]
+    return [(x.dtype, x.shape)]
+
+
+# com.microsoft ops and plugins have no onnx schema (the standard Gelu follows the same rule)
+for _op in ("Gelu", "FastGelu", "QuickGelu", "NvGeluPlugin", "NvSiluPlugin"):
+    ShapeInference.register(_op)(_elementwise_shape)
+
+
+@gs.Graph.register()
+def fuse_activation(self, match_result: MatchResult, tensors: Optional[TensorIndex] = None,
+                    target: str = "tensorrt"):
+    """
+    Args:
+        match_result: 展开成多个小算子的激活函数的匹配结果（ActivationPattern）
+        tensors: tensor name -> gs.Tensor 索引，由 FusionExecutor 在整批融合中共享，为空时从图构建
+        target: tensorrt 生成 NvGeluPlugin / NvSiluPlugin，ort 生成 com.microsoft Gelu / FastGelu / QuickGelu，
+                onnx 生成标准 Gelu（opset 20）/ Swish（opset 24）
+    Returns:
+        返回融合后的新节点；图的 opset 低于标准算子要求的版本时返回 None（图不变）
+    """
+    activation = match_result.attrs["activation"]
+    fused = activation_op(self, activation, target)
+    if fused is None:
+        return None
+    op, domain, attrs = fused
+
+    if tensors is None:
+        tensors = TensorIndex.from_graph(self)
+    x = tensors.get(match_result.inputs[0])
+    output = tensors.get(match_result.outputs[0])
+
+    for outp in x.outputs[::]:
+        if outp.name in match_result.node_names:
+            x.outputs.remove(outp)
+    for inp in output.inputs[::]:
+        if inp.name in match_result.node_names:
+            output.inputs.remove(inp)
+
+    fused_node = self.layer(op=op, name=f"{match_result.matched_nodes[-1].name}_{activation}", domain=domain,
+                            inputs=[x], outputs=[output], attrs=attrs)
+    tensors.retire(match_result)
+    return fused_node
@@ -1,62 +1,210 @@
+import logging
 import numpy as np
 import onnx_graphsurgeon as gs
 
+from typing import Optional
 from ..pattern import MatchResult
+from ..utils import TensorIndex
+from ..onnx_helper import ShapeInference
+
+logger = logging.getLogger(__name__)
+
+# rank of q / k / v -> perm from a pre-transposed k (.., heads, head_size, seq) back to (.., seq, heads, head_size)
+_K_PERMS = {3: [2, 0, 1], 4: [0, 3, 1, 2]}
+
+
+@ShapeInference.register("CustomFFAttn")
+def customattn_shape(node: gs.Node):
+    """
+    inputs: q, k, v (seq, heads, head_size), seq_q, seq_k slices
+    the output keeps the layout of q with the head size of v
+    """
+    q, _, v = node.inputs[:3]
+    if q.shape is None or v.shape is None or len(q.shape) != len(v.shape):
+        return [(q.dtype, None)]
+    return [(q.dtype, list(q.shape[:-1]) + [v.shape[-1]])]
+
+
+@ShapeInference.register("MultiHeadAttention")
+def multihead_attention_shape(node: gs.Node):
+    """
+    com.microsoft MultiHeadAttention with q (batch, seq_q, hidden), k / v (batch, seq_k, hidden):
+    the output is (batch, seq_q, v hidden)
+    """
+    q, _, v = node.inputs[:3]
+    if q.shape is None or v.shape is None or len(q.shape) != 3 or len(v.shape) != 3:
+        return [(q.dtype, None)] + [None] * (len(node.outputs) - 1)
+    return [(q.dtype, list(q.shape[:2]) + [v.shape[-1]])] + [None] * (len(node.outputs) - 1)
+
+
+def _static(shape, dims) -> bool:
+    return shape is not None and all(isinstance(shape[dim], int) and shape[dim] > 0 for dim in dims)
+
+
+def _can_merge_heads(shape, rank: int) -> bool:
+    """a 4-D (batch, seq, heads, head_size) merges with Reshape [0, 0, -1], a 3-D one needs static heads and head size"""
+    return shape is not None and len(shape) == rank and (rank == 4 or _static(shape, (1, 2)))
+
+
+def _reshape(self: gs.Graph, x: gs.Tensor, shape: list, name: str, new: list) -> gs.Variable:
+    shape = gs.Constant(name=f"{name}_shape", values=np.array(shape, dtype=np.int64))
+    y = gs.Variable(name=name, dtype=x.dtype)
+    self.layer(op="Reshape", name=f"{name}_Reshape", inputs=[x, shape], outputs=[y])
+    new += [shape, y]
+    return y
+
+
+def _merge_heads(self: gs.Graph, x: gs.Tensor, name: str, new: list) -> gs.Tensor:
+    """
+    (batch, seq, heads, head_size) -> (batch, seq, hidden), (seq, heads, head_size) -> (1, seq, hidden).
+    A 4-D x split from (batch, seq, hidden) by a Reshape is replaced by the input of that Reshape.
+    """
+    if len(x.shape) == 3:
+        return _reshape(self, x, [1, -1, x.shape[1] * x.shape[2]], name, new)
+    producer = x.inputs[0] if len(x.inputs) == 1 else None
+    if producer is not None and producer.op == "Reshape" and _static(x.shape, (2, 3)):
+        source = producer.inputs[0]
+        if source.shape is not None and len(source.shape) == 3 and list(source.shape[:2]) == list(x.shape[:2]) \
+                and source.shape[2] == x.shape[2] * x.shape[3]:
+            return source
+    return _reshape(self, x, [0, 0, -1], name, new)
+
+
+def _transpose_k(self: gs.Graph, k: gs.Tensor, rank: int, name: str, new: list) -> gs.Variable:
+    """pre-transposed k (.., heads, head_size, seq) back to (.., seq, heads, head_size)"""
+    perm = _K_PERMS[rank]
+    k_seq = gs.Variable(name=name, dtype=k.dtype,
+                        shape=[k.shape[axis] for axis in perm] if k.shape is not None else None)
+    self.layer(op="Transpose", name=f"{name}_Transpose", inputs=[k], outputs=[k_seq], attrs={"perm": perm})
+    new.append(k_seq)
+    return k_seq
+
+
+def _attention_bias(self: gs.Graph, mask: gs.Tensor, name: str, new: list) -> gs.Tensor:
+    """the additive mask padded to the 4-D attention_bias (batch | 1, heads | 1, seq_q, seq_k)"""
+    axes = list(range(4 - len(mask.shape)))
+    if not axes:
+        return mask
+    if isinstance(mask, gs.Constant):
+        bias = gs.Constant(name=name, values=mask.values.reshape([1] * len(axes) + list(mask.shape)))
+        new.append(bias)
+        return bias
+    bias = gs.Variable(name=name, dtype=mask.dtype)
+    if self.opset >= 13:
+        axes = gs.Constant(name=f"{name}_axes", values=np.array(axes, dtype=np.int64))
+        self.layer(op="Unsqueeze", name=f"{name}_Unsqueeze", inputs=[mask, axes], outputs=[bias])
+        new.append(axes)
+    else:
+        self.layer(op="Unsqueeze", name=f"{name}_Unsqueeze", inputs=[mask], outputs=[bias], attrs={"axes": axes})
+    new.append(bias)
+    return bias
+
+
+def _emit_custom_attn(self: gs.Graph, match_result: MatchResult, tensors: TensorIndex,
+                      q, k, v, mask, output, new: list) -> Optional[gs.Node]:
+    """
+    tensorrt: CustomFFAttn, whose contract is the original 3-D form only: q / k / v (seq, heads, head_size),
+    q divided by a constant, no mask, static sequence lengths, and no attributes. Other forms are left as is.
+    """
+    attrs = match_result.attrs
+    seq_q, seq_k = match_result.inputs[3:5]
+    if attrs["rank"] != 3 or mask is not None or attrs["scale_form"] != ("q", "Div"):
+        logger.debug("CustomFFAttn only takes 3-D q / k / v with q divided by a constant and no mask.")
+        return None
+    if seq_q is None or seq_k is None:
+        logger.debug("CustomFFAttn needs static sequence lengths.")
+        return None
+    output_name = output.name
+    if attrs["k_transposed"]:
+        k = _transpose_k(self, k, attrs["rank"], f"{output_name}_k_seq", new)
+
+    seq_q_tensor = gs.Constant(name=output_name + "_seq_q_tensor", values=seq_q)
+    seq_k_tensor = gs.Constant(name=output_name + "_seq_k_tensor", values=seq_k)
+    new += [seq_q_tensor, seq_k_tensor]
+    return self.layer(op="CustomFFAttn",
+                      name=output_name + "_customattn",
+                      inputs=[q, k, v, seq_q_tensor, seq_k_tensor],
+                      outputs=[output])
+
+
+def _emit_multihead_attention(self: gs.Graph, match_result: MatchResult, tensors: TensorIndex,
+                              q, k, v, mask, output, new: list) -> Optional[gs.Node]:
+    """ort: com.microsoft MultiHeadAttention on (batch, seq, hidden) q / k / v, the mask as attention_bias"""
+    attrs = match_result.attrs
+    num_heads, rank = attrs["num_heads"], attrs["rank"]
+    k_shape = k.shape
+    if attrs["k_transposed"] and k_shape is not None and len(k_shape) == rank:
+        k_shape = [k_shape[axis] for axis in _K_PERMS[rank]]
+    if num_heads is None or not _static(v.shape, (rank - 1,)) \
+            or not all(_can_merge_heads(shape, rank) for shape in (q.shape, k_shape, v.shape)):
+        logger.debug("MultiHeadAttention needs a static number of heads and q / k / v of known shape.")
+        return None
+    if mask is not None:
+        # attention_bias 的最后两维必须就是 (seq_q, seq_k)，不能在序列维上广播
+        scores = tensors.get(match_result.matched_nodes[1].outputs[0]).shape
+        if mask.shape is None or not 2 <= len(mask.shape) <= 4 or scores is None \
+                or list(mask.shape[-2:]) != list(scores[-2:]) or any(dim is None for dim in scores[-2:]):
+            logger.debug(f"The mask {mask.name} does not have the (seq_q, seq_k) trailing dims of the scores.")
+            return None
+
+    output_name = output.name
+    if attrs["k_transposed"]:
+        k = _transpose_k(self, k, rank, f"{output_name}_k_seq", new)
+    merged = [_merge_heads(self, x, f"{output_name}_{kind}_3d", new) for kind, x in zip("qkv", (q, k, v))]
+    # 可选输入：bias, key_padding_mask, attention_bias
+    optional = [gs.Variable.empty(), gs.Variable.empty(), _attention_bias(self, mask, f"{output_name}_bias", new)] \
+        if mask is not None else []
+
+    attention = gs.Variable(name=f"{output_name}_mha", dtype=q.dtype)
+    node = self.layer(op="MultiHeadAttention", name=output_name + "_mha", domain="com.microsoft",
+                      inputs=merged + optional, outputs=[attention],
+                      attrs={"num_heads": num_heads, "scale": float(attrs["scale"])})
+    # back to the layout of the matched output: (batch, seq, heads, head_size) / (seq, heads, head_size)
+    split = [0, 0, num_heads, -1] if rank == 4 else [-1, num_heads, v.shape[-1]]
+    shape = gs.Constant(name=f"{output_name}_heads_shape", values=np.array(split, dtype=np.int64))
+    self.layer(op="Reshape", name=f"{output_name}_heads_Reshape", inputs=[attention, shape], outputs=[output])
+    new += [attention, shape]
+    return node
+
 
 @gs.Graph.register()
-def fuse_customattn(self, match_result : MatchResult):
+def fuse_customattn(self, match_result : MatchResult, tensors: Optional[TensorIndex] = None,
+                    target: str = "tensorrt"):
     """
-    Args: match_result
-    
+    Args: match_result: CustomAttnPattern 的匹配结果
+          tensors: tensor name -> gs.Tensor 索引，由 FusionExecutor 在整批融合中共享，为空时从图构建
+          target: tensorrt 生成 CustomFFAttn（只接受 3 维、q 除以常量、无 mask 的形式，要求静态序列长度），
+                  ort 生成 com.microsoft MultiHeadAttention（要求静态 head 数），onnx 没有对应的标准算子
+
     Returns:
-        返回融合后的新 LayerNorm 节点
-    """
-   # names from match
-    q_name = match_result.inputs[0]
-    k_name = match_result.inputs[1]
-    v_name = match_result.inputs[2]
-    seq_q_tensor = match_result.inputs[3]
-    seq_k_tensor = match_result.inputs[4]
-    output_name = match_result.outputs[0]
-
-    # fetch tensors from gs graph (gs_graph.tensors() maps names -> tensors)
-    tensors = self.tensors()
-    q = tensors.get(q_name)
-    k = tensors.get(k_name)
-    v = tensors.get(v_name)
-    
-    outputs = tensors.get(output_name)
-    
+        返回融合后的新 Attention 节点，目标算子不可用时返回 None（图不变）
+    """
+    emit = {"tensorrt": _emit_custom_attn, "ort": _emit_multihead_attention}.get(target)
+    if emit is None:
+        return None
+
+    # fetch tensors from the shared index (falls back to gs_graph.tensors())
+    if tensors is None:
+        tensors = TensorIndex.from_graph(self)
+    q, k, v = (tensors.get(name) for name in match_result.inputs[:3])
+    mask = tensors.get(match_result.inputs[5]) if match_result.inputs[5] is not None else None
+    outputs = tensors.get(match_result.outputs[0])
+
+    # 先检查并生成新节点，目标算子不可用时 emit 不改动图
+    new = []
+    node = emit(self, match_result, tensors, q, k, v, mask, outputs, new)
+    if node is None:
+        return None
+
     # tensor's output is node.
-    for outp in q.outputs[::]:
-        if outp.name in match_result.node_names:
-            q.outputs.remove(outp)
-            
-    for outp in k.outputs[::]:
-        if outp.name in match_result.node_names:
-            k.outputs.remove(outp)
-            
-    for outp in v.outputs[::]:
-        if outp.name in match_result.node_names:
-            v.outputs.remove(outp)
-    
+    for tensor in (q, k, v, mask):
+        for outp in tensor.outputs[::] if tensor is not None else ():
+            if outp.name in match_result.node_names:
+                tensor.outputs.remove(outp)
+
     for inp in outputs.inputs[::]:
         if inp.name in match_result.node_names:
             outputs.inputs.remove(inp)
-
-        
-    seq_q_tensor = gs.Constant(name= output_name + "_seq_q_tensor", values=seq_q_tensor)
-    seq_k_tensor = gs.Constant(name= output_name + "_seq_k_tensor", values=seq_k_tensor)
-     
-    customattn_node = self.layer(op="CustomFFAttn",
-                name=output_name + "_customattn",
-                inputs=[
-                    q, 
-                    k, 
-                    v, 
-                    seq_q_tensor, 
-                    seq_k_tensor
-                ],
-                outputs=[outputs],
-                )
-    return customattn_node
+    tensors.register(*new)
+    tensors.retire(match_result)
+    return node
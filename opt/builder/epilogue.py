@@ -0,0 +1,158 @@
+import logging
+import numpy as np
+import onnx_graphsurgeon as gs
+
+from onnx import defs, helper, shape_inference
+from onnx_graphsurgeon.exporters.onnx_exporter import dtype_to_onnx
+from onnx_graphsurgeon.ir.tensor import LazyValues
+from typing import Optional
+from ..pattern import MatchResult
+from ..utils import TensorIndex
+from ..onnx_helper import InitializerStore, ShapeInference
+from .linear_bn import channel_view, scale_channels
+from .activation import activation_op
+
+logger = logging.getLogger(__name__)
+
+# target -> linear op -> (fused op, domain, activations it can carry)
+_FUSED_OPS = {
+    # onnxruntime contrib ops; FusedGemm has no Clip
+    "ort": {"Conv": ("FusedConv", "com.microsoft", ("Relu", "Sigmoid", "Clip")),
+            "Gemm": ("FusedGemm", "com.microsoft", ("Relu", "Sigmoid"))},
+    # TensorRT plugins, the activation is an attribute of the plugin
+    "tensorrt": {"Conv": ("NvConvActPlugin", None, ("Relu", "Sigmoid", "Clip", "Silu")),
+                 "Gemm": ("NvGemmActPlugin", None, ("Relu", "Sigmoid", "Clip", "Silu"))},
+    # standard ops only: the activation stays a separate node (one op where fuse_activation has one)
+    "onnx": {},
+}
+
+
+def _linear_shape(op: str):
+    """shape function of a fused op: that of the standard `op`, the activation does not change it."""
+    def infer(node: gs.Node):
+        schema = defs.get_schema(op)
+        node_proto = helper.make_node(op, [t.name for t in node.inputs], [t.name for t in node.outputs],
+                                      **{k: v for k, v in node.attrs.items() if not k.startswith("activation")})
+        input_types = {t.name: helper.make_tensor_type_proto(dtype_to_onnx(t.dtype), t.shape)
+                       for t in node.inputs if not t.is_empty()}
+        types = shape_inference.infer_node_outputs(schema, node_proto, input_types)
+        return [ShapeInference._from_type_proto(types.get(t.name)) for t in node.outputs]
+    return infer
+
+
+for _target in _FUSED_OPS.values():
+    for _op, (_fused_op, _, _) in _target.items():
+        ShapeInference.register(_fused_op)(_linear_shape(_op))
+
+
+def _emit_activation(self: gs.Graph, activation: str, params: list, x: gs.Tensor, y: gs.Tensor, prefix: str,
+                     target: str):
+    """activation as a separate node (or nodes): x -> y"""
+    single = activation_op(self, activation, target)
+    if single is not None:
+        op, domain, attrs = single
+        self.layer(op=op, name=f"{prefix}_{activation}", domain=domain, inputs=[x], outputs=[y], attrs=attrs)
+    elif activation == "Silu":
+        sigmoid = gs.Variable(name=f"{prefix}_sigmoid", dtype=x.dtype)
+        self.layer(op="Sigmoid", name=f"{prefix}_Sigmoid", inputs=[x], outputs=[sigmoid])
+        self.layer(op="Mul", name=f"{prefix}_Mul", inputs=[x, sigmoid], outputs=[y])
+    elif activation == "Clip" and self.opset >= 11:
+        bounds = [gs.Constant(name=f"{prefix}_clip_{bound}", values=np.array(value, dtype=x.dtype))
+                  for bound, value in zip(("min", "max"), params)]
+        self.layer(op="Clip", name=f"{prefix}_Clip", inputs=[x] + bounds, outputs=[y])
+    elif activation == "Clip":
+        self.layer(op="Clip", name=f"{prefix}_Clip", inputs=[x], outputs=[y],
+                   attrs={"min": params[0], "max": params[1]})
+    else:
+        self.layer(op=activation, name=f"{prefix}_{activation}", inputs=[x], outputs=[y])
+
+
+@gs.Graph.register()
+def fuse_linear_epilogue(self, match_result: MatchResult, tensors: Optional[TensorIndex] = None,
+                         target: str = "tensorrt"):
+    """
+    Args:
+        match_result: Conv / Gemm + 常量 Add/Sub/Mul/Div + 激活的匹配结果（LinearEpiloguePattern）
+        tensors: tensor name -> gs.Tensor 索引，由 FusionExecutor 在整批融合中共享，为空时从图构建
+        target: tensorrt 生成带 activation 属性的插件，ort 生成 com.microsoft FusedConv/FusedGemm，
+                onnx 只用标准算子；目标不支持的激活保留为单独的节点（SiLU 尽量用 fuse_activation 的单个算子）
+    Returns:
+        返回融合后的新节点；没有可折叠的常量、激活也无法合并或替换时返回 None（图不变）
+    """
+    op = match_result.attrs["op"]
+    epilogue = match_result.attrs["epilogue"]
+    activation = match_result.attrs["activation"]
+    params = match_result.attrs["activation_params"]
+    fused_op, domain, activations = _FUSED_OPS[target].get(op, (op, None, ()))
+    attached = activation in activations
+    if not epilogue and not attached and activation_op(self, activation, target) is None:
+        return None
+
+    if tensors is None:
+        tensors = TensorIndex.from_graph(self)
+    linear_node = match_result.matched_nodes[0]
+    x_name, weight_name, bias_name = match_result.inputs[:3]
+    x = tensors.get(x_name)
+    weight_tensor = tensors.get(weight_name)
+    bias_tensor = tensors.get(bias_name) if bias_name else None
+    output = tensors.get(match_result.outputs[0])
+
+    weight = InitializerStore.decode(weight_tensor)
+    attrs = dict(linear_node.attrs)
+    channels = weight.shape[0] if op == "Conv" or attrs.get("transB", 0) else weight.shape[1]
+    if bias_tensor is None:
+        bias = np.zeros(channels, dtype=np.float64)
+    else:
+        bias = InitializerStore.decode(bias_tensor).astype(np.float64)
+        bias = np.broadcast_to(bias.reshape(-1) * attrs.get("beta", 1.0), (channels,)) if op == "Gemm" else bias
+
+    # 逐个应用 epilogue：y = s * (W x + B) + t，常量为标量或按通道的向量
+    s = np.ones(channels, dtype=np.float64)
+    t = np.zeros(channels, dtype=np.float64)
+    for kind, name in zip(epilogue, match_result.inputs[3:]):
+        c = np.broadcast_to(InitializerStore.decode(tensors.get(name)).astype(np.float64).reshape(-1), (channels,))
+        if kind == "Add":
+            t = t + c
+        elif kind == "Sub":
+            t = t - c
+        elif kind == "Mul":
+            s, t = s * c, t * c
+        else:
+            s, t = s / c, t / c
+
+    for outp in x.outputs[::]:
+        if outp.name in match_result.node_names:
+            x.outputs.remove(outp)
+    for inp in output.inputs[::]:
+        if inp.name in match_result.node_names:
+            output.inputs.remove(inp)
+
+    # 只有加减时权重不变，直接复用原来的常量
+    if np.all(s == 1):
+        fused_weight = weight_tensor
+    else:
+        view, scale_shape = channel_view(op, weight.shape, attrs, channels)
+        in_place = len(weight_tensor.outputs) == 1 and not isinstance(weight_tensor._values, LazyValues)
+        fused_weight = gs.Constant(name=f"{linear_node.name}_weight_fused",
+                                   values=scale_channels(weight, s, view, scale_shape, in_place=in_place))
+    fused_bias = gs.Constant(name=f"{linear_node.name}_bias_fused", values=(bias * s + t).astype(weight.dtype))
+    if op == "Gemm":
+        attrs["beta"] = 1.0
+
+    name = f"{linear_node.name}_fused"
+    if attached:
+        attrs["activation"] = activation
+        if activation == "Clip":
+            attrs["activation_params"] = [float(value) for value in params]
+        linear_output = output
+    else:
+        fused_op, domain = op, None
+        linear_output = output if activation is None else gs.Variable(name=f"{name}_out", dtype=weight.dtype)
+    fused_node = self.layer(op=fused_op, name=name, domain=domain, inputs=[x, fused_weight, fused_bias],
+                            outputs=[linear_output], attrs=attrs)
+    if linear_output is not output:
+        _emit_activation(self, activation, params, linear_output, output, name, target)
+    tensors.register(fused_weight, fused_bias)
+    tensors.retire(match_result)
+
+    return fused_node
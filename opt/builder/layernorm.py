@@ -1,37 +1,114 @@
+import logging
 import numpy as np
 import onnx_graphsurgeon as gs
 
+from typing import Optional
 from ..pattern import MatchResult
+from ..utils import TensorIndex
+from ..onnx_helper import ShapeInference
 
-@gs.Graph.register()
-def fuse_layernorm(self, match_result : MatchResult):
+logger = logging.getLogger(__name__)
+
+# norm -> target -> (op, minimum opset); the plugins take epsilon as a constant input, the others as attributes
+_NORM_OPS = {
+    # onnxruntime also runs LayerNormalization below opset 17 (its own schema in the onnx domain)
+    "LayerNorm": {"tensorrt": ("NvLayerNormPlugin", 1), "ort": ("LayerNormalization", 1),
+                  "onnx": ("LayerNormalization", 17)},
+    # onnxruntime registers SimplifiedLayerNormalization in the onnx domain, not in com.microsoft
+    "RMSNorm": {"tensorrt": ("NvRMSNormPlugin", 1), "ort": ("SimplifiedLayerNormalization", 1),
+                "onnx": ("RMSNormalization", 23)},
+}
+_PLUGINS = ("NvLayerNormPlugin", "NvRMSNormPlugin")
+
+
+@ShapeInference.register("NvLayerNormPlugin")
+def layernorm_plugin_shape(node: gs.Node):
+    """inputs: x, scale, bias, epsilon; the output has the type of x"""
+    x = node.inputs[0]
+    return [(x.dtype, x.shape)]
+
+
+@ShapeInference.register("NvRMSNormPlugin")
+def rmsnorm_plugin_shape(node: gs.Node):
+    """inputs: x, scale, epsilon; the output has the type of x"""
+    x = node.inputs[0]
+    return [(x.dtype, x.shape)]
+
+
+@ShapeInference.register("SimplifiedLayerNormalization")
+def simplified_layernorm_shape(node: gs.Node):
+    """onnxruntime op without onnx schema; the (first) output has the type of x"""
+    x = node.inputs[0]
+    return [(x.dtype, x.shape)] + [None] * (len(node.outputs) - 1)
+
+
+def _emit_norm(self: gs.Graph, norm: str, target: str, match_result: MatchResult, tensors: TensorIndex,
+               params: list) -> Optional[gs.Node]:
     """
-    Args: match_result
-    
-    Returns:
-        返回融合后的新 LayerNorm 节点
+    把匹配的子图替换为 norm 的单个算子，params 为 scale（和 bias）数组。
+    图的 opset 低于标准算子要求的版本时返回 None（图不变）
     """
-   # names from match
+    op, min_opset = _NORM_OPS[norm][target]
+    if self.opset < min_opset:
+        logger.debug(f"{op} needs opset {min_opset}, the graph has opset {self.opset}.")
+        return None
+
     input_name = match_result.inputs[0]
-    scale = match_result.inputs[1]
-    bias = match_result.inputs[2]
     output_name = match_result.outputs[0]
     attrs = match_result.attrs
-
-    # fetch tensors from gs graph (gs_graph.tensors() maps names -> tensors)
-    tensors = self.tensors()
     inputs = tensors.get(input_name)
     outputs = tensors.get(output_name)
-    
+
     # tensor's output is node.
     for outp in inputs.outputs[::]:
         if outp.name in match_result.node_names:
             inputs.outputs.remove(outp)
-    
+
     for inp in outputs.inputs[::]:
         if inp.name in match_result.node_names:
             outputs.inputs.remove(inp)
-    
+
+    # 标准算子要求 scale / bias 和输入类型一致，插件使用 float32
+    dtype = inputs.dtype if op not in _PLUGINS and inputs.dtype is not None else np.float32
+    # 按融合后的节点命名：读同一输入的多个 norm 各自有自己的常量
+    constants = [gs.Constant(name=f"{output_name}_{norm}_{kind}", values=np.asarray(value, dtype=dtype))
+                 for kind, value in zip(("scale", "bias"), params)]
+    if op in _PLUGINS:
+        eps = gs.Constant(name=f"{output_name}_{norm}_eps", values=np.array(attrs["epsilon"], dtype=np.float32))
+        node = self.layer(op=op,
+                          name=output_name + "_" + norm,
+                          inputs=[inputs] + constants + [eps],
+                          outputs=[outputs])
+        constants.append(eps)
+    else:
+        node = self.layer(op=op,
+                          name=output_name + "_" + norm,
+                          inputs=[inputs] + constants,
+                          outputs=[outputs],
+                          attrs={"epsilon": float(attrs["epsilon"]), "axis": attrs["axis"]})
+    tensors.register(*constants)
+    tensors.retire(match_result)
+    return node
+
+
+@gs.Graph.register()
+def fuse_layernorm(self, match_result : MatchResult, tensors: Optional[TensorIndex] = None,
+                   target: str = "tensorrt"):
+    """
+    Args: match_result
+          tensors: tensor name -> gs.Tensor 索引，由 FusionExecutor 在整批融合中共享，为空时从图构建
+          target: tensorrt 生成 NvLayerNormPlugin，ort / onnx 生成 LayerNormalization（onnx 要求 opset 17）
+
+    Returns:
+        返回融合后的新 LayerNorm 节点，目标算子不可用时返回 None（图不变）
+    """
+    scale = match_result.inputs[1]
+    bias = match_result.inputs[2]
+
+    # fetch tensors from the shared index (falls back to gs_graph.tensors())
+    if tensors is None:
+        tensors = TensorIndex.from_graph(self)
+
     # If scale/bias are not present, create neutral scale=1 and bias=0 of appropriate shape
     # We attempt to infer last dimension from an existing initializer or from input shape if available.
     if scale is None:
@@ -39,23 +116,22 @@ def fuse_layernorm(self, match_result : MatchResult):
         scale = np.array(1.0, dtype=np.float32)
     if bias is None:
         bias = np.array(0.0, dtype=np.float32)
-        
-    scale = gs.Constant(name= input_name + "_ln_scale", values=scale)
-    bias = gs.Constant(name= input_name + "_ln_bias", values=bias)
-    
-    # create LayerNormalization node. If your target runtime doesn't have "LayerNormalization",
-    # you can instead create the classic subgraph. Here we show the single op case:
-    if False:
-        ln_node = self.layer(op="LayerNormalization",
-                            name=output_name + "_LayerNorm",
-                            inputs=[inputs, scale, bias],
-                            outputs=[outputs],
-                            attrs=attrs)
-    else:
-        eps = gs.Constant(name= input_name + "_ln_eps", values=np.array(attrs["epsilon"], dtype=np.float32))
-        ln_node = self.layer(op="NvLayerNormPlugin",
-                    name=output_name + "_LayerNorm",
-                    inputs=[inputs, scale, bias, eps],
-                    outputs=[outputs],
-                    )
-    return ln_node
+
+    return _emit_norm(self, "LayerNorm", target, match_result, tensors, [scale, bias])
+
+
+@gs.Graph.register()
+def fuse_rmsnorm(self, match_result: MatchResult, tensors: Optional[TensorIndex] = None,
+                 target: str = "tensorrt"):
+    """
+    Args: match_result: RMSNormPattern 的匹配结果，inputs 为输入名和 scale 数组
+          tensors: tensor name -> gs.Tensor 索引，由 FusionExecutor 在整批融合中共享，为空时从图构建
+          target: tensorrt 生成 NvRMSNormPlugin，ort 生成 SimplifiedLayerNormalization，
+                  onnx 生成 RMSNormalization（要求 opset 23）
+
+    Returns:
+        返回融合后的新 RMSNorm 节点，目标算子不可用时返回 None（图不变）
+    """
+    if tensors is None:
+        tensors = TensorIndex.from_graph(self)
+    return _emit_norm(self, "RMSNorm", target, match_result, tensors, [match_result.inputs[1]])
@@ -0,0 +1,175 @@
+import logging
+import numpy as np
+import onnx_graphsurgeon as gs
+
+from onnx import helper
+from onnx_graphsurgeon.ir.tensor import LazyValues
+from typing import Optional, Tuple
+from ..pattern import MatchResult
+from ..utils import TensorIndex
+from ..onnx_helper import InitializerStore
+
+logger = logging.getLogger(__name__)
+
+
+def channel_view(op: str, weight_shape: Tuple[int, ...], attrs: dict, channels: int):
+    """
+    把权重 reshape 成 [..., C_out 所在维, ...] 的视图形状，以及按输出通道的缩放系数的广播形状
+    """
+    if op == "Conv":
+        # [C_out, C_in/groups, k...]
+        return weight_shape, (channels,) + (1,) * (len(weight_shape) - 1)
+    if op == "ConvTranspose":
+        # [C_in, C_out/groups, k...] -> [groups, C_in/groups, C_out/groups, k...]
+        groups = attrs.get("group", 1)
+        view = (groups, weight_shape[0] // groups, weight_shape[1]) + tuple(weight_shape[2:])
+        return view, (groups, 1, weight_shape[1]) + (1,) * (len(weight_shape) - 2)
+    if op == "Gemm" and attrs.get("transB", 0):
+        # [N, K]
+        return weight_shape, (channels, 1)
+    # Gemm / MatMul: [K, N]
+    return weight_shape, (1, channels)
+
+
+def scale_channels(weight: np.ndarray, scale: np.ndarray, view: Tuple[int, ...], scale_shape: Tuple[int, ...],
+                   in_place: bool = False) -> np.ndarray:
+    """
+    weight 按输出通道乘以 scale，只分配一个结果数组；in_place 且 weight 可写时直接原地修改。
+    float16 等低精度权重先在 float32 中计算再转回，避免精度损失。
+    """
+    if weight.dtype in (np.float32, np.float64):
+        out = weight if in_place and weight.flags.writeable and weight.flags.c_contiguous else np.empty_like(weight)
+        np.multiply(weight.reshape(view), scale.astype(weight.dtype).reshape(scale_shape), out=out.reshape(view))
+        return out
+    result = weight.astype(np.float32).reshape(view)
+    result *= scale.astype(np.float32).reshape(scale_shape)
+    return result.reshape(weight.shape).astype(weight.dtype)
+
+
+def _reference_check(self: gs.Graph, x: gs.Tensor, op: str, attrs: dict, original: list, epsilon: float,
+                     folded_op: str, folded_attrs: dict, folded: list) -> Optional[bool]:
+    """
+    用 onnxruntime 分别运行原始的 linear + BN 和折叠后的 linear，比较输出（符号维度取 1）。
+    original: weight, bias (可为 None), BN scale, bias, mean, var；folded: weight, bias
+    输入形状未知或没有安装 onnxruntime 时返回 None。
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        logger.warning("onnxruntime is not installed, BN folding is not verified.")
+        return None
+    if x.shape is None or x.dtype is None:
+        return None
+    shape = [dim if isinstance(dim, int) and dim > 0 else 1 for dim in x.shape]
+    dtype = np.dtype(x.dtype)
+    elem_type = helper.np_dtype_to_tensor_dtype(dtype)
+    opset = [helper.make_opsetid("", self.opset)]
+
+    def run(nodes, initializers):
+        graph = helper.make_graph(nodes, "bn_check", [helper.make_tensor_value_info("x", elem_type, shape)],
+                                  [helper.make_tensor_value_info("y", elem_type, None)],
+                                  initializer=[helper.make_tensor(name, helper.np_dtype_to_tensor_dtype(value.dtype),
+                                                                  value.shape, value.tobytes(), raw=True)
+                                               for name, value in initializers.items()])
+        model = helper.make_model(graph, opset_imports=opset, ir_version=helper.find_min_ir_version_for(opset))
+        session = ort.InferenceSession(model.SerializeToString(), providers=["CPUExecutionProvider"])
+        return session.run(None, {"x": probe})[0]
+
+    probe = np.random.default_rng(0).standard_normal(shape).astype(dtype)
+    linear_inputs = ["x", "w"] + (["b"] if original[1] is not None else [])
+    try:
+        reference = run([helper.make_node(op, linear_inputs, ["t"], **attrs),
+                         helper.make_node("BatchNormalization", ["t", "scale", "bias", "mean", "var"], ["y"],
+                                          epsilon=epsilon)],
+                        {name: value for name, value in zip(("w", "b", "scale", "bias", "mean", "var"), original)
+                         if value is not None})
+        result = run([helper.make_node(folded_op, ["x", "w", "b"], ["y"], **folded_attrs)],
+                     {"w": folded[0], "b": folded[1]})
+    except Exception as e:
+        logger.warning(f"BN folding could not be verified: {e}")
+        return None
+    tolerance = 1e-2 if dtype == np.float16 else 1e-4
+    return bool(np.allclose(result, reference, rtol=tolerance, atol=tolerance * max(1.0, float(np.abs(reference).max()))))
+
+
+@gs.Graph.register()
+def fuse_linear_bn(self, match_result: MatchResult, tensors: Optional[TensorIndex] = None, verify: bool = False):
+    """
+    Args:
+        match_result: Conv / ConvTranspose / Gemm / MatMul + BatchNormalization 的匹配结果（LinearBNPattern）
+        tensors: tensor name -> gs.Tensor 索引，由 FusionExecutor 在整批融合中共享，为空时从图构建
+        verify: 用 onnxruntime 对比折叠前后的输出，不一致时不融合
+    Returns:
+        返回融合后的新节点，校验失败时返回 None（图不变）
+    """
+    if tensors is None:
+        tensors = TensorIndex.from_graph(self)
+
+    linear_node, bn_node = match_result.matched_nodes
+    op = match_result.attrs["op"]
+    epsilon = match_result.attrs["epsilon"]
+    x_name, weight_name, bias_name = match_result.inputs[:3]
+    x = tensors.get(x_name)
+    weight_tensor = tensors.get(weight_name)
+    bias_tensor = tensors.get(bias_name) if bias_name else None
+    bn_output = tensors.get(match_result.outputs[0])
+
+    # BN: y = (x - mean) / sqrt(var + eps) * scale + bias = x * s + shift，按通道向量化计算
+    scale, bn_bias, mean, var = (InitializerStore.decode(tensors.get(name)).astype(np.float64)
+                                 for name in match_result.inputs[3:7])
+    s = scale / np.sqrt(var + epsilon)
+    shift = bn_bias - mean * s
+
+    weight = InitializerStore.decode(weight_tensor)
+    attrs = dict(linear_node.attrs)
+    view, scale_shape = channel_view(op, weight.shape, attrs, s.shape[0])
+    if bias_tensor is None:
+        bias = np.zeros(s.shape[0], dtype=np.float64)
+    else:
+        bias = InitializerStore.decode(bias_tensor).astype(np.float64)
+        if op == "Gemm":
+            bias = np.broadcast_to(bias.reshape(-1) * attrs.get("beta", 1.0), s.shape)
+
+    # 只有当前节点使用、且数组可写时原地修改权重，否则只分配一个新数组；校验时需要保留原始权重
+    in_place = not verify and len(weight_tensor.outputs) == 1 and not isinstance(weight_tensor._values, LazyValues)
+    folded_weight = scale_channels(weight, s, view, scale_shape, in_place=in_place)
+    folded_bias = (bias * s + shift).astype(weight.dtype)
+
+    folded_op = "Gemm" if op == "MatMul" else op
+    folded_attrs = attrs
+    if op == "Gemm":
+        folded_attrs = dict(attrs, beta=1.0)
+    elif op == "MatMul":
+        folded_attrs = {}
+
+    if verify:
+        original = [weight, InitializerStore.decode(bias_tensor) if bias_tensor is not None else None]
+        original += [InitializerStore.decode(tensors.get(name)) for name in match_result.inputs[3:7]]
+        equivalent = _reference_check(self, x, op, attrs, original, epsilon,
+                                      folded_op, folded_attrs, [folded_weight, folded_bias])
+        if equivalent is False:
+            logger.error(f"Folding {bn_node.name} into {linear_node.name} changes the output, skipped.")
+            return None
+
+    for outp in x.outputs[::]:
+        if outp.name in match_result.node_names:
+            x.outputs.remove(outp)
+    for inp in bn_output.inputs[::]:
+        if inp.name in match_result.node_names:
+            bn_output.inputs.remove(inp)
+
+    # 按节点命名：共享同一权重 / bias 的多个节点各自折叠出不同的常量
+    fused_weight = gs.Constant(name=f"{linear_node.name}_weight_fused", values=folded_weight)
+    fused_bias = gs.Constant(name=f"{linear_node.name}_bias_fused", values=folded_bias)
+
+    fused_node = self.layer(
+        op=folded_op,
+        inputs=[x, fused_weight, fused_bias],
+        outputs=[bn_output],
+        attrs=folded_attrs,
+        name=f"{linear_node.name}_fused"
+    )
+    tensors.register(fused_weight, fused_bias)
+    tensors.retire(match_result)
+
+    return fused_node
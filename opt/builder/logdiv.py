@@ -1,11 +1,14 @@
 import numpy as np
 import onnx_graphsurgeon as gs
 
+from typing import Optional
 from ..pattern import MatchResult
+from ..utils import TensorIndex
 
 @gs.Graph.register()
-def replace_log_div(self, match_result : MatchResult): 
-    tensors = self.tensors()
+def replace_log_div(self, match_result : MatchResult, tensors: Optional[TensorIndex] = None): 
+    if tensors is None:
+        tensors = TensorIndex.from_graph(self)
     
     div_node, log_node = match_result.matched_nodes  
     div_input_0, div_input_1 = match_result.inputs
@@ -49,5 +52,7 @@ def replace_log_div(self, match_result : MatchResult):
         outputs=[log_output], 
         name=f"{div_node.name}"
     )
+    tensors.retire(match_result)
+    tensors.register(log_0_output, log_1_output)
 
     return log_node_0, log_node_1, div_node
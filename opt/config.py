@@ -1,11 +1,33 @@
 from dataclasses import dataclass, field
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+
+# 融合算子的目标后端：tensorrt 插件，ort 为 onnxruntime 的 com.microsoft contrib 算子，onnx 只用标准算子
+TARGETS = ("tensorrt", "ort", "onnx")
 
 @dataclass
 class Config:
     allow_overlap: bool = False  # 是否允许重叠匹配
+    overlap_resolution: str = "optimal"  # 重叠匹配的取舍：optimal 收集全部候选后选总收益最大的不重叠集合，greedy 按拓扑序先到先得
     log_level: int = field(default=20)  # logging.INFO
     visualize: bool = False       # 是否可视化匹配结果
+    batch_fusion: bool = True     # 批量融合：所有匹配融合完成后只做一次 cleanup/toposort
+    validate_every: int = 0       # 调试用：批量融合时每 N 次融合校验一次图，0 表示不校验
+    match_memo: bool = False      # 按局部结构哈希缓存匹配结果，重复的 block 不再重复遍历
+    profile_matching: bool = False  # 统计每个 pattern 的匹配次数、命中、耗时（累计/p99）和拒绝阶段
+    match_workers: int = 1        # 大图并行匹配的进程数，1 表示单进程，0 表示使用全部 CPU
+    target: str = "tensorrt"      # 融合生成的算子形式，见 TARGETS
+    verify_folding: bool = False  # 用 onnxruntime 校验 BN 折叠前后的输出一致，不一致的不融合
+    fixpoint: bool = False        # 不动点优化：反复匹配/融合，直到没有新的匹配
+    max_iterations: int = 10      # 不动点优化的最大轮数
+    passes: Optional[List[str]] = None  # 按顺序执行的 pass 名称，None 表示所有默认启用的 pass（按注册顺序）
+    disabled_passes: List[str] = field(default_factory=list)  # 从流水线中去掉的 pass
+    constant_folding_max_size: int = 1 << 20  # 常量折叠结果的最大字节数，超过的不折叠（不会生成大张量）
+    constant_folding_dry_run: bool = False    # 只输出会被折叠的节点报告，不修改图
+    infer_shapes: bool = True     # 加载时推导 value_info 中缺失的形状（支持符号维度），融合新增的节点增量推导
+    mmap_external_data: bool = True    # 加载时不读取 external data，而是内存映射
+    external_data: bool = False        # 保存时将大于阈值的 initializer 写入 external data 文件
+    external_data_threshold: int = 1024  # 写入 external data 的最小字节数
+    external_data_shard_size: Optional[int] = None  # 每个 external data 分片的最大字节数，None 表示单文件
 
     def update(self, **kwargs: Any):
         for key, value in kwargs.items():
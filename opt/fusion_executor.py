@@ -1,61 +1,170 @@
 import onnx
+import time
 import logging
 import numpy as np
 import onnx_graphsurgeon as gs
 
-from typing import List, Optional
+from typing import List, Optional, Set
 from onnx import helper
 from onnx.helper import make_node
 from .onnx_helper import ONNXGraph, ONNXNode 
 from .graph_matcher import MatchResult
 from .builder import *
+from .utils import TensorIndex
+from .config import TARGETS
 
 logger = logging.getLogger(__name__)
 
 class FusionExecutor:
-    def __init__(self, graph: gs.Graph = None):
+    def __init__(self, graph: gs.Graph = None, batched: bool = True, validate_every: int = 0,
+                 verify_folding: bool = False, target: str = "tensorrt"):
         self.graph = graph  
-        self.gs_fusion = False
+        # batched: apply all matches, then cleanup/toposort once
+        # validate_every: debugging aid, validate the graph every N fusions in batched mode (0 = never)
+        self.batched = batched
+        self.validate_every = validate_every
+        # verify_folding: check folded weights against the unfused subgraph with onnxruntime
+        self.verify_folding = verify_folding
+        # target: form of the fused ops (plugins, onnxruntime contrib ops or standard ops), see config.TARGETS
+        if target not in TARGETS:
+            raise ValueError(f"Unknown target '{target}', expected one of {', '.join(TARGETS)}")
+        self.target = target
+        self.fusion_time = 0.0
+        self.cleanup_time = 0.0
+        self.num_fused = 0
+        # tensor name -> gs.Tensor, shared by all builders during execute_all
+        self.tensor_index: Optional[TensorIndex] = None
 
     def set_graph(self, graph: gs.Graph):
         self.graph = graph
+        self.tensor_index = None
         
     def get_graph(self) -> gs.Graph:
         return self.graph 
 
-    def execute(self, match_result: MatchResult) -> bool:
-        if not self.graph:
-            logger.error("No graph set for fusion.")
-            return False 
+    def _apply(self, match_result: MatchResult) -> Optional[bool]:
+        """True if the fusion was applied, False if it failed, None if it has nothing to do on this target."""
         pattern_name = match_result.pattern.name
         logger.debug(f"Executing fusion for pattern '{pattern_name}'") 
-        if pattern_name == "ConvTransBNPattern":
-            self.graph.fuse_convtrans_bn(match_result) 
-        elif pattern_name == "LayerNormPattern":
-            self.graph.fuse_layernorm(match_result)
+        if pattern_name in ("ConvBNPattern", "ConvTransBNPattern", "GemmBNPattern", "MatMulBNPattern"):
+            fused = self.graph.fuse_linear_bn(match_result, tensors=self.tensor_index, verify=self.verify_folding)
+            if fused is None:
+                return False
+        elif pattern_name in ("ConvEpiloguePattern", "GemmEpiloguePattern"):
+            fused = self.graph.fuse_linear_epilogue(match_result, tensors=self.tensor_index, target=self.target)
+            if fused is None:
+                logger.debug(f"Nothing to fuse for {match_result} on target {self.target}")
+                return None
+        elif pattern_name in ("GeluPattern", "GeluTanhPattern", "FastGeluPattern", "SiluPattern"):
+            fused = self.graph.fuse_activation(match_result, tensors=self.tensor_index, target=self.target)
+            if fused is None:
+                logger.debug(f"Nothing to fuse for {match_result} on target {self.target}")
+                return None
+        elif pattern_name in ("LayerNormPattern", "RMSNormPattern"):
+            fuse = self.graph.fuse_layernorm if pattern_name == "LayerNormPattern" else self.graph.fuse_rmsnorm
+            if fuse(match_result, tensors=self.tensor_index, target=self.target) is None:
+                logger.debug(f"Nothing to fuse for {match_result} on target {self.target}")
+                return None
         elif pattern_name == "CustomAttnPattern":
-            self.graph.fuse_customattn(match_result)
+            if self.graph.fuse_customattn(match_result, tensors=self.tensor_index, target=self.target) is None:
+                logger.debug(f"Nothing to fuse for {match_result} on target {self.target}")
+                return None
         elif pattern_name == "LogDivPattern":
-            self.graph.replace_log_div(match_result)
+            self.graph.replace_log_div(match_result, tensors=self.tensor_index)
         else:
             logger.warning(f"No fusion handler for pattern '{pattern_name}'")
             return False
+        return True
+
+    def _commit(self):
+        start = time.perf_counter()
         self.graph.cleanup().toposort()
-        self.gs_fusion = True
+        self.cleanup_time += time.perf_counter() - start
+
+    def execute(self, match_result: MatchResult) -> Optional[bool]:
+        if not self.graph:
+            logger.error("No graph set for fusion.")
+            return False 
+        start = time.perf_counter()
+        applied = self._apply(match_result)
+        self.fusion_time += time.perf_counter() - start
+        if not applied:
+            return applied
+        self._commit()
         
         return True  
 
+    def validate(self) -> bool:
+        """
+            Commit pending fusions and check the graph is still well formed:
+            toposort must succeed and every tensor must have at most one producer.
+        """
+        try:
+            self._commit()
+        except Exception as e:
+            logger.error(f"Graph validation failed during cleanup/toposort: {e}")
+            return False
+        valid = True
+        for name, tensor in self.graph.tensors().items():
+            if len(tensor.inputs) > 1:
+                logger.error(f"Graph validation failed: tensor '{name}' has {len(tensor.inputs)} producers.")
+                valid = False
+        return valid
+
     def execute_all(self, match_results: List[MatchResult]) -> bool:
+        if not self.graph:
+            logger.error("No graph set for fusion.")
+            return False 
+        self.fusion_time = 0.0
+        self.cleanup_time = 0.0
+        self.num_fused = 0
+        # cleanup only drops tensors that no pending match refers to, so one index serves the whole batch
+        self.tensor_index = TensorIndex.from_graph(self.graph)
+        try:
+            return self._execute_all(match_results)
+        finally:
+            self.tensor_index = None
+
+    def _execute_all(self, match_results: List[MatchResult]) -> bool:
         all_success = True
+        if not self.batched:
+            for match in match_results:
+                applied = self.execute(match)
+                if applied:
+                    self.num_fused += 1
+                elif applied is False:
+                    all_success = False
+            self._log_timing(self.num_fused)
+            return all_success
+
+        # batched mode: fusions only rewire the matched subgraphs, dead nodes are
+        # dropped by a single cleanup/toposort at the end
+        fused_node_names: Set[str] = set()
+        num_fused = 0
         for match in match_results:
-            if not self.execute(match):
+            if match.node_names & fused_node_names:
+                logger.warning(f"Skipping match {match}: it overlaps an already fused match.")
                 all_success = False
+                continue
+            start = time.perf_counter()
+            applied = self._apply(match)
+            self.fusion_time += time.perf_counter() - start
+            if not applied:
+                if applied is False:
+                    all_success = False
+                continue
+            fused_node_names |= match.node_names
+            num_fused += 1
+            if self.validate_every > 0 and num_fused % self.validate_every == 0:
+                if not self.validate():
+                    logger.error(f"Graph is invalid after fusing {match}.")
+                    all_success = False
+        if num_fused:
+            self._commit()
+        self.num_fused = num_fused
+        self._log_timing(num_fused)
         return all_success
-    
-    def get_gs_model_proto(self) -> onnx.ModelProto:
-        '''
-            only return when gs fusion finished.
-        '''
-        self.onnx_model_proto = gs.export_onnx(self.graph) if self.gs_fusion else None
-        return self.onnx_model_proto
-    
\ No newline at end of file
+
+    def _log_timing(self, num_fused: int):
+        logger.info(f"Applied {num_fused} fusions: fusion {self.fusion_time:.3f}s, "
+                    f"cleanup/toposort {self.cleanup_time:.3f}s")
@@ -1,7 +1,12 @@
+import os
 import logging
-from typing import List, Optional, Set, Dict, Any
+from typing import Iterable, List, Optional, Dict, Any, Tuple
 from .onnx_helper import ONNXGraph, ONNXNode 
 from .pattern import Pattern, MatchResult
+from .match_memo import MatchMemo
+from .match_profile import MatchProfile
+from .parallel_matcher import ParallelMatch
+from .overlap_resolver import OverlapResolver
 
 
 logger = logging.getLogger(__name__)
@@ -9,12 +14,39 @@ logger = logging.getLogger(__name__)
 
 
 class GraphMatcher:
-    def __init__(self, graph: Optional[ONNXGraph] = None):
+    # below this many candidate nodes, starting a process pool costs more than it saves
+    PARALLEL_MIN_NODES = 5000
+
+    def __init__(self, graph: Optional[ONNXGraph] = None, memoize: bool = False, profile: bool = False,
+                 workers: int = 1, overlap_resolution: str = "optimal"):
         self.graph = graph
+        # overlap_resolution: how overlapping matches are chosen without allow_overlap,
+        #   "optimal": collect all candidates, keep the non-overlapping set of maximum benefit (OverlapResolver)
+        #   "greedy": first match in topological order wins
+        if overlap_resolution not in ("optimal", "greedy"):
+            raise ValueError(f"Unknown overlap resolution: {overlap_resolution}")
+        self.resolver: Optional[OverlapResolver] = OverlapResolver() if overlap_resolution == "optimal" else None
+        # workers: processes for the pattern search of large graphs (see ParallelMatch), 0 = all CPUs
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        # memoize: reuse match decisions at structurally identical neighborhoods (repeated blocks)
+        self.memo: Optional[MatchMemo] = MatchMemo() if memoize else None
+        # profile: per-pattern attempts / hits / timing / rejection stage, accumulated over match_all calls
+        self.profile: Optional[MatchProfile] = MatchProfile() if profile else None
+        if self.workers > 1 and (memoize or profile):
+            # 并行搜索时 worker 只回传匹配结果，memo / profile 不可用
+            logger.warning(f"Match memo and profiling are not used on graphs of {self.PARALLEL_MIN_NODES} nodes "
+                           f"or more, whose search runs in {self.workers} worker processes.")
         self.match_results: List[MatchResult] = []
+        self.num_candidates = 0  # nodes visited by the last match_all
+        self.num_attempts = 0    # pattern.match calls of the last match_all
+        self.num_matches = 0     # candidate matches found by the last match_all, before overlap resolution
 
     def set_graph(self, graph: ONNXGraph):
         self.graph = graph
+        if self.memo is not None:
+            self.memo.clear()
+        if self.profile is not None:
+            self.profile.reset()
 
     @property
     def patterns(self):
@@ -26,38 +58,111 @@ class GraphMatcher:
         
         return patterns
 
-    def match_all(self, allow_overlap: bool = False) -> List[MatchResult]:
+    @staticmethod
+    def build_dispatch_table(patterns: List[Pattern]) -> Tuple[Dict[str, List[Pattern]], List[Pattern]]:
+        """
+        build op_type -> [patterns by priority] so that each node is only tried against
+        patterns that can start at it. Patterns without an anchor op go to the wildcard
+        bucket, which is merged into every op_type bucket and used for unknown op types.
+        `patterns` is expected in priority-first order and that order is kept.
+        """
+        dispatch: Dict[str, List[Pattern]] = {}
+        wildcard: List[Pattern] = []
+        for pattern in patterns:
+            anchors = pattern.anchor_op_types
+            if anchors is None:
+                wildcard.append(pattern)
+                for bucket in dispatch.values():
+                    bucket.append(pattern)
+                continue
+            for op_type in anchors:
+                if op_type not in dispatch:
+                    dispatch[op_type] = list(wildcard)
+                dispatch[op_type].append(pattern)
+        return dispatch, wildcard
+
+    @staticmethod
+    def _match(pattern: Pattern, node: ONNXNode, graph: ONNXGraph) -> Optional[MatchResult]:
+        return pattern.match(node, graph)
+
+    def match_all(self, allow_overlap: bool = False,
+                  worklist: Optional[Iterable[ONNXNode]] = None) -> List[MatchResult]:
+        """
+        worklist: nodes changed since the last match_all (see ONNXGraph.sync). If given, only
+        anchors within the largest pattern radius of these nodes are tried instead of the whole graph.
+        """
         if not self.graph:
             logger.error("No graph set for matching.")
             return []
 
         self.match_results.clear()
-        matched_node_ids: Set[int] = set()
-        sorted_nodes = self.graph.topological_sort()
+        # node.id 是稠密下标，已匹配标记用 bytearray 代替集合
+        matched = bytearray(len(self.graph.node_list))
 
-        # get all registered patterns 
-        logger.info(f"Starting pattern matching on {len(sorted_nodes)} nodes with {len(self.patterns)} patterns...")
+        # get all registered patterns once per run and dispatch on anchor op type
+        patterns = self.patterns
+        dispatch, wildcard = self.build_dispatch_table(patterns)
+        if worklist is None:
+            candidates = None
+            sorted_nodes = self.graph.topological_sort()
+        else:
+            radius = max((pattern.radius for pattern in patterns), default=0)
+            candidates = self.graph.neighborhood(worklist, radius)
+            sorted_nodes = self.graph.topological_sort(candidates)
+        num_attempts = 0
+        memo = self.memo
+        profile = self.profile
+        if self.workers > 1 and len(sorted_nodes) >= self.PARALLEL_MIN_NODES:
+            # the search runs in the workers, the loop below only replays their decisions
+            logger.info(f"Searching {len(sorted_nodes)} nodes with {self.workers} worker processes...")
+            parallel = ParallelMatch(self.graph, sorted_nodes, self.workers)
+            parallel.run()
+            # memo / profile only see a sequential search, see __init__
+            match, memo, profile = parallel.match, None, None
+        else:
+            if memo is not None:
+                memo.begin(self.graph, patterns, candidates)
+            match = memo.match if memo is not None else self._match
+        logger.info(f"Starting pattern matching on {len(sorted_nodes)} nodes with {len(patterns)} patterns...")
 
+        # 先收集全部候选匹配，最后统一做重叠取舍
+        collect = not allow_overlap and self.resolver is not None
+        candidate_matches: List[MatchResult] = []
         for node in sorted_nodes:
             # 如果不允许重叠，跳过已匹配的节点
-            if not allow_overlap and node.id in matched_node_ids:
+            if not allow_overlap and matched[node.id]:
                 continue
 
-            for pattern in self.patterns:
-                match_result = pattern.match(node, self.graph)
+            for pattern in dispatch.get(node.op_type, wildcard):
+                num_attempts += 1
+                if profile is None:
+                    match_result = match(pattern, node, self.graph)
+                else:
+                    match_result = profile.run(match, pattern, node, self.graph)
                 if match_result:
+                    if collect:
+                        candidate_matches.append(match_result)
+                        continue
                     # 检查是否有重叠节点（如果不允许）
                     if not allow_overlap:
                         new_node_ids = match_result.node_ids
-                        if new_node_ids & matched_node_ids:
+                        if any(matched[i] for i in new_node_ids):
                             continue  # 有重叠，跳过
- 
+                        for i in new_node_ids:
+                            matched[i] = 1
+
                     self.match_results.append(match_result)
-                    matched_node_ids.update({} if allow_overlap else new_node_ids)
                     logger.debug(f"Matched pattern '{pattern.name}' at nodes {match_result.node_names}")
                     break  # 一个节点只匹配一个最高优先级的pattern
 
-        logger.info(f"Found {len(self.match_results)} matches.")
+        if collect:
+            self.match_results.extend(self.resolver.resolve(candidate_matches))
+        self.num_candidates = len(sorted_nodes)
+        self.num_attempts = num_attempts
+        self.num_matches = len(candidate_matches) if collect else len(self.match_results)
+        memo_summary = f", {memo.summary()}" if memo is not None else ""
+        resolved = f", {self.num_matches} candidates" if collect else ""
+        logger.info(f"Found {len(self.match_results)} matches ({num_attempts} match attempts{resolved}{memo_summary}).")
         return self.match_results
 
     def get_match_results(self) -> List[MatchResult]:
@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import numpy as np
+import onnx_graphsurgeon as gs
+
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .onnx_helper import ONNXGraph, ONNXNode
+from .pattern import Pattern, MatchResult
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+_MASK64 = (1 << 64) - 1
+# constants with at most this many elements (scalars) are labelled by value
+_VALUE_ELEMENTS = 1
+
+# replay plan of a positive decision:
+#   steps: (slot of the parent, 0 = predecessor / 1 = successor, index in that neighbor list),
+#          slot 0 is the anchor and step i fills slot i + 1
+#   positions: slot of each matched node, in MatchResult.matched_nodes order
+#   op_types: op type of each matched node
+Plan = Tuple[List[Tuple[int, int, int]], Tuple[int, ...], Tuple[str, ...]]
+
+
+def _freeze(value: Any) -> Any:
+    """hashable, content-based form of an attribute value."""
+    if type(value) in (int, float, str, bytes):
+        return value
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, gs.Constant):
+        value = value.values
+    if isinstance(value, np.ndarray):
+        return (value.dtype.str, value.shape, hashlib.sha1(np.ascontiguousarray(value).tobytes()).digest())
+    if isinstance(value, gs.Tensor):
+        return ("tensor", value.name)
+    if isinstance(value, gs.Graph):
+        # subgraphs are never considered equal, nodes that hold one are simply not shared
+        return ("graph", id(value))
+    return value
+
+
+class MatchMemo:
+    '''
+        Memoizes pattern match decisions per structural hash of the anchor's neighborhood,
+        for models that repeat the same block many times.
+
+        Every node gets a local label (op type, attributes, output ranks and whether they are graph
+        outputs, and for each input whether it is an initializer, its value if scalar, and which
+        producer output it is), then
+        CSRAdjacency.structural_hashes spreads the labels over the ordered neighbor lists,
+        so the hash of an anchor covers everything a pattern can see within its reach.
+        A negative decision is reused as is. A positive one is replayed: the matched nodes are
+        found again through the recorded neighbor-list steps from the anchor, their op types
+        are checked, and only Pattern.bind runs to compute the tensor / initializer bindings.
+        If a replay does not fit (a hash collision), the pattern is matched normally.
+    '''
+    def __init__(self):
+        self._decisions: Dict[Tuple[str, int], Optional[Plan]] = {}
+        self._hashes: List[np.ndarray] = []
+        self.lookups = 0
+        self.positive_hits = 0
+        self.negative_hits = 0
+        self.fallbacks = 0
+
+    @property
+    def hits(self) -> int:
+        return self.positive_hits + self.negative_hits
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def clear(self):
+        self._decisions.clear()
+        self._hashes = []
+
+    @staticmethod
+    def _label(node: ONNXNode, graph: ONNXGraph, graph_outputs: frozenset = frozenset()) -> int:
+        name_to_nodes = graph.name_to_nodes
+        initializers = graph.initializers
+        inputs = []
+        for i, inp in enumerate(node.inputs):
+            producers = name_to_nodes.get(inp)
+            slot = producers[0].outputs.index(inp) if producers else -1
+            # same tensor feeding several inputs, e.g. Mul(x, x)
+            first_use = node.inputs.index(inp)
+            constant = initializers.get_constant(inp)
+            # scalar constants (exponents, epsilons) are compared by value, patterns can test them
+            value = (_freeze(constant) if constant is not None and constant.shape is not None
+                     and int(np.prod(constant.shape)) <= _VALUE_ELEMENTS else None)
+            inputs.append((constant is not None, slot, first_use, not inp, value))
+        tensors = graph.tensors
+        ranks = []
+        for output in node.outputs:
+            tensor = tensors.get(output)
+            shape = tensor.shape if tensor is not None else None
+            # patterns never swallow a graph output, so it is part of the label
+            ranks.append((len(shape) if shape is not None else None, output in graph_outputs))
+        attrs = node.attrs
+        attrs = tuple([(key, _freeze(attrs[key])) for key in sorted(attrs)]) if attrs else ()
+        return hash((node.op_type, attrs, tuple(inputs), tuple(ranks))) & _MASK64
+
+    def begin(self, graph: ONNXGraph, patterns: Sequence[Pattern], nodes: Optional[List[ONNXNode]] = None):
+        """
+            Hash the graph for one match_all run. With `nodes`, only these will be used as
+            anchors, so only their neighborhood is labelled.
+        """
+        self.lookups = 0
+        self.positive_hits = 0
+        self.negative_hits = 0
+        self.fallbacks = 0
+        iterations = max((sum(pattern.reach) for pattern in patterns), default=0)
+        labels = np.zeros(len(graph.node_list), dtype=np.uint64)
+        scope = graph.nodes.values() if nodes is None else graph.neighborhood(nodes, iterations)
+        for node in scope:
+            labels[node.id] = self._label(node, graph, graph.output_names)
+        self._hashes = graph.adjacency.structural_hashes(labels, iterations)
+
+    @staticmethod
+    def _plan(anchor: ONNXNode, match_result: MatchResult, graph: ONNXGraph, depth: int) -> Optional[Plan]:
+        """shortest neighbor-list steps from the anchor to every matched node."""
+        targets = {node.id for node in match_result.matched_nodes}
+        parent: Dict[int, Optional[Tuple[int, int, int]]] = {anchor.id: None}
+        queue = deque([(anchor, 0)])
+        while queue and not targets <= parent.keys():
+            node, dist = queue.popleft()
+            if dist == depth:
+                continue
+            for direction, neighbors in enumerate((graph.get_predecessors(node), graph.get_successors(node))):
+                for k, other in enumerate(neighbors):
+                    if other.id not in parent:
+                        parent[other.id] = (node.id, direction, k)
+                        queue.append((other, dist + 1))
+        if not targets <= parent.keys():
+            return None
+
+        slots = {anchor.id: 0}
+        steps: List[Tuple[int, int, int]] = []
+        for node in match_result.matched_nodes:
+            chain = []
+            node_id = node.id
+            while node_id not in slots:
+                chain.append(node_id)
+                node_id = parent[node_id][0]
+            for node_id in reversed(chain):
+                parent_id, direction, k = parent[node_id]
+                steps.append((slots[parent_id], direction, k))
+                slots[node_id] = len(steps)
+        positions = tuple(slots[node.id] for node in match_result.matched_nodes)
+        return steps, positions, tuple(node.op_type for node in match_result.matched_nodes)
+
+    @staticmethod
+    def _replay(plan: Plan, anchor: ONNXNode, graph: ONNXGraph) -> Optional[List[ONNXNode]]:
+        steps, positions, op_types = plan
+        slots = [anchor]
+        for parent, direction, k in steps:
+            node = slots[parent]
+            neighbors = graph.get_successors(node) if direction else graph.get_predecessors(node)
+            if k >= len(neighbors):
+                return None
+            slots.append(neighbors[k])
+        nodes = [slots[i] for i in positions]
+        if any(node.op_type != op_type for node, op_type in zip(nodes, op_types)):
+            return None
+        if len({node.id for node in nodes}) != len(nodes):
+            return None
+        return nodes
+
+    def match(self, pattern: Pattern, anchor: ONNXNode, graph: ONNXGraph) -> Optional[MatchResult]:
+        depth = sum(pattern.reach)
+        key = (pattern.name, int(self._hashes[depth][anchor.id]))
+        self.lookups += 1
+        decision = self._decisions.get(key, _MISSING)
+        if decision is _MISSING:
+            match_result = pattern.match(anchor, graph)
+            if match_result is None:
+                self._decisions[key] = None
+                return None
+            plan = self._plan(anchor, match_result, graph, depth)
+            if plan is None:
+                logger.debug(f"Pattern '{pattern.name}' matched outside of its reach {pattern.reach}, not memoized.")
+            else:
+                self._decisions[key] = plan
+            return match_result
+
+        if decision is None:
+            self.negative_hits += 1
+            return None
+        nodes = self._replay(decision, anchor, graph)
+        if nodes is None:
+            self.fallbacks += 1
+            return pattern.match(anchor, graph)
+        self.positive_hits += 1
+        return pattern.bind(nodes, graph)
+
+    def summary(self) -> str:
+        summary = (f"memo {self.hits}/{self.lookups} hits ({100 * self.hit_rate:.1f}%: "
+                   f"{self.positive_hits} positive, {self.negative_hits} negative)")
+        if self.fallbacks:
+            summary += f", {self.fallbacks} replay fallbacks"
+        return summary
+
+    def __repr__(self):
+        return f"MatchMemo(entries={len(self._decisions)}, {self.summary()})"
@@ -0,0 +1,105 @@
+import time
+import numpy as np
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from .onnx_helper import ONNXGraph, ONNXNode
+from .pattern import Pattern, MatchResult
+
+
+class _ProbedGraph:
+    '''
+        Stand-in for the ONNXGraph passed to a pattern while profiling: counts the neighbor
+        list lookups, which tells how deep into the structure the pattern got.
+    '''
+    def __init__(self, graph: ONNXGraph):
+        self._graph = graph
+        self.depth = 0
+
+    def get_producer(self, tensor_name: str) -> Optional[ONNXNode]:
+        self.depth += 1
+        return self._graph.get_producer(tensor_name)
+
+    def get_predecessors(self, node: ONNXNode) -> List[ONNXNode]:
+        self.depth += 1
+        return self._graph.get_predecessors(node)
+
+    def get_successors(self, node: ONNXNode) -> List[ONNXNode]:
+        self.depth += 1
+        return self._graph.get_successors(node)
+
+    def __getattr__(self, name):
+        return getattr(self._graph, name)
+
+
+@dataclass
+class PatternStats:
+    """Match statistics of one pattern."""
+    name: str
+    attempts: int = 0
+    hits: int = 0
+    total_time: float = 0.0
+    times: List[float] = field(default_factory=list, repr=False)
+    # number of neighbor lookups the pattern made before rejecting -> count
+    rejections: Counter = field(default_factory=Counter)
+
+    @property
+    def p99_time(self) -> float:
+        return float(np.percentile(self.times, 99)) if self.times else 0.0
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.attempts if self.attempts else 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.attempts if self.attempts else 0.0
+
+
+class MatchProfile:
+    '''
+        Per-pattern profiling of GraphMatcher.match_all: attempts, hits, cumulative / p99
+        match time, and the rejection stage, measured as the number of neighbor lookups the
+        pattern made before returning None. Accumulates over match_all calls until reset().
+    '''
+    def __init__(self):
+        self.patterns: Dict[str, PatternStats] = {}
+
+    def reset(self):
+        self.patterns.clear()
+
+    def run(self, match: Callable[[Pattern, ONNXNode, ONNXGraph], Optional[MatchResult]],
+            pattern: Pattern, node: ONNXNode, graph: ONNXGraph) -> Optional[MatchResult]:
+        stats = self.patterns.get(pattern.name)
+        if stats is None:
+            stats = self.patterns[pattern.name] = PatternStats(pattern.name)
+        probe = _ProbedGraph(graph)
+        start = time.perf_counter()
+        match_result = match(pattern, node, probe)
+        elapsed = time.perf_counter() - start
+
+        stats.attempts += 1
+        stats.total_time += elapsed
+        stats.times.append(elapsed)
+        if match_result is None:
+            stats.rejections[probe.depth] += 1
+        else:
+            stats.hits += 1
+        return match_result
+
+    def format_table(self) -> str:
+        header = ("pattern", "attempts", "hits", "hit%", "total ms", "mean us", "p99 us", "rejected at depth: count")
+        rows = []
+        for stats in sorted(self.patterns.values(), key=lambda s: s.total_time, reverse=True):
+            rejections = " ".join(f"{depth}:{count}" for depth, count in sorted(stats.rejections.items()))
+            rows.append((stats.name, str(stats.attempts), str(stats.hits), f"{100 * stats.hit_rate:.1f}",
+                         f"{1e3 * stats.total_time:.2f}", f"{1e6 * stats.mean_time:.1f}",
+                         f"{1e6 * stats.p99_time:.1f}", rejections or "-"))
+        widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+        lines = [" | ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in [header] + rows]
+        lines.insert(1, "-+-".join("-" * width for width in widths))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return f"MatchProfile(patterns={list(self.patterns)})"
@@ -1,3 +1,7 @@
 from .onnx_model import ONNXModel
 from .onnx_graph import ONNXGraph
-from .onnx_node import ONNXNode
\ No newline at end of file
+from .onnx_node import ONNXNode
+from .initializer_store import InitializerStore
+from .adjacency import CSRAdjacency
+from .shape_inference import ShapeInference
+from .serialization import export_skeleton, save_streaming
\ No newline at end of file
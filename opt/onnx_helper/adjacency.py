@@ -0,0 +1,229 @@
+import numpy as np
+
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+_K_SELF = np.uint64(0x9E3779B97F4A7C15)
+_K_SUCC = np.uint64(0xC2B2AE3D27D4EB4F)
+_K_PRED = np.uint64(0x165667B19E3779F9)
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer, element-wise on uint64 (wrapping arithmetic)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class CSRAdjacency:
+    '''
+        Compact, integer-indexed adjacency of a DAG over dense node indices 0..num_nodes-1.
+
+        successors are stored as CSR (succ_indptr / succ_indices), predecessors as CSC
+        (pred_indptr / pred_indices). Edges are unique per (src, dst) pair; successors keep
+        the order in which edges were added per source, predecessors per destination.
+        Removed nodes are masked out instead of rebuilding the arrays; nodes and edges added
+        afterwards go to a small list-based overlay on top of the arrays.
+    '''
+    def __init__(self, num_nodes: int, src: Sequence[int], dst: Sequence[int]):
+        self.num_nodes = num_nodes
+        index_dtype = np.int32 if num_nodes < np.iinfo(np.int32).max else np.int64
+        src = np.asarray(src, dtype=index_dtype)
+        dst = np.asarray(dst, dtype=index_dtype)
+
+        # stable sorts keep the insertion order of the edges inside each row
+        order = np.argsort(src, kind="stable")
+        self.succ_indptr = self._indptr(src, num_nodes)
+        self.succ_indices = dst[order]
+
+        order = np.argsort(dst, kind="stable")
+        self.pred_indptr = self._indptr(dst, num_nodes)
+        self.pred_indices = src[order]
+
+        self.num_base = num_nodes  # nodes covered by the CSR/CSC arrays
+        self.alive = np.ones(num_nodes, dtype=bool)
+        self.num_removed = 0
+        # overlay of edges added after construction, idx -> [idx]
+        self.extra_succ: Dict[int, List[int]] = {}
+        self.extra_pred: Dict[int, List[int]] = {}
+
+    @staticmethod
+    def _indptr(rows: np.ndarray, num_nodes: int) -> np.ndarray:
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_nodes), out=indptr[1:])
+        return indptr
+
+    def _alive_only(self, indices: np.ndarray) -> List[int]:
+        if not self.num_removed:
+            return indices.tolist()
+        return indices[self.alive[indices]].tolist()
+
+    def _with_extra(self, base: List[int], extra: Dict[int, List[int]], idx: int) -> List[int]:
+        added = extra.get(idx)
+        if added:
+            base.extend(i for i in added if self.alive[i])
+        return base
+
+    def successors(self, idx: int) -> List[int]:
+        base = (self._alive_only(self.succ_indices[self.succ_indptr[idx]:self.succ_indptr[idx + 1]])
+                if idx < self.num_base else [])
+        return self._with_extra(base, self.extra_succ, idx)
+
+    def predecessors(self, idx: int) -> List[int]:
+        base = (self._alive_only(self.pred_indices[self.pred_indptr[idx]:self.pred_indptr[idx + 1]])
+                if idx < self.num_base else [])
+        return self._with_extra(base, self.extra_pred, idx)
+
+    def add_node(self) -> int:
+        """append a node without edges and return its index."""
+        idx = self.num_nodes
+        if idx == len(self.alive):
+            # grow geometrically, the slots past num_nodes stay masked out
+            grown = np.zeros(max(16, 2 * len(self.alive)), dtype=bool)
+            grown[:idx] = self.alive
+            self.alive = grown
+        self.alive[idx] = True
+        self.num_nodes += 1
+        return idx
+
+    def add_edge(self, src: int, dst: int) -> bool:
+        """add the edge src -> dst to the overlay, unless it already exists."""
+        if src < self.num_base and dst < self.num_base:
+            row = self.succ_indices[self.succ_indptr[src]:self.succ_indptr[src + 1]]
+            if np.any(row == dst):
+                return False
+        succ = self.extra_succ.setdefault(src, [])
+        if dst in succ:
+            return False
+        succ.append(dst)
+        self.extra_pred.setdefault(dst, []).append(src)
+        return True
+
+    def remove(self, idx: int):
+        if self.alive[idx]:
+            self.alive[idx] = False
+            self.num_removed += 1
+
+    @property
+    def num_edges(self) -> int:
+        src_alive = np.repeat(self.alive[:self.num_base], np.diff(self.succ_indptr))
+        num_edges = int(np.count_nonzero(src_alive & self.alive[self.succ_indices]))
+        alive = self.alive
+        return num_edges + sum(alive[src] and alive[dst]
+                               for src, dsts in self.extra_succ.items() for dst in dsts)
+
+    def _ordered_edges(self, indptr: np.ndarray, indices: np.ndarray,
+                       extra: Dict[int, List[int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+            (row, col, position) of the alive edges stored in one direction, position being the
+            index of col in the neighbor list of row, as returned by successors / predecessors.
+        """
+        alive = self.alive
+        rows = np.repeat(np.arange(self.num_base), np.diff(indptr))
+        keep = alive[rows] & alive[indices]
+        rows, cols = rows[keep], indices[keep].astype(np.int64)
+        # rows are grouped, the rank inside a row is the distance to its first edge
+        positions = np.arange(len(rows)) - np.searchsorted(rows, rows, side="left")
+        if extra:
+            counts = np.bincount(rows, minlength=self.num_nodes)
+            added = [(row, col, int(counts[row]) + k)
+                     for row, cols_added in extra.items() if alive[row]
+                     for k, col in enumerate(c for c in cols_added if alive[c])]
+            if added:
+                added = np.asarray(added, dtype=np.int64)
+                rows = np.concatenate([rows, added[:, 0]])
+                cols = np.concatenate([cols, added[:, 1]])
+                positions = np.concatenate([positions, added[:, 2]])
+        return rows, cols, positions
+
+    def structural_hashes(self, labels: np.ndarray, iterations: int) -> List[np.ndarray]:
+        """
+            Weisfeiler-Lehman style node hashes. hashes[k][i] covers the labels and the ordered
+            predecessor / successor lists of every node within k edges of node i, in both
+            directions; hashes[0] are the mixed labels. labels: one uint64 per node index.
+        """
+        succ = self._ordered_edges(self.succ_indptr, self.succ_indices, self.extra_succ)
+        pred = self._ordered_edges(self.pred_indptr, self.pred_indices, self.extra_pred)
+        with np.errstate(over="ignore"):
+            h = _mix64(np.asarray(labels, dtype=np.uint64))
+            hashes = [h]
+            for _ in range(iterations):
+                next_h = _mix64(h * _K_SELF)
+                for (rows, cols, positions), k in ((succ, _K_SUCC), (pred, _K_PRED)):
+                    acc = np.zeros_like(h)
+                    np.add.at(acc, rows, _mix64(h[cols] + positions.astype(np.uint64) * k))
+                    next_h ^= _mix64(acc + k)
+                h = next_h
+                hashes.append(h)
+        return hashes
+
+    def topological_generations(self) -> Iterator[List[int]]:
+        """
+            Kahn's algorithm, yielding one generation (nodes whose predecessors are all
+            in earlier generations) at a time. Raises ValueError if the graph has a cycle.
+        """
+        alive = self.alive[:self.num_nodes]
+        dst = np.repeat(np.arange(self.num_base), np.diff(self.pred_indptr))
+        edge_alive = alive[self.pred_indices] & alive[dst]
+        indegree = np.bincount(dst[edge_alive], minlength=self.num_nodes).tolist()
+
+        indptr = self.succ_indptr.tolist()
+        indices = self.succ_indices.tolist()
+        alive_list = alive.tolist()
+        remaining = sum(alive_list)
+        num_base = self.num_base
+        extra_succ = self.extra_succ
+        for src, dsts in extra_succ.items():
+            if alive_list[src]:
+                for child in dsts:
+                    if alive_list[child]:
+                        indegree[child] += 1
+
+        generation = [i for i in range(self.num_nodes) if alive_list[i] and indegree[i] == 0]
+        while generation:
+            remaining -= len(generation)
+            yield generation
+            next_generation = []
+            for idx in generation:
+                children = indices[indptr[idx]:indptr[idx + 1]] if idx < num_base else []
+                if idx in extra_succ:
+                    children = children + extra_succ[idx]
+                for child in children:
+                    if not alive_list[child]:
+                        continue
+                    indegree[child] -= 1
+                    if indegree[child] == 0:
+                        next_generation.append(child)
+            generation = next_generation
+        if remaining:
+            raise ValueError("Graph contains a cycle.")
+
+    def topological_order(self) -> List[int]:
+        return [idx for generation in self.topological_generations() for idx in generation]
+
+    def subgraph_order(self, subset: Iterable[int]) -> List[int]:
+        """
+            Topological order of the subgraph induced by the alive nodes of `subset`, generation
+            by generation like topological_order. Only edges inside the subset are considered.
+        """
+        members = sorted(idx for idx in set(subset) if self.alive[idx])
+        member_set = set(members)
+        indegree = {idx: sum(1 for prev in self.predecessors(idx) if prev in member_set) for idx in members}
+        order: List[int] = []
+        generation = [idx for idx in members if indegree[idx] == 0]
+        while generation:
+            order.extend(generation)
+            next_generation = []
+            for idx in generation:
+                for child in self.successors(idx):
+                    if child not in member_set:
+                        continue
+                    indegree[child] -= 1
+                    if indegree[child] == 0:
+                        next_generation.append(child)
+            generation = next_generation
+        if len(order) != len(members):
+            raise ValueError("Graph contains a cycle.")
+        return order
+
+    def __repr__(self):
+        return f"CSRAdjacency(nodes={int(self.alive.sum())}, edges={self.num_edges})"
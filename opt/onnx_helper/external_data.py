@@ -0,0 +1,176 @@
+import os
+import mmap
+import logging
+import numpy as np
+import onnx_graphsurgeon as gs
+
+from onnx import TensorProto, numpy_helper
+from onnx.external_data_helper import ExternalDataInfo
+from onnx_graphsurgeon.ir.tensor import LazyValues
+from typing import Dict, List, Optional, Union
+from .initializer_store import view_raw
+
+logger = logging.getLogger(__name__)
+
+class MappedValues(LazyValues):
+    '''
+        LazyValues whose payload lives in a memory-mapped external data file.
+        load() returns a read-only view into the mapping, nothing is read until then.
+        gs exports it as its original (external) TensorProto, like any LazyValues.
+        path: absolute path of the mapped file
+    '''
+    def __init__(self, tensor: TensorProto, buffer: mmap.mmap, offset: int, length: int, path: str = ""):
+        super().__init__(tensor)
+        self.buffer = buffer
+        self.offset = offset
+        self.length = length
+        self.path = path
+
+    def view(self) -> memoryview:
+        return memoryview(self.buffer)[self.offset:self.offset + self.length]
+
+    def load(self) -> np.ndarray:
+        array = view_raw(self.buffer, self.tensor.data_type, self.tensor.dims, offset=self.offset)
+        if array is not None:
+            return array
+        # packed / non-numpy types go through numpy_helper on an inline copy
+        return numpy_helper.to_array(inline_tensor(self.tensor, self.view()))
+
+    def __str__(self):
+        return f"MappedValues({self.tensor.name}, offset={self.offset}, length={self.length})"
+
+
+def absolute_header(header: TensorProto, path: str) -> TensorProto:
+    """copy of an external tensor header whose location is the absolute `path`, readable from any directory."""
+    tensor = TensorProto()
+    tensor.CopyFrom(header)
+    for entry in tensor.external_data:
+        if entry.key == "location":
+            entry.value = path
+    return tensor
+
+
+def inline_tensor(header: TensorProto, payload: Union[bytes, memoryview]) -> TensorProto:
+    """copy of an external tensor header with `payload` stored inline as raw_data."""
+    tensor = TensorProto()
+    tensor.CopyFrom(header)
+    tensor.ClearField("external_data")
+    tensor.data_location = TensorProto.DEFAULT
+    tensor.raw_data = bytes(payload)
+    return tensor
+
+
+class ExternalDataMapper:
+    '''
+        Memory-maps the external data files of a model loaded with load_external_data=False,
+        and attaches MappedValues to the gs constants that refer to them.
+    '''
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self._files: Dict[str, mmap.mmap] = {}
+
+    def _path(self, location: str) -> str:
+        return os.path.normpath(os.path.join(self.base_dir, location))
+
+    def _map(self, location: str) -> mmap.mmap:
+        path = self._path(location)
+        if path not in self._files:
+            with open(path, "rb") as f:
+                self._files[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._files[path]
+
+    @property
+    def paths(self) -> List[str]:
+        return list(self._files)
+
+    def attach(self, graph: gs.Graph) -> int:
+        num_mapped = 0
+        for tensor in graph.tensors().values():
+            if not isinstance(tensor, gs.Constant) or type(tensor._values) is not LazyValues:
+                continue
+            onnx_tensor = tensor._values.tensor
+            if onnx_tensor.data_location != TensorProto.EXTERNAL:
+                continue
+            info = ExternalDataInfo(onnx_tensor)
+            buffer = self._map(info.location)
+            offset = info.offset or 0
+            length = info.length if info.length is not None and info.length > 0 else len(buffer) - offset
+            tensor._values = MappedValues(onnx_tensor, buffer, offset, length, os.path.abspath(self._path(info.location)))
+            num_mapped += 1
+        if num_mapped:
+            logger.info(f"Memory-mapped {num_mapped} external initializers from {len(self._files)} file(s).")
+        return num_mapped
+
+    def close(self):
+        for buffer in self._files.values():
+            buffer.close()
+        self._files.clear()
+
+
+class ExternalDataWriter:
+    '''
+        Writes initializer payloads into size-bounded shard files next to the model:
+        `<model>.data` when unsharded, `<model>.data.<i>` when shard_size is set.
+        Returns external TensorProto headers to put into the model instead of the payloads.
+    '''
+    def __init__(self, model_path: str, size_threshold: int = 1024, shard_size: Optional[int] = None,
+                 alignment: int = 4096):
+        self.base_dir = os.path.dirname(os.path.abspath(model_path))
+        self.prefix = os.path.basename(model_path) + ".data"
+        self.size_threshold = size_threshold
+        self.shard_size = shard_size if shard_size and shard_size > 0 else None
+        self.alignment = alignment
+        self.shards: List[str] = []
+        self._file = None
+        self._offset = 0
+
+    def wants(self, tensor: TensorProto, nbytes: int) -> bool:
+        return tensor.data_type != TensorProto.STRING and nbytes >= self.size_threshold
+
+    def _open_shard(self):
+        self.close()
+        location = self.prefix if self.shard_size is None else f"{self.prefix}.{len(self.shards)}"
+        self._file = open(os.path.join(self.base_dir, location), "wb")
+        self._offset = 0
+        self.shards.append(location)
+
+    def write(self, tensor: TensorProto, payload: Union[bytes, memoryview]) -> TensorProto:
+        length = len(payload)
+        # align every payload so that it can be memory-mapped and viewed in place
+        offset = (self._offset + self.alignment - 1) // self.alignment * self.alignment
+        if self._file is None or (self.shard_size is not None and self._offset > 0
+                                  and offset + length > self.shard_size):
+            self._open_shard()
+            offset = 0
+        if offset > self._offset:
+            self._file.write(b"\0" * (offset - self._offset))
+        self._file.write(payload)
+        self._offset = offset + length
+
+        header = TensorProto()
+        header.name = tensor.name
+        header.dims.extend(tensor.dims)
+        header.data_type = tensor.data_type
+        header.data_location = TensorProto.EXTERNAL
+        for key, value in (("location", self.shards[-1]), ("offset", str(offset)), ("length", str(length))):
+            entry = header.external_data.add()
+            entry.key = key
+            entry.value = value
+        return header
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def tensor_payload(tensor: TensorProto, values: Optional[LazyValues] = None) -> Union[bytes, memoryview]:
+    """raw little-endian bytes of an initializer, a view into the mapping for mapped tensors."""
+    if isinstance(values, MappedValues):
+        return values.view()
+    if tensor.HasField("raw_data"):
+        return tensor.raw_data
+    return numpy_helper.to_array(tensor).tobytes()
+
+
+__all__ = ["MappedValues", "ExternalDataMapper", "ExternalDataWriter", "inline_tensor", "tensor_payload"]
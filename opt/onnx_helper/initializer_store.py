@@ -0,0 +1,119 @@
+import onnx
+import numpy as np
+import onnx_graphsurgeon as gs
+
+from collections import OrderedDict
+from onnx import numpy_helper, helper
+from onnx_graphsurgeon.ir.tensor import LazyValues
+from typing import Dict, Iterable, Iterator, Optional
+
+# data types whose raw_data layout is exactly the little-endian numpy layout,
+# so they can be viewed with np.frombuffer instead of going through numpy_helper
+_FROMBUFFER_DTYPES = {
+    onnx.TensorProto.FLOAT,
+    onnx.TensorProto.DOUBLE,
+    onnx.TensorProto.FLOAT16,
+    onnx.TensorProto.INT8,
+    onnx.TensorProto.INT16,
+    onnx.TensorProto.INT32,
+    onnx.TensorProto.INT64,
+    onnx.TensorProto.UINT8,
+    onnx.TensorProto.UINT16,
+    onnx.TensorProto.UINT32,
+    onnx.TensorProto.UINT64,
+    onnx.TensorProto.BOOL,
+}
+
+
+def view_raw(buffer, data_type: int, dims, offset: int = 0) -> Optional[np.ndarray]:
+    """
+        Read-only np.frombuffer view of a little-endian tensor payload starting at `offset`,
+        or None if `data_type` has no plain numpy layout (bfloat16, float8, int4, string...).
+    """
+    if data_type not in _FROMBUFFER_DTYPES:
+        return None
+    np_dtype = np.dtype(helper.tensor_dtype_to_np_dtype(data_type)).newbyteorder("<")
+    count = int(np.prod(dims, dtype=np.int64)) if len(dims) else 1
+    return np.frombuffer(buffer, dtype=np_dtype, count=count, offset=offset).reshape(tuple(dims))
+
+
+class InitializerStore:
+    '''
+        Name-indexed store over the initializers (gs.Constant) of a graph.
+
+        The index is built once; membership checks never decode a tensor.
+        Constants that are still backed by their onnx.TensorProto are decoded as read-only
+        views over `raw_data` whenever the layout allows it, constants created by builders
+        are returned as is. The most recently used arrays are kept in a bounded LRU cache.
+    '''
+    def __init__(self, constants: Iterable[gs.Constant], cache_size: int = 128):
+        self._constants: Dict[str, gs.Constant] = {tensor.name: tensor for tensor in constants}
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.cache_size = cache_size
+
+    @staticmethod
+    def decode(constant: gs.Constant) -> np.ndarray:
+        values = constant._values
+        if isinstance(values, LazyValues):
+            if values.tensor.data_location == onnx.TensorProto.EXTERNAL:
+                # MappedValues: a view into the mapped external data file
+                return values.load()
+            return InitializerStore.decode_proto(values.tensor)
+        return np.asarray(constant.values)
+
+    @staticmethod
+    def decode_proto(tensor: onnx.TensorProto) -> np.ndarray:
+        if tensor.HasField("raw_data") and tensor.data_location != onnx.TensorProto.EXTERNAL:
+            array = view_raw(tensor.raw_data, tensor.data_type, tensor.dims)
+            if array is not None:
+                return array
+        return numpy_helper.to_array(tensor)
+
+    def get_constant(self, name: str) -> Optional[gs.Constant]:
+        return self._constants.get(name)
+
+    def add(self, constant: gs.Constant):
+        self._constants[constant.name] = constant
+        self._cache.pop(constant.name, None)
+
+    def remove(self, name: str):
+        self._constants.pop(name, None)
+        self._cache.pop(name, None)
+
+    def get(self, name: str, dtype=None) -> Optional[np.ndarray]:
+        """
+            Return the initializer `name` as a numpy array, or None if it does not exist.
+            The array is shared with the cache and must not be modified in place;
+            a converted copy is only made when `dtype` is given and differs.
+        """
+        array = self._cache.get(name)
+        if array is None:
+            constant = self._constants.get(name)
+            if constant is None:
+                return None
+            array = self.decode(constant)
+            if self.cache_size > 0:
+                self._cache[name] = array
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(name)
+
+        if dtype is not None and array.dtype != dtype:
+            return array.astype(dtype)
+        return array
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._constants
+
+    def __len__(self) -> int:
+        return len(self._constants)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._constants)
+
+    def __repr__(self):
+        return f"InitializerStore(initializers={len(self._constants)}, cached={len(self._cache)}/{self.cache_size})"
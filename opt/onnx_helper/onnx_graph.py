@@ -1,126 +1,259 @@
 import onnx
 import numpy as np
 import logging
-from onnx import numpy_helper
-from typing import Dict, List, Optional
+import onnx_graphsurgeon as gs
+from collections import deque
+from typing import Dict, Iterable, List, Optional
 from .onnx_node import ONNXNode 
-import networkx as nx
+from .initializer_store import InitializerStore
+from .adjacency import CSRAdjacency
+from .shape_inference import ShapeInference
 
 logger = logging.getLogger(__name__)
 
 class ONNXGraph:
-    def __init__(self, graph_proto: onnx.GraphProto):
-        self.graph_proto = graph_proto
+    '''
+        Matching view over a gs.Graph: ONNXNode wrappers, producer map, CSR adjacency
+        and an initializer store. It references the gs nodes and constants and does not
+        copy any weights, so matching and fusion share one IR.
+        infer_shapes: fill in the tensor types the model does not annotate when the view is
+        built, and those of the nodes added later (see ShapeInference)
+    '''
+    def __init__(self, gs_graph: gs.Graph, cache_size: int = 128, infer_shapes: bool = True):
+        self.gs_graph = gs_graph
+        self.tensors: Dict[str, gs.Tensor] = gs_graph.tensors()  # tensor name -> gs.Tensor
+        self.initializers = InitializerStore(
+            (t for t in self.tensors.values() if isinstance(t, gs.Constant)), cache_size=cache_size)
         self.nodes: Dict[int, ONNXNode] = {}  # node.id -> ONNXNode
-        self.name_to_nodes: Dict[str, List[ONNXNode]] = {}  # output name -> nodes
-        self.graph: nx.DiGraph = nx.DiGraph()
-        self.output_shape = self.get_output_shape()
+        self.name_to_nodes: Dict[str, List[ONNXNode]] = {}  # output name -> nodes (producer index)
+        self.consumers: Dict[str, List[ONNXNode]] = {}  # input name -> consumers, each once
+        self.op_index: Dict[str, Dict[int, ONNXNode]] = {}  # op_type -> node.id -> node
+        self.node_list: List[Optional[ONNXNode]] = []  # node.id -> ONNXNode, None once removed
+        self.name_index: Dict[str, int] = {}  # node name -> node.id
+        self._duplicate_names = set()  # names shared by several nodes, re-resolved on removal
+        self._gs_ids: Dict[int, int] = {}  # id(gs node) -> node.id, the view holds a reference to every live gs node
+        self.adjacency: Optional[CSRAdjacency] = None
+        self.output_names = frozenset(tensor.name for tensor in gs_graph.outputs)  # graph output names
+        self.shape_inference: Optional[ShapeInference] = ShapeInference(gs_graph) if infer_shapes else None
 
         self._build_graph()
+        if self.shape_inference is not None:
+            self.shape_inference.propagate(node.node for node in self.topological_sort())
 
     def _build_graph(self):
-        # 1. 创建所有节点对象
-        for node_proto in self.graph_proto.node:
-            node = ONNXNode(node_proto)
-            self.nodes[node.id] = node
-            self.graph.add_node(node.id, op_type=node.op_type)
-
-            # 2. 建立输出名到节点的映射
-            for output in node.outputs:
-                if output not in self.name_to_nodes:
-                    self.name_to_nodes[output] = []
-                self.name_to_nodes[output].append(node)
-
-        # 3. 建立边（基于张量依赖）
-        for node in self.nodes.values():
+        # 1. 创建所有节点对象，分配稠密下标作为 node.id
+        # 2. 同时登记索引：op_type、输出名 -> 生产者、输入名 -> 消费者、节点名
+        for gs_node in self.gs_graph.nodes:
+            self._register(ONNXNode(gs_node, len(self.node_list)))
+
+        # 3. 建立边（基于张量依赖），每对 (producer, consumer) 只保留一条边
+        src, dst = [], []
+        for idx, node in enumerate(self.node_list):
+            seen = set()
             for inp in node.inputs:
-                if inp in self.name_to_nodes:
-                    for prev_node in self.name_to_nodes[inp]:
-                        self.graph.add_edge(prev_node.id, node.id, tensor=inp)
+                for prev_node in self.name_to_nodes.get(inp, ()):
+                    if prev_node.id not in seen:
+                        seen.add(prev_node.id)
+                        src.append(prev_node.id)
+                        dst.append(idx)
+        self.adjacency = CSRAdjacency(len(self.node_list), src, dst)
 
-    def initializer2array(self, initializer) -> np.array:
-        return numpy_helper.to_array(initializer)
+    def _register(self, node: ONNXNode):
+        """add `node` to every index, the edges are left to the caller."""
+        self.nodes[node.id] = node
+        self.node_list.append(node)
+        self._gs_ids[id(node.node)] = node.id
+        self.op_index.setdefault(node.op_type, {})[node.id] = node
+        # 省略的可选输入/输出名为空串，不参与索引
+        for output in node.outputs:
+            if output:
+                self.name_to_nodes.setdefault(output, []).append(node)
+        for inp in node.inputs:
+            if inp:
+                readers = self.consumers.setdefault(inp, [])
+                if node not in readers:
+                    readers.append(node)
+        if node.name not in self.name_index:
+            self.name_index[node.name] = node.id
+        else:
+            self._duplicate_names.add(node.name)
+            logger.debug(f"Duplicate node name {node.name}, lookups by name return the first one.")
+
+    def _unregister(self, node: ONNXNode):
+        del self.nodes[node.id]
+        self.node_list[node.id] = None
+        self._gs_ids.pop(id(node.node), None)
+        same_op = self.op_index[node.op_type]
+        del same_op[node.id]
+        if not same_op:
+            del self.op_index[node.op_type]
+        for output in node.outputs:
+            producers = [n for n in self.name_to_nodes.get(output, ()) if n.id != node.id]
+            if producers:
+                self.name_to_nodes[output] = producers
+            else:
+                self.name_to_nodes.pop(output, None)
+        for inp in node.inputs:
+            readers = self.consumers.get(inp)
+            if readers is not None and node in readers:
+                readers.remove(node)
+                if not readers:
+                    del self.consumers[inp]
+        if self.name_index.get(node.name) == node.id:
+            del self.name_index[node.name]
+            if node.name in self._duplicate_names:
+                # 同名节点很少见，这里线性查找下一个
+                other = next((n for n in self.nodes.values() if n.name == node.name), None)
+                if other is not None:
+                    self.name_index[node.name] = other.id
+                else:
+                    self._duplicate_names.discard(node.name)
+
+    def initializer2array(self, initializer: gs.Constant) -> np.array:
+        return InitializerStore.decode(initializer)
         
-    def get_initializer_by_name(self, name : str, dtype = np.float32):
-        for initializer in self.graph_proto.initializer:
-            if initializer.name == name:
-                return self.initializer2array(initializer).astype(dtype)
-        return None
+    def get_initializer_by_name(self, name : str, dtype = None):
+        # dtype conversion (a copy) only happens when dtype is given
+        return self.initializers.get(name, dtype=dtype)
     
     def is_constant_input(self, input_name : str) -> bool:
-        return self.get_initializer_by_name(input_name) is not None
+        return input_name in self.initializers
             
     def get_output_shape(self) -> Dict:
-        
-        def parse_tensor_shape(tensor_proto: onnx.ValueInfoProto) -> list:
-            shape = []
-            tensor_type = tensor_proto.type.tensor_type
-            if not tensor_type.HasField("shape"):
-                return shape  # 无形状信息
-            for dim in tensor_type.shape.dim:
-                if dim.HasField("dim_value"):
-                    # 静态维度（如224、3等）
-                    shape.append(dim.dim_value)
-                elif dim.HasField("dim_param"):
-                    # 动态维度（如batch_size、?等）
-                    shape.append(dim.dim_param)
-                else:
-                    # 未知维度
-                    shape.append(None)
-            return shape
-        
-        shape_mapping = {}
-        # 1. 处理模型输入
-        for tensor in self.graph_proto.input:
-            shape_mapping[tensor.name] = parse_tensor_shape(tensor)
-
-        # 2. 处理模型输出
-        for tensor in self.graph_proto.output:
-            shape_mapping[tensor.name] = parse_tensor_shape(tensor)
-
-        # 3. 处理中间张量（value_info/tensor_value_info）
-        for tensor in self.graph_proto.value_info:
-            shape_mapping[tensor.name] = parse_tensor_shape(tensor)
-
-        return shape_mapping
+        # 形状来自 gs 张量（导入时读取 graph input/output/value_info）：
+        # 静态维度为 int，动态维度为 dim_param 字符串，未知维度为 None
+        return {name: self.get_output_shape_by_name(name) for name in self.tensors}
             
     def get_output_shape_by_name(self, name : str) -> List:
-        assert self.output_shape, f"tensor shape is {self.output_shape}"
-        return self.output_shape[name]
+        shape = self.tensors[name].shape
+        return list(shape) if shape is not None else []
 
     def get_node_by_id(self, node_id: int) -> Optional[ONNXNode]:
         return self.nodes.get(node_id)
 
+    def get_node_by_name(self, name: str) -> Optional[ONNXNode]:
+        node_id = self.name_index.get(name)
+        return self.nodes.get(node_id) if node_id is not None else None
+
+    def node_of(self, gs_node: gs.Node) -> Optional[ONNXNode]:
+        """the view node wrapping `gs_node`, None if it is not (or no longer) in the view."""
+        node_id = self._gs_ids.get(id(gs_node))
+        return self.nodes.get(node_id) if node_id is not None else None
+
     def get_nodes_by_op_type(self, op_type: str) -> List[ONNXNode]:
-        return [node for node in self.nodes.values() if node.is_op(op_type)]
+        return list(self.op_index.get(op_type, {}).values())
+
+    def get_producer(self, tensor_name: str) -> Optional[ONNXNode]:
+        producers = self.name_to_nodes.get(tensor_name)
+        return producers[0] if producers else None
+
+    def get_consumers(self, tensor_name: str) -> List[ONNXNode]:
+        """nodes reading `tensor_name`, each once, in the order they entered the view."""
+        return list(self.consumers.get(tensor_name, ()))
 
     def get_predecessors(self, node: ONNXNode) -> List[ONNXNode]:
-        pred_ids = self.graph.predecessors(node.id)
-        return [self.get_node_by_id(pid) for pid in pred_ids if self.get_node_by_id(pid)]
+        node_list = self.node_list
+        return [node_list[idx] for idx in self.adjacency.predecessors(node.id)]
 
     def get_successors(self, node: ONNXNode) -> List[ONNXNode]:
-        succ_ids = self.graph.successors(node.id)
-        return [self.get_node_by_id(sid) for sid in succ_ids if self.get_node_by_id(sid)]
+        node_list = self.node_list
+        return [node_list[idx] for idx in self.adjacency.successors(node.id)]
 
-    def topological_sort(self) -> List[ONNXNode]: 
+    def topological_sort(self, nodes: Optional[Iterable[ONNXNode]] = None) -> List[ONNXNode]:
+        """topological order of the whole graph, or of the subgraph induced by `nodes`."""
         try:
-            sorted_ids = list(nx.topological_sort(self.graph))
-            return [self.get_node_by_id(nid) for nid in sorted_ids if self.get_node_by_id(nid)]
-        except nx.NetworkXUnfeasible:
+            if nodes is None:
+                order = self.adjacency.topological_order()
+            else:
+                order = self.adjacency.subgraph_order(node.id for node in nodes)
+            return [self.node_list[idx] for idx in order]
+        except ValueError:
             logger.warning("Graph contains a cycle, cannot perform topological sort.")
-            return list(self.nodes.values())
+            return list(self.nodes.values()) if nodes is None else list(nodes)
+
+    def neighborhood(self, nodes: Iterable[ONNXNode], radius: int) -> List[ONNXNode]:
+        """nodes within `radius` edges of `nodes`, following edges in both directions."""
+        adjacency = self.adjacency
+        seen = {node.id for node in nodes if node.id in self.nodes}
+        queue = deque((idx, 0) for idx in seen)
+        while queue:
+            idx, dist = queue.popleft()
+            if dist == radius:
+                continue
+            for other in adjacency.predecessors(idx) + adjacency.successors(idx):
+                if other not in seen:
+                    seen.add(other)
+                    queue.append((other, dist + 1))
+        return [self.node_list[idx] for idx in sorted(seen)]
 
     def remove_node(self, node: ONNXNode):
         if node.id in self.nodes:
-            del self.nodes[node.id]
-            self.graph.remove_node(node.id)
-
-            # 更新 name_to_nodes
-            for output in node.outputs:
-                if output in self.name_to_nodes:
-                    self.name_to_nodes[output] = [n for n in self.name_to_nodes[output] if n.id != node.id]
-                    if not self.name_to_nodes[output]:
-                        del self.name_to_nodes[output]
+            self._unregister(node)
+            self.adjacency.remove(node.id)
+
+    def add_node(self, gs_node: gs.Node) -> ONNXNode:
+        """add a node that a builder inserted into gs_graph, with the edges to its producers and consumers."""
+        idx = self.adjacency.add_node()
+        node = ONNXNode(gs_node, idx)
+        self._register(node)
+
+        for tensor in gs_node.inputs + gs_node.outputs:
+            self.tensors[tensor.name] = tensor
+            if isinstance(tensor, gs.Constant):
+                self.initializers.add(tensor)
+
+        for inp in node.inputs:
+            for prev_node in self.name_to_nodes.get(inp, ()):
+                if prev_node.id != node.id:
+                    self.adjacency.add_edge(prev_node.id, idx)
+        for output in node.outputs:
+            for consumer in self.consumers.get(output, ()):
+                if consumer.id != idx:
+                    self.adjacency.add_edge(idx, consumer.id)
+        if self.shape_inference is not None:
+            self.shape_inference.propagate([gs_node])
+        return node
+
+    def sync(self) -> List[ONNXNode]:
+        """
+            Bring the view up to date after gs_graph was rewritten (fusion + cleanup) without
+            rebuilding it: nodes that left gs_graph are removed, new gs nodes are added.
+            Returns the changed frontier, i.e. the new nodes and the surviving neighbors of the
+            removed ones: the only places where a new match can appear.
+        """
+        self.output_names = frozenset(tensor.name for tensor in self.gs_graph.outputs)
+        live = {id(gs_node): gs_node for gs_node in self.gs_graph.nodes}
+        removed = [node for node in self.nodes.values() if id(node.node) not in live]
+        frontier: Dict[int, ONNXNode] = {}
+        for node in removed:
+            for other in self.get_predecessors(node) + self.get_successors(node):
+                frontier[other.id] = other
+        for node in removed:
+            self.remove_node(node)
+            frontier.pop(node.id, None)
+        for key, gs_node in live.items():
+            if key not in self._gs_ids:
+                node = self.add_node(gs_node)
+                frontier[node.id] = node
+        logger.debug(f"Synced graph view: -{len(removed)} nodes, {len(frontier)} changed")
+        return list(frontier.values())
+
+    def to_networkx(self):
+        """
+            Export the graph as a networkx.DiGraph (node.id keyed, op_type / tensor attributes), for debugging.
+            networkx is only needed when this is called.
+        """
+        import networkx as nx
+
+        digraph = nx.DiGraph()
+        for node in self.nodes.values():
+            digraph.add_node(node.id, op_type=node.op_type)
+        for node in self.nodes.values():
+            for inp in node.inputs:
+                for prev_node in self.name_to_nodes.get(inp, ()):
+                    if not digraph.has_edge(prev_node.id, node.id):
+                        digraph.add_edge(prev_node.id, node.id, tensor=inp)
+        return digraph
     
     @staticmethod             
     def name_onnx_nodes(onnx_model_proto):
@@ -140,4 +273,4 @@ class ONNXGraph:
                 logger.debug(f"Renaming node to {new_name}")
 
     def __repr__(self):
-        return f"ONNXGraph(nodes={len(self.nodes)}, edges={self.graph.number_of_edges()})"
\ No newline at end of file
+        return f"ONNXGraph(nodes={len(self.nodes)}, edges={self.adjacency.num_edges})"
\ No newline at end of file
@@ -1,3 +1,4 @@
+import os
 import onnx
 import logging
 import onnx_graphsurgeon as gs
@@ -5,44 +6,164 @@ import onnx_graphsurgeon as gs
 from onnx import ModelProto
 from typing import Optional
 from .onnx_graph import ONNXGraph
+from .external_data import ExternalDataMapper, ExternalDataWriter
+from .serialization import export_skeleton, save_streaming, constant_nbytes
+
+# protobuf 不能序列化超过 2GB 的消息
+_PROTOBUF_LIMIT = 2 ** 31 - 1
 
 logger = logging.getLogger(__name__)
+
+# model level fields that gs.import_onnx does not carry over to the gs.Graph
+_MODEL_META_FIELDS = ("domain", "model_version", "doc_string")
+
+# attribute types gs.import_onnx skips. They are kept on the gs node as the protos
+# onnx.helper.get_attribute_value returns, which gs exports back through make_attribute
+_GS_SKIPPED_ATTRS = frozenset({
+    onnx.AttributeProto.GRAPHS, onnx.AttributeProto.TENSORS,
+    onnx.AttributeProto.SPARSE_TENSOR, onnx.AttributeProto.SPARSE_TENSORS,
+    onnx.AttributeProto.TYPE_PROTO, onnx.AttributeProto.TYPE_PROTOS,
+})
+
+
+def _nodes_with_skipped_attrs(graph: onnx.GraphProto):
+    for node in graph.node:
+        if any(attr.type in _GS_SKIPPED_ATTRS for attr in node.attribute):
+            yield node
+        for attr in node.attribute:
+            if attr.type == onnx.AttributeProto.GRAPH:
+                yield from _nodes_with_skipped_attrs(attr.g)
+
+
+def _restore_skipped_attrs(graph: onnx.GraphProto, gs_graph: gs.Graph):
+    # gs imports the nodes of a graph in proto order
+    for node, gs_node in zip(graph.node, gs_graph.nodes):
+        for attr in node.attribute:
+            if attr.type in _GS_SKIPPED_ATTRS:
+                gs_node.attrs[attr.name] = onnx.helper.get_attribute_value(attr)
+            elif attr.type == onnx.AttributeProto.GRAPH and isinstance(gs_node.attrs.get(attr.name), gs.Graph):
+                _restore_skipped_attrs(attr.g, gs_node.attrs[attr.name])
+
+
+def import_graph(onnx_model_proto: ModelProto) -> gs.Graph:
+    """gs.import_onnx, keeping the attributes gs cannot represent instead of dropping them."""
+    nodes = list(_nodes_with_skipped_attrs(onnx_model_proto.graph))
+    if not nodes:
+        return gs.import_onnx(onnx_model_proto)
+    # 先临时去掉这些属性，避免 gs 逐个告警跳过，导入后原样放回
+    saved = [list(node.attribute) for node in nodes]
+    for node, attributes in zip(nodes, saved):
+        kept = [attr for attr in attributes if attr.type not in _GS_SKIPPED_ATTRS]
+        del node.attribute[:]
+        node.attribute.extend(kept)
+    try:
+        gs_graph = gs.import_onnx(onnx_model_proto)
+    finally:
+        for node, attributes in zip(nodes, saved):
+            del node.attribute[:]
+            node.attribute.extend(attributes)
+    _restore_skipped_attrs(onnx_model_proto.graph, gs_graph)
+    logger.debug(f"Kept attributes unsupported by onnx-graphsurgeon on {len(nodes)} nodes")
+    return gs_graph
+
 class ONNXModel:
     '''
-        onnx_model_proto: generated by onnx.load()
-        digraph: directed graph for pattern matching and optimization
-        gs_graph: graphsurgeon graph for fusion and manipulation 
-    
+        gs_graph: graphsurgeon graph, the single IR shared by pattern matching and fusion
+        digraph: ONNXGraph view over gs_graph used for pattern matching
+
+        The ModelProto is only used to import the graph and is not kept: initializer bytes
+        are held once by the gs constants, and a ModelProto is only exported again on save.
+        external_data: memory maps of the external data files the gs constants point into
     '''
-    def __init__(self, onnx_model_proto: Optional[ModelProto] = None):
-        self.onnx_model_proto = onnx_model_proto 
-        self.digraph: Optional[ONNXGraph] = ONNXGraph(onnx_model_proto.graph) if onnx_model_proto else None
-        self.gs_graph = gs.import_onnx(onnx_model_proto) if onnx_model_proto else None 
+    def __init__(self, onnx_model_proto: Optional[ModelProto] = None,
+                 external_data: Optional[ExternalDataMapper] = None, infer_shapes: bool = True):
+        self.gs_graph: Optional[gs.Graph] = import_graph(onnx_model_proto) if onnx_model_proto else None
+        self.external_data = external_data
+        if self.gs_graph and external_data:
+            external_data.attach(self.gs_graph)
+        self.infer_shapes = infer_shapes
+        self.digraph: Optional[ONNXGraph] = ONNXGraph(self.gs_graph, infer_shapes=infer_shapes) if self.gs_graph else None
+        self.model_meta = ModelProto()
+        if onnx_model_proto:
+            for field in _MODEL_META_FIELDS:
+                setattr(self.model_meta, field, getattr(onnx_model_proto, field))
+            self.model_meta.metadata_props.extend(onnx_model_proto.metadata_props)
 
     @classmethod
-    def load(cls, path: str) -> 'ONNXModel':
+    def load(cls, path: str, mmap_external_data: bool = True, infer_shapes: bool = True) -> 'ONNXModel':
+        """
+            mmap_external_data: load only the graph structure and memory-map external data files,
+            instead of reading every external initializer into memory
+            infer_shapes: infer the tensor shapes missing from the model's value_info
+        """
         logger.info(f"Loading ONNX model from {path}")
-        onnx_model_proto = onnx.load(path)
+        if not mmap_external_data:
+            onnx_model_proto = onnx.load(path)
+            ONNXGraph.name_onnx_nodes(onnx_model_proto)
+            return cls(onnx_model_proto, infer_shapes=infer_shapes)
+
+        onnx_model_proto = onnx.load(path, load_external_data=False)
         ONNXGraph.name_onnx_nodes(onnx_model_proto)
-        
-        return cls(onnx_model_proto)
+        return cls(onnx_model_proto, external_data=ExternalDataMapper(os.path.dirname(os.path.abspath(path))),
+                   infer_shapes=infer_shapes)
+
+    def _export_skeleton(self):
+        model_proto, initializers = export_skeleton(self.gs_graph)
+        for field in _MODEL_META_FIELDS:
+            setattr(model_proto, field, getattr(self.model_meta, field))
+        model_proto.metadata_props.extend(self.model_meta.metadata_props)
+        return model_proto, initializers
+
+    def to_proto(self) -> Optional[ModelProto]:
+        """export a full ModelProto, this copies every initializer."""
+        if not self.gs_graph:
+            return None
+        model_proto, initializers = self._export_skeleton()
+        model_proto.graph.initializer.extend(initializers)
+        return model_proto
 
-    def save(self, path: str):
-        if not self.onnx_model_proto:
+    def save(self, path: str, external_data: bool = False, size_threshold: int = 1024,
+             shard_size: Optional[int] = None):
+        """
+            external_data: store initializers of at least `size_threshold` bytes in external data
+                files next to `path`, split into shards of at most `shard_size` bytes (None = one file).
+                Switched on automatically when the initializers do not fit in a 2GB protobuf.
+        """
+        if not self.gs_graph:
             logger.error("Cannot save empty model.")
             return False
         logger.info(f"Saving optimized ONNX model to {path}")
-        onnx.save(self.onnx_model_proto, path)
+        # initializers are streamed to the file instead of being copied into a new ModelProto
+        model_proto, constants = self._export_skeleton()
+        if not external_data:
+            total_bytes = sum(constant_nbytes(constant) for constant in constants)
+            if total_bytes + model_proto.ByteSize() >= _PROTOBUF_LIMIT:
+                logger.warning(f"Initializers take {total_bytes / 2 ** 30:.2f} GB, "
+                               "exceeding the 2GB protobuf limit: saving them as external data.")
+                external_data = True
+
+        writer = None
+        if external_data:
+            writer = ExternalDataWriter(path, size_threshold=size_threshold, shard_size=shard_size)
+            target = os.path.join(writer.base_dir, writer.prefix)
+            if self.external_data and any(p.startswith(target) for p in self.external_data.paths):
+                logger.error("Cannot overwrite the external data files the model is mapped from.")
+                return False
+        save_streaming(model_proto, constants, path, writer=writer)
+        if writer is not None:
+            logger.info(f"Wrote external data to {len(writer.shards)} file(s): {writer.shards}")
         return True
 
+    def rebuild_digraph(self) -> Optional[ONNXGraph]:
+        """refresh the matching view after gs_graph has been rewritten."""
+        self.digraph = ONNXGraph(self.gs_graph, infer_shapes=self.infer_shapes) if self.gs_graph else None
+        return self.digraph
+
     def get_digraph(self) -> Optional[ONNXGraph]:
         return self.digraph
-    
+
     def get_gs_graph(self) -> Optional[gs.Graph]:
         return self.gs_graph
-    
-    def update_onnx_model_proto(self, new_model_proto: ModelProto):
-        self.onnx_model_proto = new_model_proto
 
     def __repr__(self):
-        return f"ONNXModel(ir_version={self.onnx_model_proto.ir_version if self.onnx_model_proto else None}, graph={self.digraph})"
\ No newline at end of file
+        return f"ONNXModel(ir_version={self.gs_graph.ir_version if self.gs_graph else None}, graph={self.digraph})"
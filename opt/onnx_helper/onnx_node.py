@@ -1,43 +1,46 @@
-from onnx import NodeProto
-from typing import Dict, Any, List, Optional
+import onnx
+import onnx_graphsurgeon as gs
+
+from typing import Dict, Any, List, Tuple
+from onnx_graphsurgeon.importers.onnx_importer import OnnxImporter
 
 class ONNXNode:
-    def __init__(self, node_proto: NodeProto):
-        self.proto = node_proto
-        self.name = node_proto.name
-        self.id = id(node_proto)  # 使用内存地址作为唯一ID
-        self.op_type = node_proto.op_type
-        self.inputs = list(node_proto.input)
-        self.outputs = list(node_proto.output)
-        self.attrs = self._parse_attrs()
-
-    def _parse_attrs(self) -> Dict[str, Any]:
-        attrs = {}
-        for attr in self.proto.attribute:
-            # 简化版属性解析，仅处理常见类型
-            if attr.HasField('f'):
-                attrs[attr.name] = attr.f
-            elif attr.HasField('i'):
-                attrs[attr.name] = attr.i
-            elif attr.HasField('s'):
-                attrs[attr.name] = attr.s.decode('utf-8')
-            elif attr.HasField('t'):
-                attrs[attr.name] = attr.t
-            elif attr.floats:
-                attrs[attr.name] = list(attr.floats)
-            elif attr.ints:
-                attrs[attr.name] = list(attr.ints)
-        return attrs
+    '''
+        Matching-side wrapper of a gs.Node. id is the dense index the owning ONNXGraph assigned
+        to the node.
+        inputs/outputs are tuples of the gs tensors' names, taken when the node enters the view:
+        builders rewire the gs tensors before the view is synced, and the view unindexes a node
+        by the outputs it was indexed under.
+        attrs is the gs node's own attribute dict, nothing is copied. Attribute types that
+        gs.import_onnx skips are kept as protos by ONNXModel and decoded by get_attr on access.
+    '''
+    __slots__ = ("node", "id", "name", "op_type", "inputs", "outputs")
+
+    def __init__(self, gs_node: gs.Node, node_id: int):
+        self.node = gs_node
+        self.name: str = gs_node.name
+        self.id: int = node_id  # 稠密下标：按 gs_graph.nodes 顺序分配，新节点追加在后，删除后不复用
+        self.op_type: str = gs_node.op
+        self.inputs: Tuple[str, ...] = tuple([tensor.name for tensor in gs_node.inputs])
+        self.outputs: Tuple[str, ...] = tuple([tensor.name for tensor in gs_node.outputs])
+
+    @property
+    def attrs(self) -> Dict[str, Any]:
+        return self.node.attrs
 
     def get_attr(self, name: str, default: Any = None) -> Any:
-        return self.attrs.get(name, default)
+        value = self.node.attrs.get(name, default)
+        # TENSORS 按 TENSOR 的方式解析成（延迟加载的）gs.Constant；GRAPHS / SPARSE_TENSOR / TYPE_PROTO 保持 proto
+        if isinstance(value, list) and value and isinstance(value[0], onnx.TensorProto):
+            return [OnnxImporter.import_tensor(tensor) for tensor in value]
+        return value
 
     def is_op(self, op_type: str) -> bool:
         return self.op_type == op_type
-    
+
     def has_intersection(self, list1: List) -> bool:
         return bool(set(self.inputs) & set(list1)) or False
 
     def __repr__(self):
-        return f"ONNXNode(id={self.id}, op={self.op_type}, inputs={self.inputs}, outputs={self.outputs})"
-    
\ No newline at end of file
+        return f"ONNXNode(id={self.id}, op={self.op_type}, inputs={list(self.inputs)}, outputs={list(self.outputs)})"
+
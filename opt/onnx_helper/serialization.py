@@ -0,0 +1,143 @@
+import onnx
+import logging
+import onnx_graphsurgeon as gs
+
+from onnx import ModelProto, TensorProto
+from onnx_graphsurgeon.exporters.onnx_exporter import OnnxExporter, update_import_domains
+from onnx_graphsurgeon.ir.tensor import SparseValues
+from typing import List, Optional, Tuple
+from .external_data import ExternalDataWriter, MappedValues, inline_tensor, tensor_payload
+
+logger = logging.getLogger(__name__)
+
+# protobuf tags (field_number << 3 | wire type 2) of ModelProto.graph and GraphProto.initializer
+_MODEL_GRAPH_TAG = bytes([(7 << 3) | 2])
+_GRAPH_INITIALIZER_TAG = bytes([(5 << 3) | 2])
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def export_skeleton(graph: gs.Graph) -> Tuple[ModelProto, List[gs.Constant]]:
+    """
+    Export a gs.Graph as a ModelProto without dense initializers, plus the dense constants.
+
+    Same as gs.export_onnx, except the dense initializers are returned separately instead of
+    being copied into the GraphProto; see `initializer_proto` to export one of them.
+    """
+    nodes = [OnnxExporter.export_node(node) for node in graph.nodes]
+    inputs = [OnnxExporter.export_value_info_proto(inp, True) for inp in graph.inputs]
+    outputs = [OnnxExporter.export_value_info_proto(out, True) for out in graph.outputs]
+
+    tensor_map = graph.tensors()
+    constants = []
+    sparse_initializers = []
+    for tensor in tensor_map.values():
+        if not isinstance(tensor, gs.Constant):
+            continue
+        if isinstance(tensor._values, SparseValues):
+            sparse_initializers.append(OnnxExporter.export_sparse_tensor_proto(tensor))
+        else:
+            constants.append(tensor)
+
+    for tensor in graph.inputs + graph.outputs:
+        tensor_map.pop(tensor.name, None)
+    value_info = [
+        OnnxExporter.export_value_info_proto(tensor, True)
+        for tensor in tensor_map.values()
+        if isinstance(tensor, gs.Variable) and (tensor.dtype is not None or tensor.shape is not None)
+    ]
+
+    graph_proto = onnx.helper.make_graph(
+        nodes=nodes,
+        name=graph.name,
+        inputs=inputs,
+        outputs=outputs,
+        sparse_initializer=sparse_initializers,
+        doc_string=graph.doc_string,
+        value_info=value_info,
+    )
+    model = onnx.helper.make_model(
+        graph_proto,
+        opset_imports=update_import_domains(graph),
+        functions=[OnnxExporter.export_function(func) for func in graph.functions],
+    )
+    model.producer_name = graph.producer_name
+    model.producer_version = graph.producer_version
+    if graph.ir_version is not None:
+        model.ir_version = graph.ir_version
+    return model, constants
+
+
+def constant_nbytes(constant: gs.Constant) -> int:
+    values = constant._values
+    return values.length if isinstance(values, MappedValues) else int(values.nbytes)
+
+
+def initializer_proto(constant: gs.Constant, writer: Optional[ExternalDataWriter] = None,
+                      materialize: bool = True) -> TensorProto:
+    """
+    TensorProto to store for `constant`. Constants still backed by the imported TensorProto
+    are returned as that proto, so untouched inline weights are never copied; memory-mapped
+    weights are copied straight from the mapping into `writer`'s shards. Without a writer they
+    are inlined, unless `materialize` is False, in which case their external header is returned.
+    """
+    tensor = OnnxExporter.export_tensor_proto(constant)
+    values = constant._values
+    if writer is not None and writer.wants(tensor, constant_nbytes(constant)):
+        return writer.write(tensor, tensor_payload(tensor, values))
+    if isinstance(values, MappedValues) and materialize:
+        return inline_tensor(tensor, values.view())
+    return tensor
+
+
+def save_streaming(model: ModelProto, constants: List[gs.Constant], path: str,
+                   writer: Optional[ExternalDataWriter] = None):
+    """
+    Write `model` with the initializers of `constants` appended to its graph, one tensor at a time.
+
+    The output is a regular serialized ModelProto (protobuf merges repeated fields across
+    occurrences), but the full model is never materialized: peak memory is the skeleton
+    plus the largest single initializer. With a `writer`, large payloads go to its
+    external data shards and only their headers are written here.
+    """
+    # memory-mapped tensors kept inline are only copied out of the mapping while being written
+    entries = []
+    for constant in constants:
+        tensor = initializer_proto(constant, writer, materialize=False)
+        values = constant._values
+        if isinstance(values, MappedValues) and tensor is values.tensor:
+            header = inline_tensor(tensor, b"")
+            header.ClearField("raw_data")
+            size = header.ByteSize() + 1 + len(_varint(values.length)) + values.length
+            entries.append((None, size, values))
+        else:
+            entries.append((tensor, tensor.ByteSize(), None))
+    if writer is not None:
+        writer.close()
+
+    graph_bytes = model.graph.SerializeToString()
+    graph_len = len(graph_bytes) + sum(1 + len(_varint(size)) + size for _, size, _ in entries)
+
+    head = ModelProto()
+    head.CopyFrom(model)
+    head.ClearField("graph")
+    with open(path, "wb") as f:
+        f.write(head.SerializeToString())
+        f.write(_MODEL_GRAPH_TAG + _varint(graph_len))
+        f.write(graph_bytes)
+        for tensor, size, mapped in entries:
+            if tensor is None:
+                tensor = inline_tensor(mapped.tensor, mapped.view())
+            f.write(_GRAPH_INITIALIZER_TAG + _varint(size))
+            f.write(tensor.SerializeToString())
+    logger.debug(f"Wrote {len(entries)} initializers ({graph_len} graph bytes) to {path}")
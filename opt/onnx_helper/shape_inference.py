@@ -0,0 +1,191 @@
+import onnx
+import logging
+import numpy as np
+import onnx_graphsurgeon as gs
+
+from collections import deque
+from onnx import defs, helper, numpy_helper, shape_inference
+from onnx_graphsurgeon.exporters.onnx_exporter import OnnxExporter, dtype_to_onnx
+from onnx_graphsurgeon.ir.tensor import LazyValues
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# 维度约定与 gs 导入 value_info 一致：静态维度为 int，符号维度为 dim_param 字符串，未知维度为 None
+Dim = Union[int, str, None]
+# (dtype, shape) of one output, shape None when even the rank is unknown
+TensorType = Tuple[Any, Optional[List[Dim]]]
+ShapeFunction = Callable[[gs.Node], List[Optional[TensorType]]]
+
+# constant inputs up to this many elements are given to onnx as data (Reshape shape, Slice starts...)
+_MAX_DATA_ELEMENTS = 64
+
+
+def _known(tensor: gs.Tensor) -> bool:
+    return tensor.is_empty() or (tensor.dtype is not None and tensor.shape is not None)
+
+
+def _freeze(value: Any):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (int, float, str, bool)) or value is None:
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError  # tensors, graphs: not worth a cache key
+
+
+def _constant_array(constant: gs.Constant) -> np.ndarray:
+    # 不通过 constant.values，避免把延迟加载的常量整体读入并留在 gs 图里
+    values = constant._values
+    return values.load() if isinstance(values, LazyValues) else np.asarray(values)
+
+
+class ShapeInference:
+    '''
+        Fills in the dtype and shape of the gs tensors the model does not annotate, one node at
+        a time: shape functions registered for custom ops (see `register`), the onnx operator
+        schemas (onnx.shape_inference.infer_node_outputs) for everything else.
+
+        The inferred types are written to the gs tensors, so they end up in the saved value_info
+        and are never inferred again, and existing annotations are never overwritten. Symbolic
+        dims pass through as their dim_param strings. Results are cached per (op, attributes,
+        input types, small constant inputs), so the repeated blocks of a model are inferred once.
+    '''
+    SHAPE_FUNCTIONS: Dict[str, ShapeFunction] = {}
+
+    @classmethod
+    def register(cls, op_type: str):
+        """decorator registering fn(gs_node) -> [(dtype, shape) or None per output] for `op_type`."""
+        def wrapper(func: ShapeFunction) -> ShapeFunction:
+            cls.SHAPE_FUNCTIONS[op_type] = func
+            return func
+        return wrapper
+
+    def __init__(self, gs_graph: gs.Graph):
+        self.gs_graph = gs_graph
+        self._cache: Dict[tuple, List[Optional[TensorType]]] = {}
+        # id(constant) -> (constant, small array or None), the constant is held so that its id is not reused
+        self._constant_data: Dict[int, Tuple[gs.Constant, Optional[np.ndarray]]] = {}
+        self._opsets = [helper.make_opsetid(domain, version) for domain, version in
+                        ([("", gs_graph.opset)] + [(d.domain, d.version) for d in gs_graph.import_domains or ()
+                                                   if d.domain not in ("", "ai.onnx")])]
+        self._versions = {opset.domain: opset.version for opset in self._opsets}
+        self.num_inferred = 0
+        self.cache_hits = 0
+
+    def propagate(self, gs_nodes: Iterable[gs.Node]) -> int:
+        """
+            Infer the untyped outputs of `gs_nodes`, given in topological order, then of their
+            consumers while new types keep appearing. Returns the number of nodes inferred.
+        """
+        queue = deque(gs_nodes)
+        queued = {id(node) for node in queue}
+        inferred = 0
+        while queue:
+            node = queue.popleft()
+            queued.discard(id(node))
+            outputs = [tensor for tensor in node.outputs if not _known(tensor)]
+            if not outputs or not all(_known(tensor) for tensor in node.inputs):
+                continue
+            if not self._infer(node):
+                continue
+            inferred += 1
+            for tensor in outputs:
+                for consumer in tensor.outputs:
+                    if id(consumer) not in queued:
+                        queued.add(id(consumer))
+                        queue.append(consumer)
+        self.num_inferred += inferred
+        if inferred:
+            logger.debug(f"Inferred output types of {inferred} nodes ({self.cache_hits} cache hits so far)")
+        return inferred
+
+    def _infer(self, node: gs.Node) -> bool:
+        key = self._key(node)
+        types = self._cache.get(key) if key is not None else None
+        if types is not None:
+            self.cache_hits += 1
+        else:
+            func = self.SHAPE_FUNCTIONS.get(node.op)
+            try:
+                types = func(node) if func is not None else self._infer_onnx(node)
+            except Exception as e:
+                logger.debug(f"Shape inference failed for {node.op} node {node.name}: {e}")
+                types = None
+            if types is None:
+                return False
+            if key is not None:
+                self._cache[key] = types
+        changed = False
+        for tensor, inferred in zip(node.outputs, types):
+            if inferred is None or tensor.is_empty() or isinstance(tensor, gs.Constant):
+                continue
+            dtype, shape = inferred
+            if tensor.dtype is None and dtype is not None:
+                tensor.dtype = dtype
+                changed = True
+            if tensor.shape is None and shape is not None:
+                tensor.shape = list(shape)
+                changed = True
+        return changed
+
+    def _data(self, tensor: gs.Tensor) -> Optional[np.ndarray]:
+        if not isinstance(tensor, gs.Constant):
+            return None
+        entry = self._constant_data.get(id(tensor))
+        if entry is None:
+            small = tensor.shape is not None and int(np.prod(tensor.shape)) <= _MAX_DATA_ELEMENTS
+            entry = (tensor, _constant_array(tensor) if small else None)
+            self._constant_data[id(tensor)] = entry
+        return entry[1]
+
+    def _key(self, node: gs.Node) -> Optional[tuple]:
+        try:
+            attrs = tuple(sorted((name, _freeze(value)) for name, value in node.attrs.items()))
+            inputs = []
+            for tensor in node.inputs:
+                data = self._data(tensor)
+                shape = None if tensor.shape is None else tuple(tensor.shape)  # 常量的 shape 可能是 proto 的 dims
+                inputs.append((tensor.dtype, _freeze(shape),
+                               None if data is None else (data.dtype.str, data.tobytes())))
+        except TypeError:
+            return None
+        return (node.op, node.domain, attrs, tuple(inputs))
+
+    def _infer_onnx(self, node: gs.Node) -> Optional[List[Optional[TensorType]]]:
+        domain = node.domain or ""
+        try:
+            schema = defs.get_schema(node.op, self._versions.get(domain, self.gs_graph.opset), domain)
+        except defs.SchemaError:
+            return None
+        node_proto = OnnxExporter.export_node(node)
+        input_types, input_data = {}, {}
+        for tensor in node.inputs:
+            if tensor.is_empty():
+                continue
+            input_types[tensor.name] = helper.make_tensor_type_proto(dtype_to_onnx(tensor.dtype), tensor.shape)
+            data = self._data(tensor)
+            if data is not None:
+                input_data[tensor.name] = numpy_helper.from_array(data, tensor.name)
+        types = shape_inference.infer_node_outputs(schema, node_proto, input_types, input_data=input_data,
+                                                   opset_imports=self._opsets)
+        return [self._from_type_proto(types.get(tensor.name)) for tensor in node.outputs]
+
+    @staticmethod
+    def _from_type_proto(type_proto: Optional[onnx.TypeProto]) -> Optional[TensorType]:
+        if type_proto is None or not type_proto.HasField("tensor_type"):
+            return None
+        tensor_type = type_proto.tensor_type
+        dtype = None
+        if tensor_type.elem_type != onnx.TensorProto.UNDEFINED:
+            try:
+                dtype = np.dtype(helper.tensor_dtype_to_np_dtype(tensor_type.elem_type))
+            except (KeyError, TypeError):
+                dtype = tensor_type.elem_type
+        shape = None
+        if tensor_type.HasField("shape"):
+            shape = [dim.dim_value if dim.HasField("dim_value") else
+                     dim.dim_param if dim.HasField("dim_param") else None
+                     for dim in tensor_type.shape.dim]
+        return dtype, shape
@@ -1,9 +1,10 @@
 import logging
 
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from .onnx_helper import ONNXModel 
 from .graph_matcher import GraphMatcher
 from .fusion_executor import FusionExecutor
+from .pass_manager import PassManager
 from .config import Config, default_config
 
 logger = logging.getLogger(__name__)
@@ -12,11 +13,25 @@ class ONNXOptimizer:
     def __init__(self, config: Optional[Config] = None):
         self.config = config or default_config
         self.model: Optional[ONNXModel] = None
-        self.matcher = GraphMatcher()
-        self.executor = FusionExecutor()
+        self.matcher = GraphMatcher(memoize=self.config.match_memo, profile=self.config.profile_matching,
+                                    workers=self.config.match_workers,
+                                    overlap_resolution=self.config.overlap_resolution)
+        self.executor = FusionExecutor(batched=self.config.batch_fusion,
+                                       validate_every=self.config.validate_every,
+                                       verify_folding=self.config.verify_folding,
+                                       target=self.config.target)
+        self.pass_manager = PassManager(self.config.passes, self.config.disabled_passes)
+        # per-pass and per-fusion-round statistics of the last optimize()
+        self.pass_stats: List[Dict[str, Any]] = []
+        self.round_stats: List[Dict[str, Any]] = []
+        # nodes folded (or skipped, with the reason) by the last constant folding
+        self.folding_report: List[Dict[str, Any]] = []
+        # merged nodes and removed nodes / initializer bytes of the last CSE
+        self.cse_stats: Dict[str, int] = {}
 
     def load_model(self, onnx_path: str) -> bool: 
-        self.model = ONNXModel.load(onnx_path)
+        self.model = ONNXModel.load(onnx_path, mmap_external_data=self.config.mmap_external_data,
+                                    infer_shapes=self.config.infer_shapes)
         digraph  = self.model.get_digraph()
         gs_graph = self.model.get_gs_graph() 
         if digraph and gs_graph:
@@ -29,29 +44,27 @@ class ONNXOptimizer:
             return False 
 
     def optimize(self) -> bool:
+        """
+            Run the pass pipeline (config.passes without config.disabled_passes), see PassManager.
+            Per-pass statistics go to pass_stats, per-round fusion statistics to round_stats.
+        """
         if not self.model or not self.model.get_digraph():
             logger.error("No model loaded.")
             return False
- 
-        all_success = True 
-        match_results = self.matcher.match_all(allow_overlap=self.config.allow_overlap)
-        
-        if not match_results:
-            logger.info("No matches found, optimization complete.")
-            all_success = False
-        success = self.executor.execute_all(match_results)
-        
-        if not success: 
-            all_success = False 
-        
-        self.model.update_onnx_model_proto(self.executor.get_gs_model_proto())
-            
+
+        self.pass_manager.reset(("digraph", "shapes") if self.config.infer_shapes else ("digraph",))
+        all_success = self.pass_manager.run(self)
+        self.pass_stats = self.pass_manager.stats
+        logger.info("Pass statistics:\n" + self.pass_manager.format_table())
         logger.info(f"Optimization finished. Success: {all_success}")
         return all_success
 
     def save_model(self, path: str):
         if self.model:
-            return self.model.save(path)
+            return self.model.save(path,
+                                   external_data=self.config.external_data,
+                                   size_threshold=self.config.external_data_threshold,
+                                   shard_size=self.config.external_data_shard_size)
         else:
             logger.error("No model to save.")
         return False
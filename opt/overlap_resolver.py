@@ -0,0 +1,137 @@
+import logging
+
+from typing import Dict, List
+from .pattern import MatchResult
+
+logger = logging.getLogger(__name__)
+
+
+class OverlapResolver:
+    '''
+        Chooses a non-overlapping subset of candidate matches with maximum total benefit
+        (Pattern.benefit), instead of keeping whichever match came first.
+
+        Candidates only compete with the ones they share a node with, so the conflict graph
+        is split into connected components, solved independently:
+          - up to `exact_limit` candidates: exact branch and bound on the maximum weight
+            independent set
+          - larger components: greedy by benefit per conflict, then swaps of one candidate
+            against the selected ones it conflicts with while that increases the total benefit
+        Ties go to the higher priority, then to the earlier candidate. The selected matches
+        are returned in candidate order.
+    '''
+    def __init__(self, exact_limit: int = 20, max_swap_passes: int = 8):
+        self.exact_limit = exact_limit
+        self.max_swap_passes = max_swap_passes
+        self.num_components = 0
+        self.num_exact = 0  # components solved exactly by the last resolve
+
+    def resolve(self, candidates: List[MatchResult]) -> List[MatchResult]:
+        benefits = [candidate.pattern.benefit(candidate) for candidate in candidates]
+        conflicts = self._conflicts(candidates)
+        self.num_components = 0
+        self.num_exact = 0
+        selected: List[int] = []
+        for component in self._components(conflicts):
+            self.num_components += 1
+            if len(component) == 1:
+                selected.extend(component)
+                continue
+            # 收益高的优先，其次优先级高的，最后按候选顺序
+            component.sort(key=lambda i: (-benefits[i], -candidates[i].pattern.priority, i))
+            if len(component) <= self.exact_limit:
+                self.num_exact += 1
+                selected.extend(self._exact(component, benefits, conflicts))
+            else:
+                selected.extend(self._heuristic(component, benefits, conflicts))
+        selected.sort()
+        logger.debug(f"Resolved {len(candidates)} candidates in {self.num_components} components "
+                     f"({self.num_exact} solved exactly): kept {len(selected)}, "
+                     f"benefit {sum(benefits[i] for i in selected):.1f}")
+        return [candidates[i] for i in selected]
+
+    @staticmethod
+    def _conflicts(candidates: List[MatchResult]) -> List[List[int]]:
+        owners: Dict[int, List[int]] = {}
+        for i, candidate in enumerate(candidates):
+            for node_id in candidate.node_ids:
+                owners.setdefault(node_id, []).append(i)
+        conflicts = [set() for _ in candidates]
+        for indices in owners.values():
+            for i in indices:
+                conflicts[i].update(indices)
+        for i, others in enumerate(conflicts):
+            others.discard(i)
+        return [sorted(others) for others in conflicts]
+
+    @staticmethod
+    def _components(conflicts: List[List[int]]) -> List[List[int]]:
+        seen = [False] * len(conflicts)
+        components = []
+        for start in range(len(conflicts)):
+            if seen[start]:
+                continue
+            seen[start] = True
+            component, stack = [], [start]
+            while stack:
+                i = stack.pop()
+                component.append(i)
+                for j in conflicts[i]:
+                    if not seen[j]:
+                        seen[j] = True
+                        stack.append(j)
+            components.append(component)
+        return components
+
+    @staticmethod
+    def _exact(component: List[int], benefits: List[float], conflicts: List[List[int]]) -> List[int]:
+        # bitmasks over the position in `component`, which is sorted by preference
+        position = {i: k for k, i in enumerate(component)}
+        masks = [sum(1 << position[j] for j in conflicts[i]) for i in component]
+        weights = [benefits[i] for i in component]
+        # suffix sums bound what the undecided candidates can still add
+        remaining = [0.0] * (len(component) + 1)
+        for k in range(len(component) - 1, -1, -1):
+            remaining[k] = remaining[k + 1] + max(weights[k], 0.0)
+
+        best_weight, best_set = -1.0, 0
+
+        def search(k: int, chosen: int, blocked: int, weight: float):
+            nonlocal best_weight, best_set
+            if weight + remaining[k] <= best_weight:
+                return
+            if k == len(component):
+                best_weight, best_set = weight, chosen
+                return
+            if not blocked >> k & 1:
+                search(k + 1, chosen | 1 << k, blocked | masks[k], weight + weights[k])
+            search(k + 1, chosen, blocked, weight)
+
+        search(0, 0, 0, 0.0)
+        return [i for k, i in enumerate(component) if best_set >> k & 1]
+
+    def _heuristic(self, component: List[int], benefits: List[float], conflicts: List[List[int]]) -> List[int]:
+        rank = {i: k for k, i in enumerate(component)}
+        chosen = set()
+        # benefit per conflicting candidate first (GWMIN), a large match blocking many small ones comes later
+        for i in sorted(component, key=lambda i: (-benefits[i] / (len(conflicts[i]) + 1), rank[i])):
+            if not any(j in chosen for j in conflicts[i]):
+                chosen.add(i)
+        for _ in range(self.max_swap_passes):
+            improved = False
+            for i in component:
+                if i in chosen:
+                    continue
+                blocking = [j for j in conflicts[i] if j in chosen]
+                if benefits[i] > sum(benefits[j] for j in blocking):
+                    chosen.difference_update(blocking)
+                    chosen.add(i)
+                    # take the candidates that only the removed ones were blocking
+                    freed = {j for removed in blocking for j in conflicts[removed]} - chosen
+                    for j in sorted(freed, key=rank.get):
+                        if not any(other in chosen for other in conflicts[j]):
+                            chosen.add(j)
+                    improved = True
+            if not improved:
+                break
+        return list(chosen)
@@ -0,0 +1,133 @@
+import logging
+import multiprocessing as mp
+import onnx
+import os
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .onnx_helper import ONNXGraph, ONNXNode
+from .onnx_helper.external_data import ExternalDataMapper, MappedValues, absolute_header
+from .onnx_helper.onnx_model import import_graph
+from .onnx_helper.serialization import export_skeleton, initializer_proto
+from .pattern import Pattern, MatchResult
+
+logger = logging.getLogger(__name__)
+
+# partitions per worker, so that a slow partition does not leave the other workers idle
+_PARTITIONS_PER_WORKER = 4
+
+# every pattern matching at one anchor, by priority: (pattern name, ids of the matched nodes,
+# inputs, outputs, attrs of the MatchResult)
+Candidates = List[Tuple[str, List[int], List[Any], List[Any], Dict[str, Any]]]
+
+# worker side state, set once per worker by _init_worker
+_graph: Optional[ONNXGraph] = None
+_anchors: Sequence[int] = ()
+_ids: Optional[List[int]] = None  # worker node id -> parent node id, None when they are the same
+_dispatch: Tuple[Dict[str, List[Pattern]], List[Pattern]] = ({}, [])
+_external_data: Optional[ExternalDataMapper] = None  # keeps the worker's mappings open
+
+
+def _init_worker(graph, anchors: Sequence[int], ids: Optional[List[int]] = None):
+    """
+        graph is the parent's ONNXGraph with fork, the serialized model with spawn. The rebuilt
+        view numbers its nodes in gs_graph.nodes order, ids[k] is the parent id of its node k.
+    """
+    global _graph, _anchors, _ids, _dispatch, _external_data
+    from .graph_matcher import GraphMatcher
+    if isinstance(graph, bytes):
+        # 形状已随 skeleton 的 value_info 传入，和父进程保持一致
+        gs_graph = import_graph(onnx.load_from_string(graph))
+        # 外部数据的 location 已是绝对路径，与 worker 的当前目录无关
+        _external_data = ExternalDataMapper(os.getcwd())
+        _external_data.attach(gs_graph)
+        graph = ONNXGraph(gs_graph, infer_shapes=False)
+    _graph = graph
+    _ids = ids
+    if ids is not None:
+        local = {parent_id: node_id for node_id, parent_id in enumerate(ids)}
+        anchors = [local[node_id] for node_id in anchors]
+    _anchors = anchors
+    patterns = sorted(Pattern.REGISTER_PATTERNS.values(), key=lambda p: p.priority, reverse=True)
+    _dispatch = GraphMatcher.build_dispatch_table(patterns)
+
+
+def _worker_initializer(constant) -> onnx.TensorProto:
+    """memory-mapped constants go to spawned workers as headers, pointing at their file by absolute path"""
+    tensor = initializer_proto(constant, materialize=False)
+    values = constant._values
+    return absolute_header(tensor, values.path) if isinstance(values, MappedValues) and values.path else tensor
+
+
+def _match_partition(bounds: Tuple[int, int]) -> List[Tuple[int, Candidates]]:
+    graph, ids = _graph, _ids
+    dispatch, wildcard = _dispatch
+    results = []
+    for node_id in _anchors[bounds[0]:bounds[1]]:
+        node = graph.node_list[node_id]
+        candidates = []
+        for pattern in dispatch.get(node.op_type, wildcard):
+            match_result = pattern.match(node, graph)
+            if match_result:
+                matched = [n.id if ids is None else ids[n.id] for n in match_result.matched_nodes]
+                candidates.append((pattern.name, matched,
+                                   match_result.inputs, match_result.outputs, match_result.attrs))
+        if candidates:
+            results.append((node_id if ids is None else ids[node_id], candidates))
+    return results
+
+
+class ParallelMatch:
+    '''
+        Runs the pattern search of GraphMatcher.match_all in a process pool.
+
+        The topologically sorted anchors are split into contiguous partitions. A match may
+        reach past its partition by up to the pattern reach (the halo), so every worker holds
+        the whole matching view: inherited copy-on-write with the fork start method, or
+        deserialized once per worker from the model skeleton otherwise. Tasks and results
+        only carry the parent's dense node ids.
+
+        Workers report, for each anchor, every pattern that matches with its bindings. The
+        matcher then replays its usual loop over these decisions, so priority and overlap
+        rules, and the result order, are exactly the ones of a sequential run; the replayed
+        MatchResults reference the parent's nodes.
+    '''
+    def __init__(self, graph: ONNXGraph, anchors: List[ONNXNode], workers: int):
+        self.graph = graph
+        self.workers = workers
+        self._anchors = [node.id for node in anchors]
+        self._decisions: Dict[Tuple[int, str], tuple] = {}
+
+    def _partitions(self) -> List[Tuple[int, int]]:
+        count = min(len(self._anchors), self.workers * _PARTITIONS_PER_WORKER) or 1
+        size = -(-len(self._anchors) // count)
+        return [(start, min(start + size, len(self._anchors))) for start in range(0, len(self._anchors), size)]
+
+    def run(self):
+        if "fork" in mp.get_all_start_methods():
+            context, initargs = mp.get_context("fork"), (self.graph, self._anchors)
+        else:
+            model_proto, constants = export_skeleton(self.graph.gs_graph)
+            model_proto.graph.initializer.extend(_worker_initializer(c) for c in constants)
+            ids = [self.graph.node_of(gs_node).id for gs_node in self.graph.gs_graph.nodes]
+            context, initargs = mp.get_context("spawn"), (model_proto.SerializeToString(), self._anchors, ids)
+        partitions = self._partitions()
+        with context.Pool(self.workers, initializer=_init_worker, initargs=initargs) as pool:
+            # map keeps the partition order, whichever worker finishes first
+            for results in pool.map(_match_partition, partitions, chunksize=1):
+                for node_id, candidates in results:
+                    for candidate in candidates:
+                        self._decisions[(node_id, candidate[0])] = candidate[1:]
+        logger.debug(f"Matched {len(self._anchors)} anchors in {len(partitions)} partitions "
+                     f"with {self.workers} workers, {len(self._decisions)} candidate matches.")
+
+    def match(self, pattern: Pattern, node: ONNXNode, graph: ONNXGraph) -> Optional[MatchResult]:
+        """the match a worker found for (pattern, node), on the parent's nodes."""
+        decision = self._decisions.get((node.id, pattern.name))
+        if decision is None:
+            return None
+        node_ids, inputs, outputs, attrs = decision
+        return MatchResult(pattern=pattern,
+                           matched_nodes=[graph.node_list[i] for i in node_ids],
+                           inputs=inputs,
+                           outputs=outputs,
+                           attrs=attrs)
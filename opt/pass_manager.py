@@ -0,0 +1,116 @@
+import time
+import logging
+
+from typing import Any, Dict, Iterable, List, Optional, Set
+from .passes import Pass, ANALYSES
+from .utils import get_peak_rss_mb
+
+logger = logging.getLogger(__name__)
+
+# analyses that are computed from another one, and go stale with it
+_DERIVED = {"shapes": ("digraph",)}
+
+
+class PassManager:
+    '''
+        Runs an ordered pipeline of registered passes (Pass.REGISTER_PASSES) on an ONNXOptimizer.
+
+        The manager tracks which analyses are valid. Before a pass runs, its `requires` are
+        recomputed if stale (the matching view is rebuilt, missing shapes are inferred); after
+        a pass that changed the graph, its `invalidates` (and what is derived from them) are
+        dropped. Loading a model builds the view and infers shapes, so both start valid.
+
+        Each pass reports wall time, peak RSS after the pass and its growth during the pass,
+        and the number of nodes added plus removed, in `stats`.
+    '''
+    def __init__(self, passes: Optional[Iterable[str]] = None, disabled: Iterable[str] = ()):
+        """
+            passes: pass names in pipeline order, None for every pass enabled by default in
+                registration order. disabled: names removed from the pipeline.
+        """
+        registered = Pass.REGISTER_PASSES
+        if passes is None:
+            passes = [name for name, p in registered.items() if p.enabled_by_default]
+        passes, disabled = list(passes), set(disabled)
+        unknown = [name for name in passes + sorted(disabled) if name not in registered]
+        if unknown:
+            raise ValueError(f"Unknown pass(es) {unknown}, available: {list(registered)}")
+        self.pipeline: List[Pass] = [registered[name] for name in passes if name not in disabled]
+        self.valid: Set[str] = set()
+        self.stats: List[Dict[str, Any]] = []
+
+    @staticmethod
+    def available() -> List[str]:
+        return list(Pass.REGISTER_PASSES)
+
+    def reset(self, valid: Iterable[str] = ANALYSES):
+        """a model was loaded: `valid` analyses are up to date."""
+        self.valid = set(valid)
+
+    def invalidate(self, analyses: Iterable[str]):
+        stale = set(analyses)
+        stale.update(derived for derived, sources in _DERIVED.items() if stale & set(sources))
+        self.valid -= stale
+
+    def _compute(self, analysis: str, optimizer):
+        for source in _DERIVED.get(analysis, ()):
+            if source not in self.valid:
+                self._compute(source, optimizer)
+        start = time.perf_counter()
+        if analysis == "digraph":
+            # 传入的 pass 可能原地改了节点的输入输出，增量 sync 不够，整体重建
+            optimizer.matcher.set_graph(optimizer.model.rebuild_digraph())
+        elif analysis == "shapes":
+            Pass.REGISTER_PASSES["shape_inference"].run(optimizer)
+        self.valid.add(analysis)
+        logger.info(f"Recomputed analysis '{analysis}' in {time.perf_counter() - start:.3f}s")
+
+    def run(self, optimizer) -> bool:
+        all_success = True
+        self.stats = []
+        for p in self.pipeline:
+            for analysis in p.requires:
+                if analysis not in self.valid:
+                    self._compute(analysis, optimizer)
+            gs_graph = optimizer.model.get_gs_graph()
+            # 持有旧节点的引用，避免 id 被新节点复用
+            before_nodes = list(gs_graph.nodes)
+            rss_before = get_peak_rss_mb()
+            p.modified = False
+            start = time.perf_counter()
+            success = p.run(optimizer)
+            elapsed = time.perf_counter() - start
+            rss_after = get_peak_rss_mb()
+            gs_graph = optimizer.model.get_gs_graph()
+            before_ids = {id(node) for node in before_nodes}
+            after_ids = {id(node) for node in gs_graph.nodes}
+            changed = len(before_ids ^ after_ids)
+            del before_nodes
+            if changed or p.modified:
+                self.invalidate(p.invalidates)
+            self.valid.update(p.provides)
+            all_success = all_success and success
+            stats = {
+                "pass": p.name,
+                "time": elapsed,
+                "peak_rss_mb": rss_after,
+                "rss_growth_mb": rss_after - rss_before if rss_after is not None else None,
+                "nodes": len(after_ids),
+                "nodes_changed": changed,
+                "success": success,
+            }
+            self.stats.append(stats)
+            memory = f", peak RSS {rss_after:.1f} MB (+{stats['rss_growth_mb']:.1f})" if rss_after is not None else ""
+            logger.info(f"Pass '{p.name}': {elapsed:.3f}s{memory}, {changed} nodes changed, "
+                        f"{len(after_ids)} nodes. Success: {success}")
+        return all_success
+
+    def format_table(self) -> str:
+        header = f"{'pass':<20s} {'time(s)':>9s} {'peak RSS(MB)':>13s} {'+RSS(MB)':>9s} {'changed':>8s} {'nodes':>8s}"
+        lines = [header, "-" * len(header)]
+        for s in self.stats:
+            peak = f"{s['peak_rss_mb']:.1f}" if s["peak_rss_mb"] is not None else "-"
+            growth = f"{s['rss_growth_mb']:.1f}" if s["rss_growth_mb"] is not None else "-"
+            lines.append(f"{s['pass']:<20s} {s['time']:>9.3f} {peak:>13s} {growth:>9s} "
+                         f"{s['nodes_changed']:>8d} {s['nodes']:>8d}")
+        return "\n".join(lines)
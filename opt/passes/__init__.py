@@ -0,0 +1,6 @@
+from .base_pass import *
+from .shape_inference import *
+from .constant_folding import *
+from .fusion import *
+from .cse import *
+from .dce import *
@@ -0,0 +1,60 @@
+import logging
+
+from abc import ABC, abstractmethod
+from typing import Dict, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+# 注册的是 Pass 子类，注册时实例化
+PassType = TypeVar("PassType", bound="Pass")
+
+# analyses a pass can require or invalidate:
+#   digraph: the ONNXGraph matching view is in sync with the gs graph
+#   shapes:  every inferable tensor type is annotated (needs the view, see ShapeInference)
+ANALYSES = ("digraph", "shapes")
+
+
+class Pass(ABC):
+    '''
+        One named step of the optimization pipeline, run by the PassManager on an ONNXOptimizer.
+
+        requires: analyses that must be valid before the pass runs, recomputed by the manager if not
+        provides: analyses that are valid after the pass ran
+        invalidates: analyses that are stale once the pass has changed the graph
+        enabled_by_default: the pass is part of the default pipeline (Config.passes)
+
+        The manager detects added and removed nodes itself; a pass that rewires nodes in place
+        sets `modified` in run() so that its invalidations apply.
+    '''
+    REGISTER_PASSES: Dict[str, "Pass"] = dict()
+
+    name: str = ""
+    requires: Tuple[str, ...] = ()
+    provides: Tuple[str, ...] = ()
+    invalidates: Tuple[str, ...] = ()
+    enabled_by_default: bool = True
+    modified: bool = False
+
+    @classmethod
+    def register(cls):
+        def register_func(pass_cls: PassType) -> PassType:
+            if issubclass(pass_cls, cls):
+                if pass_cls.name in cls.REGISTER_PASSES:
+                    logger.warning(f"Pass {pass_cls.name} has been registered, the newer one overrides it.")
+                unknown = set(pass_cls.requires + pass_cls.provides + pass_cls.invalidates) - set(ANALYSES)
+                if unknown:
+                    raise ValueError(f"Pass {pass_cls.name} refers to unknown analyses {sorted(unknown)}")
+                cls.REGISTER_PASSES[pass_cls.name] = pass_cls()
+                logger.debug(f"Pass {pass_cls.name} has been registered.")
+            return pass_cls
+        return register_func
+
+    @abstractmethod
+    def run(self, optimizer) -> bool:
+        """run on optimizer.model, returns False if something went wrong."""
+        NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Pass(name={self.name}, requires={self.requires}, invalidates={self.invalidates})"
+
+
+__all__ = ["Pass", "ANALYSES"]
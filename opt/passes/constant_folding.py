@@ -0,0 +1,392 @@
+import logging
+import numpy as np
+import onnx_graphsurgeon as gs
+
+from onnx import helper
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from .base_pass import Pass
+from ..onnx_helper import InitializerStore
+
+logger = logging.getLogger(__name__)
+
+# evaluator(node, inputs) -> outputs; inputs hold None for omitted optional inputs
+Evaluator = Callable[[gs.Node, List[Optional[np.ndarray]]], Sequence[np.ndarray]]
+
+
+class ConstantFolder:
+    '''
+        Evaluates nodes of the default domain whose inputs are all known with NumPy.
+
+        Inputs are known when they are initializers or outputs of nodes folded before; the output
+        of Shape / Size is also known when the input shape is static. Outputs larger than
+        `max_size` bytes are not folded: the annotated (or inferred) output shape is checked
+        before evaluating, and for ops that expand their inputs (Expand, Tile, ConstantOfShape,
+        Range) the output size is computed from the inputs first, so no large array is built.
+    '''
+    EVALUATORS: Dict[str, Evaluator] = dict()
+
+    @classmethod
+    def register(cls, *op_types: str):
+        def register_func(func: Evaluator) -> Evaluator:
+            for op_type in op_types:
+                cls.EVALUATORS[op_type] = func
+            return func
+        return register_func
+
+    def __init__(self, max_size: int = 1 << 20):
+        self.max_size = max_size
+        # id(tensor) -> value of the tensors folded so far
+        self.values: Dict[int, np.ndarray] = dict()
+
+    def value(self, tensor: gs.Tensor) -> Optional[np.ndarray]:
+        if id(tensor) in self.values:
+            return self.values[id(tensor)]
+        if isinstance(tensor, gs.Constant):
+            return InitializerStore.decode(tensor)
+        return None
+
+    def supports(self, node: gs.Node) -> bool:
+        return node.op in self.EVALUATORS and node.domain in (None, "", "ai.onnx")
+
+    def check(self, node: gs.Node) -> Optional[str]:
+        """reason why a supported node with known inputs cannot be folded, None if it can be evaluated."""
+        if any(isinstance(attr, gs.Graph) for attr in node.attrs.values()):
+            return "has a subgraph"
+        for tensor in node.outputs:
+            size = _static_size(tensor)
+            if size is not None and size > self.max_size:
+                return f"output of {size} bytes exceeds the limit"
+        return None
+
+    def inputs(self, node: gs.Node) -> Optional[List[Optional[np.ndarray]]]:
+        """input values of the node, None if one of them is not known."""
+        if node.op in ("Shape", "Size"):
+            shape = node.inputs[0].shape
+            if id(node.inputs[0]) not in self.values and not isinstance(node.inputs[0], gs.Constant):
+                if shape is None or not all(isinstance(dim, int) and dim >= 0 for dim in shape):
+                    return None
+                # only the shape is needed, stand in a zero-strided array
+                return [np.broadcast_to(np.empty((), dtype=np.uint8), tuple(shape))]
+        values = []
+        for tensor in node.inputs:
+            if tensor.name == "" and not isinstance(tensor, gs.Constant):
+                values.append(None)
+                continue
+            value = self.value(tensor)
+            if value is None:
+                return None
+            values.append(value)
+        return values
+
+    def evaluate(self, node: gs.Node, inputs: List[Optional[np.ndarray]]) -> List[np.ndarray]:
+        """raises ValueError if an output would exceed max_size."""
+        predict = _OUTPUT_SHAPE.get(node.op)
+        if predict is not None:
+            shape = predict(node, inputs)
+            size = int(np.prod(shape, dtype=np.int64)) * _itemsize(node, inputs)
+            if size > self.max_size:
+                raise ValueError(f"output of {size} bytes exceeds the limit")
+        outputs = [np.asarray(output) for output in self.EVALUATORS[node.op](node, inputs)]
+        for tensor, output in zip(node.outputs, outputs):
+            if output.nbytes > self.max_size:
+                raise ValueError(f"output of {output.nbytes} bytes exceeds the limit")
+            if tensor.dtype is not None and _np_dtype(tensor.dtype) not in (None, output.dtype):
+                raise ValueError(f"evaluated dtype {output.dtype} differs from the annotated {tensor.dtype}")
+        return outputs
+
+
+def _np_dtype(dtype) -> Optional[np.dtype]:
+    try:
+        return np.dtype(dtype)
+    except TypeError:
+        return None
+
+
+def _static_size(tensor: gs.Tensor) -> Optional[int]:
+    shape, dtype = tensor.shape, _np_dtype(tensor.dtype) if tensor.dtype is not None else None
+    if shape is None or dtype is None or not all(isinstance(dim, int) for dim in shape):
+        return None
+    return int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+
+
+def _itemsize(node: gs.Node, inputs: List[Optional[np.ndarray]]) -> int:
+    if node.op == "ConstantOfShape":
+        value = node.attrs.get("value")
+        return value.values.dtype.itemsize if value is not None else np.dtype(np.float32).itemsize
+    return inputs[0].dtype.itemsize
+
+
+def _attr_or_input(node: gs.Node, inputs: List[Optional[np.ndarray]], name: str, index: int):
+    """operands that moved from attributes to inputs across opsets (axes, starts, ...)."""
+    if name in node.attrs:
+        return node.attrs[name]
+    if len(inputs) > index and inputs[index] is not None:
+        return inputs[index].tolist()
+    return None
+
+
+def _normalize_axes(axes, rank: int) -> List[int]:
+    return [axis + rank if axis < 0 else axis for axis in axes]
+
+
+# ---------------- output shapes of the ops that expand their inputs ----------------
+
+def _range_length(node, inputs):
+    start, limit, delta = (value.item() for value in inputs[:3])
+    return [max(int(np.ceil((limit - start) / delta)), 0)]
+
+
+_OUTPUT_SHAPE: Dict[str, Callable[[gs.Node, List[Optional[np.ndarray]]], List[int]]] = {
+    "ConstantOfShape": lambda node, inputs: inputs[0].tolist(),
+    "Expand": lambda node, inputs: list(np.broadcast_shapes(inputs[0].shape, tuple(inputs[1].tolist()))),
+    "Tile": lambda node, inputs: [dim * repeat for dim, repeat in zip(inputs[0].shape, inputs[1].tolist())],
+    "Range": _range_length,
+}
+
+
+# ---------------- evaluators ----------------
+
+def _elementwise(func):
+    return lambda node, inputs: [func(*inputs)]
+
+
+def _int_div(a, b):
+    if np.issubdtype(a.dtype, np.integer):
+        # ONNX integer Div truncates toward zero, numpy floors
+        quotient = a // b
+        return quotient + ((a % b != 0) & ((a < 0) != (b < 0))).astype(quotient.dtype)
+    return np.divide(a, b).astype(a.dtype)
+
+
+for _op, _func in {
+    "Add": np.add, "Sub": np.subtract, "Mul": np.multiply, "Div": _int_div,
+    "Pow": lambda a, b: np.power(a, b).astype(a.dtype),
+    "Equal": np.equal, "Less": np.less, "Greater": np.greater,
+    "LessOrEqual": np.less_equal, "GreaterOrEqual": np.greater_equal,
+    "And": np.logical_and, "Or": np.logical_or, "Xor": np.logical_xor, "Not": np.logical_not,
+    "Neg": np.negative, "Abs": np.abs, "Sqrt": np.sqrt, "Exp": np.exp, "Log": np.log,
+    "Reciprocal": np.reciprocal, "Floor": np.floor, "Ceil": np.ceil, "Relu": lambda x: np.maximum(x, 0).astype(x.dtype),
+    "Sigmoid": lambda x: (1 / (1 + np.exp(-x))).astype(x.dtype),
+    "Where": np.where, "Identity": lambda x: x,
+}.items():
+    ConstantFolder.register(_op)(_elementwise(_func))
+
+
+@ConstantFolder.register("Min", "Max", "Sum")
+def _variadic(node, inputs):
+    func = {"Min": np.minimum, "Max": np.maximum, "Sum": np.add}[node.op]
+    result = inputs[0]
+    for value in inputs[1:]:
+        result = func(result, value)
+    return [result]
+
+
+@ConstantFolder.register("Constant")
+def _constant(node, inputs):
+    for name, value in node.attrs.items():
+        if name == "value":
+            return [InitializerStore.decode(value)]
+        if name in ("value_float", "value_int"):
+            return [np.array(value, dtype=np.float32 if name == "value_float" else np.int64)]
+        if name in ("value_floats", "value_ints"):
+            return [np.array(value, dtype=np.float32 if name == "value_floats" else np.int64)]
+    raise ValueError(f"unsupported Constant attributes {list(node.attrs)}")
+
+
+@ConstantFolder.register("Shape")
+def _shape(node, inputs):
+    shape = np.array(inputs[0].shape, dtype=np.int64)
+    start, end = node.attrs.get("start", 0), node.attrs.get("end", None)
+    return [shape[start:end]]
+
+
+@ConstantFolder.register("Size")
+def _size(node, inputs):
+    return [np.array(inputs[0].size, dtype=np.int64)]
+
+
+@ConstantFolder.register("Cast")
+def _cast(node, inputs):
+    return [inputs[0].astype(helper.tensor_dtype_to_np_dtype(node.attrs["to"]))]
+
+
+@ConstantFolder.register("Gather")
+def _gather(node, inputs):
+    return [np.take(inputs[0], inputs[1], axis=node.attrs.get("axis", 0))]
+
+
+@ConstantFolder.register("Concat")
+def _concat(node, inputs):
+    return [np.concatenate([value for value in inputs if value is not None], axis=node.attrs["axis"])]
+
+
+@ConstantFolder.register("Unsqueeze")
+def _unsqueeze(node, inputs):
+    axes = _attr_or_input(node, inputs, "axes", 1)
+    axes = sorted(_normalize_axes(axes, inputs[0].ndim + len(axes)))
+    result = inputs[0]
+    for axis in axes:
+        result = np.expand_dims(result, axis)
+    return [result]
+
+
+@ConstantFolder.register("Squeeze")
+def _squeeze(node, inputs):
+    axes = _attr_or_input(node, inputs, "axes", 1)
+    if axes is None:
+        return [np.squeeze(inputs[0])]
+    return [np.squeeze(inputs[0], axis=tuple(_normalize_axes(axes, inputs[0].ndim)))]
+
+
+@ConstantFolder.register("Reshape")
+def _reshape(node, inputs):
+    data, shape = inputs[0], inputs[1].tolist()
+    if not node.attrs.get("allowzero", 0):
+        shape = [data.shape[i] if dim == 0 else dim for i, dim in enumerate(shape)]
+    return [data.reshape(shape)]
+
+
+@ConstantFolder.register("Flatten")
+def _flatten(node, inputs):
+    data = inputs[0]
+    axis = _normalize_axes([node.attrs.get("axis", 1)], data.ndim)[0]
+    return [data.reshape(int(np.prod(data.shape[:axis], dtype=np.int64)), -1)]
+
+
+@ConstantFolder.register("Transpose")
+def _transpose(node, inputs):
+    return [np.transpose(inputs[0], node.attrs.get("perm"))]
+
+
+@ConstantFolder.register("Slice")
+def _slice(node, inputs):
+    data = inputs[0]
+    starts = _attr_or_input(node, inputs, "starts", 1)
+    ends = _attr_or_input(node, inputs, "ends", 2)
+    axes = _attr_or_input(node, inputs, "axes", 3) or list(range(len(starts)))
+    steps = _attr_or_input(node, inputs, "steps", 4) or [1] * len(starts)
+    index = [slice(None)] * data.ndim
+    for start, end, axis, step in zip(starts, ends, _normalize_axes(axes, data.ndim), steps):
+        # INT64_MAX / INT64_MIN stand for "to the end", python slices clamp them
+        index[axis] = slice(start, end if end >= -2 ** 62 else None, step)
+    return [data[tuple(index)]]
+
+
+@ConstantFolder.register("Range")
+def _range(node, inputs):
+    start, limit, delta = inputs[:3]
+    return [np.arange(start, limit, delta, dtype=start.dtype)]
+
+
+@ConstantFolder.register("ConstantOfShape")
+def _constant_of_shape(node, inputs):
+    value = node.attrs.get("value")
+    value = InitializerStore.decode(value).reshape(-1) if value is not None else np.zeros(1, dtype=np.float32)
+    return [np.full(tuple(inputs[0].tolist()), value[0], dtype=value.dtype)]
+
+
+@ConstantFolder.register("Expand")
+def _expand(node, inputs):
+    shape = np.broadcast_shapes(inputs[0].shape, tuple(inputs[1].tolist()))
+    return [np.broadcast_to(inputs[0], shape).copy()]
+
+
+@ConstantFolder.register("Tile")
+def _tile(node, inputs):
+    return [np.tile(inputs[0], inputs[1].tolist())]
+
+
+@ConstantFolder.register("ReduceSum", "ReduceMean", "ReduceProd", "ReduceMax", "ReduceMin")
+def _reduce(node, inputs):
+    func = {"ReduceSum": np.sum, "ReduceMean": np.mean, "ReduceProd": np.prod,
+            "ReduceMax": np.max, "ReduceMin": np.min}[node.op]
+    data = inputs[0]
+    axes = _attr_or_input(node, inputs, "axes", 1)
+    if not axes:
+        if node.attrs.get("noop_with_empty_axes", 0):
+            return [data]
+        axes = range(data.ndim)
+    axes = tuple(_normalize_axes(axes, data.ndim))
+    return [func(data, axis=axes, keepdims=bool(node.attrs.get("keepdims", 1))).astype(data.dtype)]
+
+
+@ConstantFolder.register("MatMul")
+def _matmul(node, inputs):
+    return [np.matmul(inputs[0], inputs[1])]
+
+
+@Pass.register()
+class ConstantFoldingPass(Pass):
+    '''
+        Replace the nodes whose outputs can be computed at optimization time (shape computation
+        chains such as Shape -> Gather -> Concat -> Reshape, arithmetic on initializers) by
+        initializers, see ConstantFolder. Outputs above config.constant_folding_max_size bytes
+        are left alone. With config.constant_folding_dry_run the graph is not changed, only the
+        report of what would be folded is logged. The report goes to optimizer.folding_report.
+    '''
+    name = "constant_folding"
+    requires = ("shapes",)
+    invalidates = ("digraph", "shapes")
+
+    def run(self, optimizer) -> bool:
+        config = optimizer.config
+        dry_run = config.constant_folding_dry_run
+        gs_graph = optimizer.model.get_gs_graph()
+        folder = ConstantFolder(max_size=config.constant_folding_max_size)
+        graph_outputs = {id(tensor) for tensor in gs_graph.outputs}
+        report: List[Dict[str, Any]] = []
+        folded = []
+        for node in gs_graph.nodes:
+            if not folder.supports(node) or any(id(tensor) in graph_outputs for tensor in node.outputs):
+                continue
+            inputs = folder.inputs(node)
+            if inputs is None:
+                continue
+            reason = folder.check(node)
+            if reason is None:
+                try:
+                    outputs = folder.evaluate(node, inputs)
+                except Exception as e:
+                    reason = str(e) or type(e).__name__
+            entry = {"node": node.name, "op": node.op, "folded": reason is None, "reason": reason}
+            if reason is None:
+                for tensor, output in zip(node.outputs, outputs):
+                    folder.values[id(tensor)] = output
+                entry["shapes"] = [list(output.shape) for output in outputs]
+                entry["bytes"] = sum(output.nbytes for output in outputs)
+                folded.append((node, outputs))
+            report.append(entry)
+
+        if not dry_run and folded:
+            for node, outputs in folded:
+                tensors = list(node.outputs)
+                node.inputs.clear()
+                node.outputs.clear()
+                for tensor, output in zip(tensors, outputs):
+                    # 原地转成 Constant，消费者不用改；np.ascontiguousarray 会把 0 维结果变成 [1]
+                    tensor.to_constant(np.require(output, requirements="C"))
+                    if tuple(tensor.shape) != output.shape:
+                        raise RuntimeError(f"Folded {tensor.name} has shape {tensor.shape}, "
+                                           f"evaluated {list(output.shape)}.")
+            removed = {id(node) for node, _ in folded}
+            gs_graph.nodes = [node for node in gs_graph.nodes if id(node) not in removed]
+            gs_graph.cleanup()
+
+        optimizer.folding_report = report
+        skipped = [entry for entry in report if not entry["folded"]]
+        action = "would fold" if dry_run else "folded"
+        logger.info(f"Constant folding {action} {len(folded)} nodes "
+                    f"({sum(entry['bytes'] for entry in report if entry['folded'])} bytes of constants), "
+                    f"skipped {len(skipped)}.")
+        if dry_run:
+            lines = [f"  {entry['op']:<16s} {entry['node']:<40s} " +
+                     (f"{entry['shapes']} {entry['bytes']} bytes" if entry["folded"] else f"skipped: {entry['reason']}")
+                     for entry in report]
+            logger.info("Constant folding report (dry run):\n" + "\n".join(lines))
+        else:
+            for entry in skipped:
+                logger.debug(f"Not folded {entry['op']} {entry['node']}: {entry['reason']}")
+        return True
+
+
+__all__ = ["ConstantFolder", "ConstantFoldingPass"]
@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import numpy as np
+import onnx_graphsurgeon as gs
+
+from collections import defaultdict
+from typing import Dict, Hashable, List, Tuple
+from .base_pass import Pass
+from ..match_memo import _freeze
+from ..onnx_helper import InitializerStore
+from ..utils import get_constants, get_initializer_bytes
+
+logger = logging.getLogger(__name__)
+
+# ops whose outputs differ between two evaluations of the same inputs
+_NONDETERMINISTIC_OPS = frozenset({
+    "RandomNormal", "RandomUniform", "RandomNormalLike", "RandomUniformLike", "Multinomial", "Bernoulli",
+})
+
+
+def constant_keys(constants: List[gs.Constant]) -> Dict[int, Hashable]:
+    """
+        id(constant) -> content key, equal for constants with the same dtype, shape and values.
+        Only constants that share their dtype and shape with another one are decoded and hashed.
+    """
+    buckets: Dict[Tuple, List[gs.Constant]] = defaultdict(list)
+    for constant in constants:
+        values = constant._values
+        buckets[(str(values.dtype), tuple(values.shape))].append(constant)
+    keys = dict()
+    for bucket_key, bucket in buckets.items():
+        for constant in bucket:
+            if len(bucket) == 1:
+                keys[id(constant)] = bucket_key
+            else:
+                array = np.ascontiguousarray(InitializerStore.decode(constant)).reshape(-1)
+                if array.dtype.hasobject:
+                    # string tensors are not compared
+                    keys[id(constant)] = bucket_key + (id(constant),)
+                else:
+                    keys[id(constant)] = bucket_key + (hashlib.sha1(array.view(np.uint8)).digest(),)
+    return keys
+
+
+@Pass.register()
+class CommonSubexpressionEliminationPass(Pass):
+    '''
+        Merge nodes that compute the same thing, in one sweep over the (topologically ordered) nodes.
+
+        A node is keyed by (domain, op, attributes, input identities). The identity of a tensor
+        produced by a merged node is that of the kept node's output, so whole duplicated chains
+        (Shape -> Gather -> Unsqueeze -> Concat, Reshape -> Transpose) collapse in the same sweep.
+        Initializers are identified by content: identical initializers with different names
+        are merged too. Nodes that output a graph output, hold a subgraph or are random are
+        kept. The first node of a group is kept, so every consumer still comes after its producer;
+        the duplicates are removed by a cleanup at the end.
+    '''
+    name = "cse"
+    invalidates = ("digraph",)
+
+    def run(self, optimizer) -> bool:
+        gs_graph = optimizer.model.get_gs_graph()
+        num_nodes, num_bytes = len(gs_graph.nodes), get_initializer_bytes(gs_graph)
+        graph_outputs = {id(tensor) for tensor in gs_graph.outputs}
+
+        constants = get_constants(gs_graph)
+        content_keys = constant_keys(constants)
+        # id(tensor) -> tensor that replaces it
+        replacement: Dict[int, gs.Tensor] = dict()
+        canonical_constants: Dict[Hashable, gs.Constant] = dict()
+        for constant in constants:
+            kept = canonical_constants.setdefault(content_keys[id(constant)], constant)
+            if kept is not constant:
+                replacement[id(constant)] = kept
+
+        seen: Dict[Hashable, gs.Node] = dict()
+        merged = 0
+        for node in gs_graph.nodes:
+            for i, tensor in enumerate(node.inputs):
+                if id(tensor) in replacement:
+                    node.inputs[i] = replacement[id(tensor)]
+            if (node.op in _NONDETERMINISTIC_OPS or not node.outputs
+                    or any(id(tensor) in graph_outputs for tensor in node.outputs)):
+                continue
+            attrs = tuple(sorted((name, _freeze(value)) for name, value in node.attrs.items()))
+            # 省略的可选输入（空名字）彼此等价
+            inputs = tuple(id(tensor) if tensor.name else "" for tensor in node.inputs)
+            key = (node.domain, node.op, attrs, inputs, len(node.outputs))
+            kept = seen.setdefault(key, node)
+            if kept is node:
+                continue
+            # 后面的消费者在遍历到时改用保留节点的输出，这里只记录替换关系
+            for duplicate, output in zip(node.outputs, kept.outputs):
+                replacement[id(duplicate)] = output
+            merged += 1
+
+        # 子图中引用外层张量的节点不在 gs_graph.nodes 里，单独替换
+        for node in gs_graph.nodes:
+            for attr in node.attrs.values():
+                if isinstance(attr, gs.Graph):
+                    _replace_in_subgraph(attr, replacement)
+
+        self.modified = bool(replacement)
+        gs_graph.cleanup()
+        optimizer.cse_stats = {
+            "merged": merged,
+            "nodes_removed": num_nodes - len(gs_graph.nodes),
+            "bytes_removed": num_bytes - get_initializer_bytes(gs_graph),
+        }
+        logger.info(f"CSE merged {merged} duplicate nodes, removed {optimizer.cse_stats['nodes_removed']} nodes and "
+                    f"{optimizer.cse_stats['bytes_removed']} bytes of initializers.")
+        return True
+
+
+def _replace_in_subgraph(subgraph: gs.Graph, replacement: Dict[int, gs.Tensor]):
+    for node in subgraph.nodes:
+        for i, tensor in enumerate(node.inputs):
+            if id(tensor) in replacement:
+                node.inputs[i] = replacement[id(tensor)]
+        for attr in node.attrs.values():
+            if isinstance(attr, gs.Graph):
+                _replace_in_subgraph(attr, replacement)
+
+
+__all__ = ["CommonSubexpressionEliminationPass", "constant_keys"]
@@ -0,0 +1,27 @@
+import logging
+
+from .base_pass import Pass
+from ..utils import get_initializer_bytes
+
+logger = logging.getLogger(__name__)
+
+
+@Pass.register()
+class DeadCodeEliminationPass(Pass):
+    '''
+        Remove the nodes and tensors that do not contribute to a graph output (gs cleanup, ONNX
+        ops have no side effects). Removing nodes keeps the topological order.
+    '''
+    name = "dce"
+    invalidates = ("digraph",)
+
+    def run(self, optimizer) -> bool:
+        gs_graph = optimizer.model.get_gs_graph()
+        num_nodes, num_bytes = len(gs_graph.nodes), get_initializer_bytes(gs_graph)
+        gs_graph.cleanup()
+        logger.info(f"DCE removed {num_nodes - len(gs_graph.nodes)} nodes and "
+                    f"{num_bytes - get_initializer_bytes(gs_graph)} bytes of initializers.")
+        return True
+
+
+__all__ = ["DeadCodeEliminationPass"]
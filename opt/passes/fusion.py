@@ -0,0 +1,72 @@
+import time
+import logging
+
+from .base_pass import Pass
+
+logger = logging.getLogger(__name__)
+
+
+@Pass.register()
+class PatternFusionPass(Pass):
+    '''
+        Match every registered pattern and fuse the matches. In fixpoint mode (config.fixpoint)
+        this is repeated until no pattern matches anymore, at most config.max_iterations rounds;
+        after the first round only the neighborhood of the nodes changed by the previous round
+        is re-matched. Per-round statistics go to optimizer.round_stats.
+    '''
+    name = "fusion"
+    requires = ("digraph",)
+    invalidates = ("digraph", "shapes")
+
+    def run(self, optimizer) -> bool:
+        config, matcher, executor = optimizer.config, optimizer.matcher, optimizer.executor
+        all_success = True
+        digraph = optimizer.model.get_digraph()
+        max_rounds = max(1, config.max_iterations) if config.fixpoint else 1
+        optimizer.round_stats = []
+        worklist = None
+        for round_idx in range(1, max_rounds + 1):
+            start = time.perf_counter()
+            match_results = matcher.match_all(allow_overlap=config.allow_overlap, worklist=worklist)
+            match_time = time.perf_counter() - start
+
+            if not match_results and round_idx == 1:
+                logger.info("No matches found, optimization complete.")
+                all_success = False
+            success = executor.execute_all(match_results)
+
+            if not success:
+                all_success = False
+
+            if config.fixpoint and executor.num_fused:
+                # update the matching view in place, the changed nodes seed the next round
+                start = time.perf_counter()
+                worklist = digraph.sync()
+                sync_time = time.perf_counter() - start
+            else:
+                sync_time = 0.0
+            stats = {
+                "round": round_idx,
+                "candidates": matcher.num_candidates,
+                "matches": len(match_results),
+                "fused": executor.num_fused,
+                "match_time": match_time,
+                "fusion_time": executor.fusion_time + executor.cleanup_time,
+                "sync_time": sync_time,
+            }
+            optimizer.round_stats.append(stats)
+            logger.info(f"Round {round_idx}: {stats['candidates']} candidate nodes, {stats['matches']} matches, "
+                        f"{stats['fused']} fused (match {match_time:.3f}s, fusion {stats['fusion_time']:.3f}s, "
+                        f"sync {sync_time:.3f}s)")
+            if not executor.num_fused or not worklist:
+                break
+        else:
+            if config.fixpoint:
+                logger.warning(f"Fixpoint not reached after {max_rounds} rounds.")
+
+        logger.info(f"Fusion finished after {len(optimizer.round_stats)} round(s), "
+                    f"{sum(s['fused'] for s in optimizer.round_stats)} fusions. Success: {all_success}")
+        return all_success
+
+
+__all__ = ["PatternFusionPass"]
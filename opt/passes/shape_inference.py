@@ -0,0 +1,31 @@
+import logging
+
+from .base_pass import Pass
+
+logger = logging.getLogger(__name__)
+
+
+@Pass.register()
+class ShapeInferencePass(Pass):
+    '''
+        Annotate the tensor types that are still missing (see ShapeInference). The matching view
+        already infers them on load and for the nodes it syncs, so this only does work after
+        passes that edit the gs graph without a view, or when the model was loaded without it;
+        the pass manager runs it when a pass requires shapes that are stale.
+    '''
+    name = "shape_inference"
+    requires = ("digraph",)
+    provides = ("shapes",)
+    enabled_by_default = False
+
+    def run(self, optimizer) -> bool:
+        digraph = optimizer.model.get_digraph()
+        if digraph.shape_inference is None:
+            logger.info("Shape inference is disabled (config.infer_shapes), skipped.")
+            return True
+        inferred = digraph.shape_inference.propagate(node.node for node in digraph.topological_sort())
+        logger.info(f"Inferred the output types of {inferred} nodes.")
+        return True
+
+
+__all__ = ["ShapeInferencePass"]
@@ -1,5 +1,8 @@
 from .base_pattern import *
-from .convtrans_bn import *
+from .dsl import *
+from .linear_bn import *
+from .epilogue import *
+from .activation import *
 from .layernorm import *
 from .customattn import *
 from .logdiv import *
\ No newline at end of file
@@ -0,0 +1,135 @@
+import math
+
+from .base_pattern import Pattern, MatchResult
+from .dsl import Input, OpNode, SubgraphSpec, SubgraphPattern
+from ..onnx_helper import ONNXNode, ONNXGraph
+from typing import List, Optional
+
+# exporters round these constants differently
+_RTOL = 1e-4
+
+
+def _const(name: str, value: float) -> Input:
+    return Input(name, const=True, value=value, rtol=_RTOL)
+
+
+def _gelu_tails(t: str) -> List[List[OpNode]]:
+    '''
+        the forms of 0.5 * x * (1 + t) after t = erf(...) / tanh(...), the output node last:
+          Mul(Mul(x, 1 + t), 0.5), Mul(x, Mul(1 + t, 0.5)), Mul(Mul(x, 0.5), 1 + t), Mul(x, 0.5 + 0.5 * t)
+    '''
+    return [
+        [OpNode("add", "Add", [t, _const("one", 1.0)], commutative=True),
+         OpNode("mul", "Mul", [Input("x"), "add"], commutative=True),
+         OpNode("out", "Mul", ["mul", _const("half", 0.5)], commutative=True)],
+        [OpNode("add", "Add", [t, _const("one", 1.0)], commutative=True),
+         OpNode("mul", "Mul", ["add", _const("half", 0.5)], commutative=True),
+         OpNode("out", "Mul", [Input("x"), "mul"], commutative=True)],
+        [OpNode("add", "Add", [t, _const("one", 1.0)], commutative=True),
+         OpNode("mul", "Mul", [Input("x"), _const("half", 0.5)], commutative=True),
+         OpNode("out", "Mul", ["mul", "add"], commutative=True)],
+        [OpNode("mul", "Mul", [t, _const("half", 0.5)], commutative=True),
+         OpNode("add", "Add", ["mul", _const("half_", 0.5)], commutative=True),
+         OpNode("out", "Mul", [Input("x"), "add"], commutative=True)],
+    ]
+
+
+class ActivationPattern(SubgraphPattern):
+    '''
+        An elementwise activation exported as a chain of small ops, rewritten to one op by
+        fuse_activation. The first node of every form reads x and the last one is the output.
+    '''
+    ACTIVATION = ""
+
+    def __init__(self, name: str, heads: List[List[OpNode]], anchor: str, tails: List[List[OpNode]]):
+        specs = [SubgraphSpec(nodes=head + tail, outputs=["out"], anchor=anchor) for head in heads for tail in tails]
+        super().__init__(name=name, spec=specs, priority=10)
+
+    def bind(self, matched_nodes: List[ONNXNode], graph: ONNXGraph) -> Optional[MatchResult]:
+        """
+            Returns MatchResult with:
+              - inputs: x
+              - outputs: output of the last node
+              - attrs: activation (Gelu, FastGelu: the tanh approximation of Gelu, Silu)
+        """
+        x = next((name for name in matched_nodes[0].inputs if not graph.is_constant_input(name)), None)
+        if x is None:
+            return None
+        return MatchResult(pattern=self,
+                           matched_nodes=matched_nodes,
+                           inputs=[x],
+                           outputs=[matched_nodes[-1].outputs[0]],
+                           attrs={"activation": self.ACTIVATION})
+
+
+@Pattern.register()
+class GeluPattern(ActivationPattern):
+    '''
+        x -- Div(sqrt(2)) | Mul(1/sqrt(2)) -- Erf -- Add(1) --
+          \\                                                 Mul -- Mul(0.5) -- Output    -->  x -- Gelu -- Output
+           --------------------------------------------------
+    '''
+    ACTIVATION = "Gelu"
+
+    def __init__(self):
+        heads = [
+            [OpNode("scale", "Div", [Input("x"), _const("sqrt2", math.sqrt(2.0))]), OpNode("erf", "Erf", ["scale"])],
+            [OpNode("scale", "Mul", [Input("x"), _const("rsqrt2", math.sqrt(0.5))], commutative=True),
+             OpNode("erf", "Erf", ["scale"])],
+        ]
+        super().__init__("GeluPattern", heads, "erf", _gelu_tails("erf"))
+
+
+@Pattern.register()
+class GeluTanhPattern(ActivationPattern):
+    '''
+        0.5 * x * (1 + tanh(sqrt(2/pi) * (x + 0.044715 * x^3))), x^3 as Pow(x, 3) or x * (x * x)
+            -->  x -- FastGelu -- Output
+    '''
+    ACTIVATION = "FastGelu"
+
+    def __init__(self):
+        poly = [OpNode("cube_scale", "Mul", ["cube", _const("c", 0.044715)], commutative=True),
+                OpNode("poly", "Add", [Input("x"), "cube_scale"], commutative=True),
+                OpNode("scale", "Mul", ["poly", _const("k", math.sqrt(2.0 / math.pi))], commutative=True),
+                OpNode("tanh", "Tanh", ["scale"])]
+        heads = [
+            [OpNode("cube", "Pow", [Input("x"), _const("three", 3.0)])] + poly,
+            [OpNode("square", "Mul", [Input("x"), Input("x")]),
+             OpNode("cube", "Mul", [Input("x"), "square"], commutative=True)] + poly,
+        ]
+        super().__init__("GeluTanhPattern", heads, "tanh", _gelu_tails("tanh"))
+
+
+@Pattern.register()
+class FastGeluPattern(ActivationPattern):
+    '''
+        0.5 * x * (1 + tanh(x * (0.035677 * x * x + 0.797885)))  -->  x -- FastGelu -- Output
+        (the tanh approximation with the polynomial factored, as emitted for FastGelu)
+    '''
+    ACTIVATION = "FastGelu"
+
+    def __init__(self):
+        k = math.sqrt(2.0 / math.pi)
+        heads = [[OpNode("square", "Mul", [Input("x"), Input("x")]),
+                  OpNode("square_scale", "Mul", ["square", _const("c", 0.044715 * k)], commutative=True),
+                  OpNode("poly", "Add", ["square_scale", _const("k", k)], commutative=True),
+                  OpNode("scale", "Mul", [Input("x"), "poly"], commutative=True),
+                  OpNode("tanh", "Tanh", ["scale"])]]
+        super().__init__("FastGeluPattern", heads, "tanh", _gelu_tails("tanh"))
+
+
+@Pattern.register()
+class SiluPattern(ActivationPattern):
+    '''
+        x -- Sigmoid -- Mul(x, .) -- Output  -->  x -- Silu -- Output
+    '''
+    ACTIVATION = "Silu"
+
+    def __init__(self):
+        heads = [[OpNode("sigmoid", "Sigmoid", [Input("x")])]]
+        tails = [[OpNode("out", "Mul", [Input("x"), "sigmoid"], commutative=True)]]
+        super().__init__("SiluPattern", heads, "sigmoid", tails)
+
+
+__all__ = ["ActivationPattern", "GeluPattern", "GeluTanhPattern", "FastGeluPattern", "SiluPattern"]
@@ -2,8 +2,8 @@ import logging
 
 from dataclasses import dataclass, field
 from abc import ABC, abstractmethod
-from typing import List, TypeVar, Set, Dict, Any
-from .constraints import Constraints
+from typing import List, TypeVar, Set, FrozenSet, Dict, Any, Optional, Tuple
+from .constraints import Constraints, OpTypeConstraint
 from ..onnx_helper import ONNXNode
 
 logger = logging.getLogger(__name__)
@@ -14,9 +14,15 @@ class Pattern(ABC):
     
     REGISTER_PATTERNS = dict()
     
-    def __init__(self, name : str, priority: int = 0):
+    def __init__(self, name : str, priority: int = 0, reach: Tuple[int, int] = (4, 4),
+                 benefit: Optional[float] = None):
         self._name = name
         self._priority = priority
+        # 一次匹配的融合收益，重叠的候选匹配按总收益取舍；None 表示按匹配到的节点数计
+        self._benefit = benefit
+        # (up, down): 匹配时从锚点出发，沿任一路径最多经过 up 条前驱边、down 条后继边（含邻居数检查）
+        # 增量重匹配和匹配结果缓存都依赖它，匹配只能读取这个范围内的节点
+        self._reach = reach
         self.constraints = None
     
     @property
@@ -27,6 +33,34 @@ class Pattern(ABC):
     def priority(self):
         return self._priority
     
+    @property
+    def reach(self) -> Tuple[int, int]:
+        return self._reach
+    
+    @property
+    def radius(self) -> int:
+        """undirected distance from the anchor beyond which graph changes cannot affect a match."""
+        up, down = self._reach
+        return up + down + 1
+    
+    def benefit(self, match_result: "MatchResult") -> float:
+        """value of applying `match_result`, weighed against the candidates it overlaps."""
+        if self._benefit is not None:
+            return self._benefit
+        return float(len(match_result.matched_nodes))
+
+    @property
+    def anchor_op_types(self) -> Optional[Set[str]]:
+        """
+        op types a match can start at, taken from the OpTypeConstraint(s).
+        None means the pattern has no anchor and has to be tried on every node.
+        """
+        anchors = None
+        for ct in self.constraints or []:
+            if isinstance(ct, OpTypeConstraint):
+                anchors = {ct.op_type} if anchors is None else anchors & {ct.op_type}
+        return anchors
+    
     @classmethod
     def register_pattern(cls, pattern : PatternType):    
         if not isinstance(pattern, cls):
@@ -58,6 +92,15 @@ class Pattern(ABC):
     def match(self, node, graph) -> List:
         NotImplemented
         
+    def bind(self, matched_nodes, graph) -> Optional["MatchResult"]:
+        """
+        Build the MatchResult (tensor names, initializers, attrs) of an already matched
+        structure, matched_nodes being in MatchResult.matched_nodes order. Used by the
+        matcher to skip the structure walk at a neighborhood already matched elsewhere;
+        the default matches again from the first node.
+        """
+        return self.match(matched_nodes[0], graph)
+        
     def add_constraint(self, constraint : Constraints | None):
         if self.constraints is None:
             self.constraints = []
@@ -76,7 +119,7 @@ class MatchResult:
     matched_nodes: List[ONNXNode]
     
     # Derived attribute (not part of initialization, calculated from matched_nodes)
-    node_ids: Set[str] = field(init=False)
+    node_ids: FrozenSet[int] = field(init=False)  # dense ONNXNode.id of matched_nodes
     
     node_names: Set[str] = field(init=False)
     
@@ -87,7 +130,7 @@ class MatchResult:
 
     def __post_init__(self) -> None:
         """Post-initialization processing: Calculate derived attribute `node_ids`"""
-        self.node_ids = {node.id for node in self.matched_nodes}
+        self.node_ids = frozenset(node.id for node in self.matched_nodes)
         self.node_names = {node.name for node in self.matched_nodes}
 
     def __repr__(self) -> str:
@@ -2,151 +2,179 @@ import logging
 import numpy as np
 
 from .base_pattern import Pattern, MatchResult
-from .constraints import OpTypeConstraint
+from .dsl import Input, OpNode, SubgraphSpec, SubgraphPattern
 from ..onnx_helper import ONNXNode, ONNXGraph
-from typing import List, Optional 
+from typing import List, Optional
 
 logger = logging.getLogger(__name__)
- 
+
+# rank of q / k / v -> Transpose perms: (seq, heads) swap of q / v / output, k to (.., D, S), last two dims swap
+_PERMS = {3: ([1, 0, 2], [1, 2, 0], [0, 2, 1]),
+          4: ([0, 2, 1, 3], [0, 2, 3, 1], [0, 1, 3, 2])}
+
+
+def _perm(index: int):
+    perms = [perms[index] for perms in _PERMS.values()]
+    return {"perm": lambda value: value is not None and list(value) in perms}
+
+
+def _attention_specs() -> List[SubgraphSpec]:
+    '''
+        the forms of softmax(scale * Q K^T [+ mask]) V: the scale as Div / Mul on Q or on the
+        scores (or none), with or without an additive mask, and K transposed by one Transpose,
+        by two, or given already transposed. The first six nodes are the same in every form.
+    '''
+    specs = []
+    for scale_at in ("q", "qk", None):
+        for scale_op in (("Div", "Mul") if scale_at else (None,)):
+            for masked in (False, True):
+                for k_form in ("single", "split", "pre"):
+                    q_src = "scale" if scale_at == "q" else "q_trans"
+                    k_src = {"single": "k_trans", "split": "k_trans", "pre": Input("k")}[k_form]
+                    scores = "mask" if masked else "scale" if scale_at == "qk" else "qk"
+                    nodes = [
+                        OpNode("softmax", "Softmax", [scores]),
+                        OpNode("qk", "MatMul", [q_src, k_src]),
+                        OpNode("attn_v", "MatMul", ["softmax", "v_trans"]),
+                        OpNode("out_trans", "Transpose", ["attn_v"], attrs=_perm(0)),
+                        OpNode("q_trans", "Transpose", [Input("q")], attrs=_perm(0)),
+                        OpNode("v_trans", "Transpose", [Input("v")], attrs=_perm(0)),
+                    ]
+                    if k_form == "single":
+                        nodes.append(OpNode("k_trans", "Transpose", [Input("k")], attrs=_perm(1)))
+                    elif k_form == "split":
+                        nodes += [OpNode("k_heads", "Transpose", [Input("k")], attrs=_perm(0)),
+                                  OpNode("k_trans", "Transpose", ["k_heads"], attrs=_perm(2))]
+                    if scale_at:
+                        nodes.append(OpNode("scale", scale_op, ["q_trans" if scale_at == "q" else "qk",
+                                                                Input("scale", const=True)],
+                                            commutative=scale_op == "Mul"))
+                    if masked:
+                        nodes.append(OpNode("mask", "Add", ["scale" if scale_at == "qk" else "qk", Input("mask")],
+                                            commutative=True))
+                    specs.append(SubgraphSpec(nodes=nodes, outputs=["out_trans"], anchor="softmax"))
+    return specs
+
+
 @Pattern.register()
-class CustomAttnPattern(Pattern):
-    '''  
+class CustomAttnPattern(SubgraphPattern):
+    '''
         input_q -- Reshape -- Transpose -- Div --
-                                                 \        
+                                                 \
                                                 Matmul -- Softmax -- Matmul ---Transpose -- Reshape -- Output
                                                  /                    /
         input_k -- Reshape -- Transpose --------                     /
-                                                                    /        
+                                                                    /
                                                                    /
         input_v -- Reshape ---Transpose ---------------------------
-        
+
                                        ||
                                        ||
                                       \||/
                                        \/
-                   
+
         input_q -- Reshape ---
                               \
-        input_v -- Reshape --- Attention -- Reshape -- output               
+        input_v -- Reshape --- Attention -- Reshape -- output
                               /
         input_k -- Reshape ---
-        
+
+        q / k / v are (seq, heads, head_size) or (batch, seq, heads, head_size). The scale is a
+        Div or Mul by a constant, on q or on the scores; an Add before the Softmax is an additive
+        mask; K may be transposed by one Transpose, by two (heads, then the last two dims), or be
+        given already transposed (.., heads, head_size, seq). See _attention_specs.
     '''
     def __init__(self):
-        super().__init__(name="CustomAttnPattern", priority=10)
-        self.add_constraint(OpTypeConstraint("Softmax"))
+        super().__init__(name="CustomAttnPattern", spec=_attention_specs(), priority=10)
+
+    @staticmethod
+    def _other_input(node: ONNXNode, tensor: str) -> str:
+        return node.inputs[1] if node.inputs[0] == tensor else node.inputs[0]
 
-    def match(self, node: ONNXNode, graph: ONNXGraph) -> Optional[List[ONNXNode]]:
+    @staticmethod
+    def _static(dim) -> Optional[int]:
+        return dim if isinstance(dim, int) and dim > 0 else None
+
+    def bind(self, matched_nodes: List[ONNXNode], graph: ONNXGraph) -> Optional[MatchResult]:
         """
-            Match the CustomAttention subgraph described in the class docstring.
+            matched_nodes: Softmax, MatMul, MatMul, out Transpose, q Transpose, v Transpose, then
+              the k Transpose(s), the scale and the mask Add of the matched form
             Returns MatchResult with:
-              - matched_nodes: the nodes in the matched subgraph (ordered)
-              - inputs: list with the main input tensor name
-              - outputs: list with the final output tensor name
-              - attrs: extra info like epsilon, scale_name, bias_name (if found)
+              - inputs: q, k, v tensor names, the q / k sequence slices taken from the QK^T shape
+                (None unless static), the mask tensor name (None without mask)
+              - outputs: the output of the out Transpose
+              - attrs: num_heads (None unless static), scale, scale_form (where the scale is applied),
+                rank of q / k / v, k_transposed (k is given as (.., heads, head_size, seq))
         """
-        if not all(ct.check(node, graph) for ct in self.constraints):
+        softmax, qk, _, out_trans, q_trans, v_trans = matched_nodes[:6]
+        rank = len(q_trans.attrs["perm"])
+        heads_perm, k_perm, swap_perm = _PERMS[rank]
+        fused = {node.id: node for node in matched_nodes}
+        if any(list(node.attrs["perm"]) != heads_perm for node in (out_trans, v_trans)):
             return None
-
-        # start from Softmax
-        softmax_node = node
-        # predecessor should be Matmul
-        matmuls = graph.get_predecessors(softmax_node)
-        if len(matmuls) != 1 or not matmuls[0].is_op("MatMul"):
+        # softmax 必须在最后一维上：opset 13 之前 axis 缺省为 1，且语义是展平后的二维
+        axis = softmax.attrs.get("axis", -1 if graph.gs_graph.opset >= 13 else 1)
+        if axis not in (-1, rank - 1):
             return None
-        pre_matmul = matmuls[0]  
-        
-        if pre_matmul_shape := graph.get_output_shape_by_name(pre_matmul.outputs[0]): 
-            if len(pre_matmul_shape) != 3:
-                return None
-            q_seq_values = np.array([0, pre_matmul_shape[1]], dtype=np.int32)
-            k_seq_values = np.array([0, pre_matmul_shape[2]], dtype=np.int32)
-        else:
-            raise ValueError("Cannot infer pre_matmul output shape")
-        
-        q_k_nodes = graph.get_predecessors(pre_matmul)
-        if len(q_k_nodes) !=2:
-            return None
-        div_node = None
-        k_trans_node = None
-        for nd in q_k_nodes:
-            if nd.is_op("Div"):
-                div_node = nd 
-            if nd.is_op("Transpose"):
-                k_trans_node = nd
-                
-        if not (div_node and k_trans_node):
-            return None
-        
-        # trace q branch
-        # Div predecessor should be Transpose
-        if q_trans_node := graph.get_predecessors(div_node):
-            if len(q_trans_node) !=1 or not q_trans_node[0].is_op("Transpose"):
-                return None
-            q_trans_node = q_trans_node[0]
+
+        def producer(tensor: str) -> Optional[ONNXNode]:
+            node = graph.get_producer(tensor)
+            return node if node is not None and node.id in fused else None
+
+        # k
+        k_transposed = False
+        k_trans = producer(qk.inputs[1])
+        if k_trans is None:
+            k, k_transposed = qk.inputs[1], True
+        elif list(k_trans.attrs["perm"]) == k_perm:
+            k = k_trans.inputs[0]
         else:
-            return None
-            
-        if q_reshape_node := graph.get_predecessors(q_trans_node):
-            if len(q_reshape_node) !=1 or not q_reshape_node[0].is_op("Reshape"):
-                return None 
-        q_input_name = q_trans_node.inputs[0] 
-        
-        # trace k branch
-        if k_reshape_node := graph.get_predecessors(k_trans_node):
-            if len(k_reshape_node) !=1 or not k_reshape_node[0].is_op("Reshape"):
+            k_heads = producer(k_trans.inputs[0])
+            if k_heads is None or list(k_trans.attrs["perm"]) != swap_perm or list(k_heads.attrs["perm"]) != heads_perm:
                 return None
-        k_input_name = k_trans_node.inputs[0]
-        
-        # trace forward v branch
-        if post_matmul := graph.get_successors(softmax_node):
-            if len(post_matmul) !=1 or not post_matmul[0].is_op("MatMul"):
-                return None
-            post_matmul = post_matmul[0]
-
-        v_trans_node = None
-        for nd in (nodes:= graph.get_predecessors(post_matmul)):
-            if  nd.is_op("Softmax"):
-                continue
-            if nd.is_op("Transpose"):
-                v_trans_node = nd
-        if len(nodes) !=2 or not v_trans_node:
-            return None
-            
-        if v_reshape_node := graph.get_predecessors(v_trans_node):
-            if len(v_reshape_node) !=1 or not v_reshape_node[0].is_op("Reshape"):
+            k = k_heads.inputs[0]
+
+        # scale on q or on the scores, mask before the softmax
+        scale, mask = 1.0, None
+        scale_nodes = [node for node in (producer(qk.inputs[0]),) if node is not None and node is not q_trans]
+        scores = producer(softmax.inputs[0])
+        if scores is not None and scores.op_type == "Add":
+            score_input = next(name for name in scores.inputs if producer(name) is not None)
+            mask = self._other_input(scores, score_input)
+            scores = producer(score_input)
+        if scores is not None and scores is not qk:
+            scale_nodes.append(scores)
+        # (position, op) of the scale: ("q" | "scores", "Div" | "Mul"), None without scale
+        scale_form = (("q" if scale_nodes[0] is not scores else "scores", scale_nodes[0].op_type)
+                      if scale_nodes else None)
+        for node in scale_nodes:
+            value = graph.get_initializer_by_name(node.inputs[1] if node.op_type == "Div" else
+                                                  next(name for name in node.inputs if graph.is_constant_input(name)))
+            if value is None or value.size != 1 or (node.op_type == "Div" and value.item() == 0):
                 return None
-        v_input_name = v_trans_node.inputs[0]
-        
-        # trace output branch
-        if post_transpose := graph.get_successors(post_matmul):
-            if len(post_transpose) !=1 or not post_transpose[0].is_op("Transpose"):
-                return None 
-            post_transpose = post_transpose[0]
-        output_reshape = graph.get_successors(post_transpose)
-        if len(output_reshape) !=1 or not output_reshape[0].is_op("Reshape"):
-            return None
-        outputs = post_transpose.outputs 
-        matched_nodes = [
-            softmax_node,
-            pre_matmul,
-            div_node,
-            q_trans_node,
-            k_trans_node,
-            post_matmul,
-            v_trans_node,
-            post_transpose
-        ]
-        
-        return MatchResult(pattern=self, 
-                           matched_nodes=matched_nodes, 
+            scale *= 1.0 / value.item() if node.op_type == "Div" else value.item()
+
+        qk_shape = graph.get_output_shape_by_name(qk.outputs[0])
+        seq_q = seq_k = None
+        if len(qk_shape) == rank and self._static(qk_shape[-2]) and self._static(qk_shape[-1]):
+            seq_q = np.array([0, qk_shape[-2]], dtype=np.int32)
+            seq_k = np.array([0, qk_shape[-1]], dtype=np.int32)
+        q_shape = graph.get_output_shape_by_name(q_trans.inputs[0])
+        num_heads = (self._static(qk_shape[-3]) if len(qk_shape) == rank else None) or \
+                    (self._static(q_shape[-2]) if len(q_shape) == rank else None)
+
+        return MatchResult(pattern=self,
+                           matched_nodes=matched_nodes,
                            inputs=[
-                                q_input_name,
-                                k_input_name,
-                                v_input_name,
-                                q_seq_values,
-                                k_seq_values
-                            ], 
-                           outputs=outputs)
-
-__all__ = ["CustomAttnPattern"]
\ No newline at end of file
+                                q_trans.inputs[0],
+                                k,
+                                v_trans.inputs[0],
+                                seq_q,
+                                seq_k,
+                                mask,
+                            ],
+                           outputs=out_trans.outputs,
+                           attrs={"num_heads": num_heads, "scale": scale, "scale_form": scale_form,
+                                  "rank": rank, "k_transposed": k_transposed})
+
+__all__ = ["CustomAttnPattern"]
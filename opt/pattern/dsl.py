@@ -0,0 +1,375 @@
+import itertools
+import numpy as np
+
+from abc import abstractmethod
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from .base_pattern import Pattern, MatchResult
+from .constraints import OpTypeConstraint
+from ..onnx_helper import ONNXNode, ONNXGraph
+
+# 模型中大量出现的算子：作为锚点或搜索步骤时候选多、选择性差
+_COMMON_OPS = frozenset({
+    "Add", "Sub", "Mul", "Div", "MatMul", "Gemm", "Conv", "Relu", "Reshape", "Transpose",
+    "Cast", "Concat", "Gather", "Unsqueeze", "Squeeze", "Slice", "Shape", "Identity", "Constant",
+})
+
+
+@dataclass(frozen=True)
+class Input:
+    """
+    A tensor entering the subgraph from outside; the same name binds the same tensor
+    everywhere in the pattern.
+      const: True = must be an initializer, False = must not be one, None = either
+      value: with const=True, every element of the initializer must equal it
+      rtol: relative tolerance of the comparison with value, for rounded constants (sqrt(2/pi))
+    """
+    name: str
+    const: Optional[bool] = None
+    value: Optional[float] = None
+    rtol: float = 0.0
+
+
+# per input slot: "<node>" / "<node>:<output index>" of another pattern node, an Input, or None (anything)
+InputSpec = Union[str, Input, None]
+
+
+@dataclass
+class OpNode:
+    """
+    One node of a subgraph pattern.
+      inputs: InputSpec per input slot, inputs after the listed ones are free; None leaves all free
+      attrs: attribute name -> required value, or a predicate on the value (None when absent)
+      commutative: the listed inputs may be matched in any order (Add, Mul)
+      fuse: part of MatchResult.matched_nodes; False for context nodes that must exist but are kept
+      optional: bound when present, otherwise the match goes on without it and without
+                the optional nodes only reachable through it
+      where: extra predicate(node, graph), it must only read the node itself and its tensors
+    """
+    name: str
+    op_type: str
+    inputs: Optional[List[InputSpec]] = None
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    commutative: bool = False
+    fuse: bool = True
+    optional: bool = False
+    where: Optional[Callable[[ONNXNode, ONNXGraph], bool]] = None
+
+    @property
+    def selectivity(self) -> int:
+        """static estimate of how few graph nodes satisfy this node, higher is more selective."""
+        score = 0 if self.op_type in _COMMON_OPS else 2
+        score += len(self.attrs) + (self.where is not None)
+        for spec in self.inputs or ():
+            score += spec is not None and not (isinstance(spec, Input) and spec.const is None)
+        return score
+
+
+@dataclass
+class SubgraphSpec:
+    """
+    Declarative description of a subgraph.
+      outputs: pattern nodes whose outputs are the subgraph outputs, the first bound one is used
+      anchor: node the match starts at, by default the most selective required fused node
+    """
+    nodes: List[OpNode]
+    outputs: List[str]
+    anchor: Optional[str] = None
+
+    def compile(self) -> "MatchPlan":
+        return MatchPlan(self)
+
+
+@dataclass(frozen=True)
+class _Step:
+    node: int    # pattern node bound by this step
+    source: int  # already bound pattern node the candidates are taken from
+    up: bool     # True: producers of `slots` inputs of source, False: consumers of output `slots[0]` of source
+    slots: Tuple[int, ...]
+
+
+class MatchPlan:
+    '''
+        A SubgraphSpec compiled for matching from its anchor.
+
+        Steps are ordered greedily by selectivity: producer steps first (an input has one
+        producer), then the consumer steps to the most selective nodes, optional nodes last.
+        Each candidate is checked against its op type, attributes, constant inputs and the
+        edges to the nodes bound so far as soon as it is reached, so a mismatch prunes the
+        search at the first node that fails. Commutative inputs and fan-out are backtracked.
+        Once all steps ran, the shared Input names are resolved and every fused node but the
+        output must only feed fused nodes, since fusion removes them.
+    '''
+    def __init__(self, spec: SubgraphSpec):
+        self.specs = spec.nodes
+        self.index = {node.name: i for i, node in enumerate(spec.nodes)}
+        if len(self.index) != len(spec.nodes):
+            raise ValueError("Pattern node names must be unique.")
+        # per node: None, or per slot (node index, output index) / Input / None
+        self.inputs: List[Optional[List[Any]]] = [None if node.inputs is None else
+                                                  [self._parse(inp) for inp in node.inputs]
+                                                  for node in spec.nodes]
+        # input slot orders to try per node, every permutation for commutative ones
+        self.orders = [list(itertools.permutations(range(len(inputs or ())))) if node.commutative
+                       else [tuple(range(len(inputs or ())))]
+                       for node, inputs in zip(spec.nodes, self.inputs)]
+        self.consumers: List[List[int]] = [[] for _ in spec.nodes]
+        # (node, optional node it consumes): the consumer cannot be kept without its producer
+        self.optional_edges: List[Tuple[int, int]] = []
+        for i, inputs in enumerate(self.inputs):
+            for inp in inputs or ():
+                if isinstance(inp, tuple):
+                    if self.specs[inp[0]].optional:
+                        if not self.specs[i].optional:
+                            raise ValueError(f"Required node '{self.specs[i].name}' consumes optional "
+                                             f"node '{self.specs[inp[0]].name}'.")
+                        self.optional_edges.append((i, inp[0]))
+                    if i not in self.consumers[inp[0]]:
+                        self.consumers[inp[0]].append(i)
+        # nodes with an Input name that appears more than once, resolved after the search
+        names = Counter(inp.name for inputs in self.inputs for inp in inputs or () if isinstance(inp, Input))
+        self.shared = [i for i, inputs in enumerate(self.inputs)
+                       if any(isinstance(inp, Input) and names[inp.name] > 1 for inp in inputs or ())]
+
+        self.outputs = [self.index[name] for name in spec.outputs]
+        if not self.outputs or any(not self.specs[i].fuse for i in self.outputs):
+            raise ValueError("Pattern outputs must be fused nodes.")
+        self.fused = [i for i, node in enumerate(spec.nodes) if node.fuse]
+        if spec.anchor is not None:
+            self.anchor = self.index[spec.anchor]
+        else:
+            required = [i for i in self.fused if not self.specs[i].optional]
+            self.anchor = max(required, key=lambda i: (self.specs[i].selectivity, -i))
+        if self.specs[self.anchor].optional or not self.specs[self.anchor].fuse:
+            raise ValueError("The anchor must be a required fused node.")
+        self.steps, self.reach = self._schedule()
+
+    def _parse(self, inp: InputSpec):
+        if not isinstance(inp, str):
+            return inp
+        name, _, output = inp.partition(":")
+        if name not in self.index:
+            raise ValueError(f"Unknown pattern node '{name}'.")
+        return self.index[name], int(output or 0)
+
+    def _schedule(self) -> Tuple[List[_Step], Tuple[int, int]]:
+        depth = {self.anchor: (0, 0)}  # (up, down) edges walked from the anchor
+        steps: List[_Step] = []
+        for optional in (False, True):
+            while True:
+                best = None
+                for i, node in enumerate(self.specs):
+                    if i in depth or node.optional != optional:
+                        continue
+                    for kind, step, (up, down) in self._edges_to(i, depth):
+                        key = (kind, -node.selectivity, up + down, i)
+                        if best is None or key < best[0]:
+                            best = (key, step, (up, down))
+                if best is None:
+                    break
+                _, step, depth[step.node] = best
+                steps.append(step)
+        missing = [node.name for i, node in enumerate(self.specs) if i not in depth]
+        if missing:
+            raise ValueError(f"Pattern nodes {missing} are not connected to the anchor.")
+        # consumer lookups and the closure check read one edge below every fused node
+        reach = (max(up for up, _ in depth.values()),
+                 max(down + self.specs[i].fuse for i, (_, down) in depth.items()))
+        return steps, reach
+
+    def _edges_to(self, i: int, depth: Dict[int, Tuple[int, int]]):
+        for inp in self.inputs[i] or ():
+            if isinstance(inp, tuple) and inp[0] in depth:
+                up, down = depth[inp[0]]
+                yield 2, _Step(i, inp[0], False, (inp[1],)), (up, down + 1)
+        for j in depth:
+            for slot, inp in enumerate(self.inputs[j] or ()):
+                if isinstance(inp, tuple) and inp[0] == i:
+                    slots = tuple(range(len(self.inputs[j]))) if self.specs[j].commutative else (slot,)
+                    up, down = depth[j]
+                    yield (0 if len(slots) == 1 else 1), _Step(i, j, True, slots), (up + 1, down)
+
+    def run(self, anchor: ONNXNode, graph: ONNXGraph) -> Optional[List[Optional[ONNXNode]]]:
+        """graph node bound to each pattern node (None for skipped optional nodes), or None."""
+        nodes: List[Optional[ONNXNode]] = [None] * len(self.specs)
+        if not self._accept(self.anchor, anchor, nodes, graph):
+            return None
+        return self._search(0, nodes, graph)
+
+    def matched_nodes(self, nodes: List[Optional[ONNXNode]]) -> List[ONNXNode]:
+        """the bound fused nodes, in declaration order."""
+        return [nodes[i] for i in self.fused if nodes[i] is not None]
+
+    def _search(self, k: int, nodes: List[Optional[ONNXNode]], graph: ONNXGraph):
+        if k == len(self.steps):
+            return nodes if self._finish(nodes, graph) else None
+        step = self.steps[k]
+        source = nodes[step.source]
+        if source is not None:
+            for candidate in self._candidates(step, source, graph):
+                if candidate in nodes:
+                    continue
+                if self._accept(step.node, candidate, nodes, graph):
+                    if self._search(k + 1, nodes, graph) is not None:
+                        return nodes
+                nodes[step.node] = None
+            if not self.specs[step.node].optional:
+                return None
+        return self._search(k + 1, nodes, graph)
+
+    def _candidates(self, step: _Step, source: ONNXNode, graph: ONNXGraph) -> List[ONNXNode]:
+        op_type = self.specs[step.node].op_type
+        if step.up:
+            candidates = []
+            for slot in step.slots:
+                if slot < len(source.inputs):
+                    producer = graph.get_producer(source.inputs[slot])
+                    if producer is not None and producer.op_type == op_type and producer not in candidates:
+                        candidates.append(producer)
+            return candidates
+        if step.slots[0] >= len(source.outputs):
+            return []
+        output = source.outputs[step.slots[0]]
+        return [node for node in graph.get_successors(source) if node.op_type == op_type and output in node.inputs]
+
+    def _accept(self, i: int, node: ONNXNode, nodes: List[Optional[ONNXNode]], graph: ONNXGraph) -> bool:
+        """bind node to pattern node i if it fits i and the edges to the nodes bound so far."""
+        spec = self.specs[i]
+        if node.op_type != spec.op_type:
+            return False
+        for name, expected in spec.attrs.items():
+            value = node.attrs.get(name)
+            if not (expected(value) if callable(expected) else value == expected):
+                return False
+        if spec.where is not None and not spec.where(node, graph):
+            return False
+        nodes[i] = node
+        if not self._fits_inputs(i, nodes, graph):
+            return False
+        return all(nodes[j] is None or self._fits_inputs(j, nodes, graph) for j in self.consumers[i])
+
+    def _fits_inputs(self, i: int, nodes: List[Optional[ONNXNode]], graph: ONNXGraph,
+                     tensors: Optional[Dict[str, str]] = None) -> bool:
+        """
+            Whether some allowed input order of nodes[i] fits its input specs.
+            Without `tensors`, edges to unbound nodes and Input names are left for later;
+            with it, they are enforced and the Input names are bound into it.
+        """
+        inputs = self.inputs[i]
+        if inputs is None:
+            return True
+        names = nodes[i].inputs
+        if len(names) < len(inputs):
+            return False
+        for order in self.orders[i]:
+            bound = None if tensors is None else dict(tensors)
+            if all(self._fits(inp, names[slot], nodes, graph, bound) for inp, slot in zip(inputs, order)):
+                if tensors is not None:
+                    tensors.update(bound)
+                return True
+        return False
+
+    @staticmethod
+    def _fits(inp, name: str, nodes: List[Optional[ONNXNode]], graph: ONNXGraph,
+              tensors: Optional[Dict[str, str]]) -> bool:
+        if inp is None:
+            return True
+        if isinstance(inp, tuple):
+            producer = nodes[inp[0]]
+            if producer is None:
+                return tensors is None
+            return inp[1] < len(producer.outputs) and producer.outputs[inp[1]] == name
+        if not name:
+            return False
+        if inp.const is not None and graph.is_constant_input(name) != inp.const:
+            return False
+        if inp.value is not None:
+            value = graph.get_initializer_by_name(name)
+            if value is None or not (np.allclose(value, inp.value, rtol=inp.rtol, atol=0.0) if inp.rtol
+                                     else np.all(value == inp.value)):
+                return False
+        if tensors is not None:
+            if tensors.setdefault(inp.name, name) != name:
+                return False
+        return True
+
+    def _finish(self, nodes: List[Optional[ONNXNode]], graph: ONNXGraph) -> bool:
+        if any(nodes[i] is not None and nodes[j] is None for i, j in self.optional_edges):
+            return False
+        if not self._bind_tensors([i for i in self.shared if nodes[i] is not None], nodes, graph, {}):
+            return False
+        output = next((i for i in self.outputs if nodes[i] is not None), None)
+        if output is None:
+            return False
+        fused_ids = {nodes[i].id for i in self.fused if nodes[i] is not None}
+        inner = [nodes[i] for i in self.fused if i != output and nodes[i] is not None]
+        for node in inner:
+            if any(successor.id not in fused_ids for successor in graph.get_successors(node)):
+                return False
+        # 中间结果同时是图输出时不能被吞掉
+        if any(name in graph.output_names for node in inner for name in node.outputs):
+            return False
+        return True
+
+    def _bind_tensors(self, pending: List[int], nodes: List[Optional[ONNXNode]], graph: ONNXGraph,
+                      tensors: Dict[str, str]) -> bool:
+        """resolve the shared Input names over `pending` nodes, trying the orders of commutative ones."""
+        if not pending:
+            return True
+        i, rest = pending[0], pending[1:]
+        if len(self.orders[i]) == 1:
+            return self._fits_inputs(i, nodes, graph, tensors) and self._bind_tensors(rest, nodes, graph, tensors)
+        inputs, names = self.inputs[i], nodes[i].inputs
+        for order in self.orders[i]:
+            bound = dict(tensors)
+            if (all(self._fits(inp, names[slot], nodes, graph, bound) for inp, slot in zip(inputs, order))
+                    and self._bind_tensors(rest, nodes, graph, bound)):
+                return True
+        return False
+
+    def describe(self) -> str:
+        lines = [f"anchor {self.specs[self.anchor].name} ({self.specs[self.anchor].op_type}), reach {self.reach}"]
+        for step in self.steps:
+            relation = "producer of" if step.up else "consumer of"
+            lines.append(f"  {self.specs[step.node].name}: {relation} {self.specs[step.source].name} {list(step.slots)}")
+        return "\n".join(lines)
+
+
+class SubgraphPattern(Pattern):
+    '''
+        Pattern declared as a SubgraphSpec instead of a hand-written walk. The spec is
+        compiled once into a MatchPlan; the anchor constraint and reach come from it.
+        A list of specs declares alternative forms of one subgraph (e.g. the operand
+        groupings different exporters emit), tried in order; they must share the anchor op type.
+        Subclasses only implement bind, which receives the fused nodes in declaration order.
+    '''
+    def __init__(self, name: str, spec: Union[SubgraphSpec, List[SubgraphSpec]], priority: int = 0,
+                 benefit: Optional[float] = None):
+        self.plans = [s.compile() for s in (spec if isinstance(spec, list) else [spec])]
+        self.plan = self.plans[0]
+        anchors = {plan.specs[plan.anchor].op_type for plan in self.plans}
+        if len(anchors) != 1:
+            raise ValueError(f"The forms of pattern '{name}' have different anchor op types {sorted(anchors)}.")
+        reach = (max(plan.reach[0] for plan in self.plans), max(plan.reach[1] for plan in self.plans))
+        super().__init__(name=name, priority=priority, reach=reach, benefit=benefit)
+        self.add_constraint(OpTypeConstraint(anchors.pop()))
+
+    def match(self, node: ONNXNode, graph: ONNXGraph) -> Optional[MatchResult]:
+        if not all(ct.check(node, graph) for ct in self.constraints):
+            return None
+        for plan in self.plans:
+            nodes = plan.run(node, graph)
+            if nodes is None:
+                continue
+            result = self.bind(plan.matched_nodes(nodes), graph)
+            if result is not None:
+                return result
+        return None
+
+    @abstractmethod
+    def bind(self, matched_nodes: List[ONNXNode], graph: ONNXGraph) -> Optional[MatchResult]:
+        NotImplemented
+
+
+__all__ = ["Input", "OpNode", "SubgraphSpec", "MatchPlan", "SubgraphPattern"]
@@ -0,0 +1,175 @@
+import logging
+import numpy as np
+
+from .base_pattern import Pattern, MatchResult
+from .constraints import OpTypeConstraint
+from .linear_bn import gemm_out_channels
+from ..onnx_helper import ONNXNode, ONNXGraph
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# elementwise ops folded into the weight / bias, the constant must be the second operand of Sub and Div
+_ELEMENTWISE_OPS = ("Add", "Sub", "Mul", "Div")
+_ACTIVATIONS = ("Relu", "Clip", "Sigmoid")
+# elementwise ops folded at most, the activation after them may take two more nodes (SiLU)
+_MAX_ELEMENTWISE = 3
+
+
+class LinearEpiloguePattern(Pattern):
+    '''
+        Input -- Linear(W[, B]) -- [Add|Sub|Mul|Div const]* -- [Relu|Clip|Sigmoid|SiLU] -- Output
+            -->  Input -- Linear(W', B') [+ activation] -- Output
+
+        Linear is Conv or Gemm with a constant weight (and bias). Per output channel (or scalar)
+        constant Add/Sub/Mul/Div after it are folded into W and B, see fuse_linear_epilogue; the
+        activation that follows (SiLU being x * Sigmoid(x)) is attached in the form the target
+        runtime supports. At least one epilogue op is needed, and the epilogue stops at the first
+        tensor that has other consumers or is a graph output.
+    '''
+    LINEAR_OP = ""
+
+    def __init__(self, name: str):
+        super().__init__(name=name, priority=5, reach=(1, _MAX_ELEMENTWISE + 2))
+        self.add_constraint(OpTypeConstraint(self.LINEAR_OP))
+
+    def out_channels(self, linear: ONNXNode, weight_shape: Tuple[int, ...], graph: ONNXGraph) -> Optional[int]:
+        """number of output channels (axis 1 of the output), None if nothing can be folded."""
+        NotImplemented
+
+    def out_rank(self, weight_shape: Tuple[int, ...]) -> int:
+        NotImplemented
+
+    def _per_channel(self, name: str, channels: int, rank: int, graph: ONNXGraph) -> bool:
+        # 常量补齐到输出的秩后，除通道维（axis 1）外都必须为 1，通道维为 1 或 C
+        shape = tuple(graph.initializers.get_constant(name).shape)
+        if len(shape) > rank:
+            return False
+        shape = (1,) * (rank - len(shape)) + shape
+        return all(dim == 1 for axis, dim in enumerate(shape) if axis != 1) and shape[1] in (1, channels)
+
+    def _clip_params(self, clip: ONNXNode, graph: ONNXGraph) -> Optional[List[float]]:
+        # opset >= 11 时 min/max 为可选输入，之前为属性
+        bounds = [clip.attrs.get("min", float(np.finfo(np.float32).min)),
+                  clip.attrs.get("max", float(np.finfo(np.float32).max))]
+        for i, name in enumerate(clip.inputs[1:3]):
+            if not name:
+                continue
+            if not graph.is_constant_input(name):
+                return None
+            bounds[i] = float(graph.get_initializer_by_name(name).reshape(-1)[0])
+        return bounds
+
+    def _silu(self, tensor: str, consumers: List[ONNXNode], graph: ONNXGraph) -> Optional[List[ONNXNode]]:
+        # t -- Sigmoid -- Mul(t, sigmoid(t))
+        sigmoids = [node for node in consumers if node.op_type == "Sigmoid"]
+        if len(consumers) != 2 or len(sigmoids) != 1:
+            return None
+        sigmoid = sigmoids[0]
+        mul = next(node for node in consumers if node is not sigmoid)
+        if (mul.op_type != "Mul" or sorted(mul.inputs) != sorted([tensor, sigmoid.outputs[0]])
+                or graph.get_consumers(sigmoid.outputs[0]) != [mul]
+                or sigmoid.outputs[0] in graph.output_names):
+            return None
+        return [sigmoid, mul]
+
+    def match(self, node: ONNXNode, graph: ONNXGraph) -> Optional[MatchResult]:
+        """
+            Returns MatchResult with:
+              - inputs: x, weight, bias (None when absent), then the constant of each elementwise op
+              - outputs: the output of the last epilogue op
+              - attrs: op, epilogue (elementwise op types in order), activation (None, Relu, Clip,
+                Sigmoid or Silu), activation_params ([min, max] of a Clip)
+        """
+        if not all(ct.check(node, graph) for ct in self.constraints):
+            return None
+        if len(node.inputs) < 2 or not graph.is_constant_input(node.inputs[1]):
+            return None
+        bias = node.inputs[2] if len(node.inputs) > 2 and node.inputs[2] else None
+        if bias is not None and not graph.is_constant_input(bias):
+            return None
+        weight_shape = tuple(graph.initializers.get_constant(node.inputs[1]).shape)
+        channels = self.out_channels(node, weight_shape, graph)
+        if channels is None:
+            return None
+        rank = self.out_rank(weight_shape)
+
+        matched_nodes, constants, epilogue = [node], [], []
+        activation, activation_params = None, []
+        current = node
+        while True:
+            tensor = current.outputs[0]
+            if tensor in graph.output_names:
+                break
+            consumers = graph.get_consumers(tensor)
+            silu = self._silu(tensor, consumers, graph)
+            if silu is not None:
+                matched_nodes += silu
+                activation = "Silu"
+                break
+            if len(consumers) != 1:
+                break
+            consumer = consumers[0]
+            if consumer.op_type in _ELEMENTWISE_OPS and len(epilogue) < _MAX_ELEMENTWISE:
+                if len(consumer.inputs) != 2 or consumer.inputs[0] == consumer.inputs[1]:
+                    break
+                index = consumer.inputs.index(tensor)
+                other = consumer.inputs[1 - index]
+                if (index == 1 and consumer.op_type in ("Sub", "Div")) or not graph.is_constant_input(other) \
+                        or not self._per_channel(other, channels, rank, graph):
+                    break
+                if consumer.op_type == "Div" and not np.all(graph.get_initializer_by_name(other)):
+                    break
+                matched_nodes.append(consumer)
+                constants.append(other)
+                epilogue.append(consumer.op_type)
+                current = consumer
+                continue
+            if consumer.op_type in _ACTIVATIONS:
+                params = self._clip_params(consumer, graph) if consumer.op_type == "Clip" else []
+                if params is not None:
+                    matched_nodes.append(consumer)
+                    activation, activation_params = consumer.op_type, params
+            break
+
+        if len(matched_nodes) == 1:
+            return None
+        return MatchResult(pattern=self,
+                           matched_nodes=matched_nodes,
+                           inputs=[node.inputs[0], node.inputs[1], bias] + constants,
+                           outputs=[matched_nodes[-1].outputs[0]],
+                           attrs={"op": self.LINEAR_OP, "epilogue": epilogue,
+                                  "activation": activation, "activation_params": activation_params})
+
+
+@Pattern.register()
+class ConvEpiloguePattern(LinearEpiloguePattern):
+    LINEAR_OP = "Conv"
+
+    def __init__(self):
+        super().__init__(name="ConvEpiloguePattern")
+
+    def out_channels(self, linear, weight_shape, graph):
+        # W: [C_out, C_in/groups, k...]
+        return weight_shape[0] if len(weight_shape) >= 3 else None
+
+    def out_rank(self, weight_shape):
+        # Y: [N, C_out, spatial...]
+        return len(weight_shape)
+
+
+@Pattern.register()
+class GemmEpiloguePattern(LinearEpiloguePattern):
+    LINEAR_OP = "Gemm"
+
+    def __init__(self):
+        super().__init__(name="GemmEpiloguePattern")
+
+    def out_channels(self, linear, weight_shape, graph):
+        return gemm_out_channels(linear, weight_shape, graph)
+
+    def out_rank(self, weight_shape):
+        return 2
+
+
+__all__ = ["LinearEpiloguePattern", "ConvEpiloguePattern", "GemmEpiloguePattern"]
@@ -2,14 +2,36 @@ import logging
 import numpy as np
 
 from .base_pattern import Pattern, MatchResult
-from .constraints import OpTypeConstraint
+from .dsl import Input, OpNode, SubgraphSpec, SubgraphPattern
 from ..onnx_helper import ONNXNode, ONNXGraph
 from typing import List, Optional 
 
 logger = logging.getLogger(__name__)
  
+# keepdims 缺省为 1，均值 / 方差必须保持维度才能和输入广播
+_KEEPDIMS = {"keepdims": lambda value: value in (None, 1)}
+
+
+def reduce_axes(node: ONNXNode, graph: ONNXGraph) -> Optional[List[int]]:
+    """axes of a ReduceMean: the attribute before opset 18, the constant second input since."""
+    axes = node.attrs.get("axes", None)
+    if axes is None and len(node.inputs) > 1 and node.inputs[1] and graph.is_constant_input(node.inputs[1]):
+        axes = graph.get_initializer_by_name(node.inputs[1]).reshape(-1).tolist()
+    return [int(axis) for axis in axes] if axes else None
+
+
+def norm_axis(axes: List[int], rank: int) -> Optional[int]:
+    """first normalized axis when `axes` are the trailing dims of a rank `rank` tensor (0 if unknown)."""
+    if all(axis < 0 for axis in axes):
+        axes = sorted(axes)
+        return axes[0] if axes == list(range(-len(axes), 0)) else None
+    if not rank:
+        return None
+    axes = sorted(axis % rank for axis in axes)
+    return axes[0] if axes == list(range(rank - len(axes), rank)) else None
+
 @Pattern.register()
-class LayerNormPattern(Pattern):
+class LayerNormPattern(SubgraphPattern):
     '''  
                 ---ReduceMean --     Pow - ReduceMean - Add - Sqrt                            |
             /                 \  /                               \                            |
@@ -18,118 +40,53 @@ class LayerNormPattern(Pattern):
                 ----------------     -----------------------------                            |
     '''
     def __init__(self):
-        super().__init__(name="LayerNormPattern", priority=10)
-        self.add_constraint(OpTypeConstraint("ReduceMean"))
+        spec = SubgraphSpec(
+            nodes=[
+                OpNode("mean", "ReduceMean", [Input("x")], attrs=_KEEPDIMS),
+                OpNode("sub", "Sub", [Input("x"), "mean"]),
+                OpNode("pow", "Pow", ["sub", Input("exponent", const=True, value=2.0)]),
+                OpNode("var", "ReduceMean", ["pow"], attrs=_KEEPDIMS),
+                OpNode("add_eps", "Add", ["var", Input("epsilon", const=True)], commutative=True),
+                OpNode("sqrt", "Sqrt", ["add_eps"]),
+                OpNode("div", "Div", ["sub", "sqrt"]),
+                # scale / bias 只有是常量时才并入 LayerNorm
+                OpNode("mul", "Mul", ["div", Input("scale", const=True)], commutative=True, optional=True),
+                OpNode("add_bias", "Add", ["mul", Input("bias", const=True)], commutative=True, optional=True),
+            ],
+            outputs=["add_bias", "mul", "div"],
+            anchor="mean")
+        super().__init__(name="LayerNormPattern", spec=spec, priority=10)
+
+    @staticmethod
+    def _other_input(node: ONNXNode, producer: ONNXNode) -> Optional[str]:
+        for inp in node.inputs:
+            if inp not in producer.outputs:
+                return inp
+        return None
 
-    def match(self, node: ONNXNode, graph: ONNXGraph) -> Optional[List[ONNXNode]]:
+    def bind(self, matched_nodes: List[ONNXNode], graph: ONNXGraph) -> Optional[MatchResult]:
         """
-            Match the LayerNorm subgraph described in the class docstring.
+            matched_nodes: ReduceMean, Sub, Pow, ReduceMean, Add, Sqrt, Div[, Mul[, Add]]
             Returns MatchResult with:
-              - matched_nodes: the nodes in the matched subgraph (ordered)
-              - inputs: list with the main input tensor name
-              - outputs: list with the final output tensor name
-              - attrs: extra info like epsilon, scale_name, bias_name (if found)
+              - inputs: the main input tensor name, scale and bias arrays
+              - outputs: output tensor names of the last matched node
+              - attrs: epsilon and axis
         """
-        if not all(ct.check(node, graph) for ct in self.constraints):
-            return None
-
-        # start from first ReduceMean
-        reduce_mean1 = node
-        # successor should be Sub
-        subs = graph.get_successors(reduce_mean1)
-        if len(subs) != 1 or not subs[0].is_op("Sub"):
-            return None
-        sub = subs[0]
-
+        reduce_mean1, sub, _, reduce_mean2, add_eps, _, div = matched_nodes[:7]
         # determine the main input (the one that is not the ReduceMean output)
-        # ONNXNode.inputs expected to be list of tensor names
-        try:
-            input_names = [n for n in sub.inputs if n not in reduce_mean1.outputs]
-            if not input_names:
-                return None
-            main_input = input_names[0]
-        except Exception:
-            return None
-
-        # Sub -> Pow
-        pow_and_Div = graph.get_successors(sub)
-        if len(pow_and_Div) != 2 or not set(nd.op_type for nd in pow_and_Div) == {"Pow", "Div"}:
+        main_input = self._other_input(sub, reduce_mean1)
+        if main_input is None:
             return None
-        pown = pow_and_Div[0]
-
-        # Pow -> ReduceMean (variance)
-        reduce_mean2_list = graph.get_successors(pown)
-        if len(reduce_mean2_list) != 1 or not reduce_mean2_list[0].is_op("ReduceMean"):
-            return None
-        reduce_mean2 = reduce_mean2_list[0]
-
-        # ReduceMean -> Add (epsilon)
-        adds = graph.get_successors(reduce_mean2)
-        if len(adds) != 1 or not adds[0].is_op("Add"):
-            return None
-        add_eps = adds[0]
-
-        # Add -> Sqrt
-        sqrts = graph.get_successors(add_eps)
-        if len(sqrts) != 1 or not sqrts[0].is_op("Sqrt"):
-            return None
-        sqrt = sqrts[0]
-
-        # Sqrt -> Div
-        divs = graph.get_successors(sqrt)
-        if len(divs) != 1 or not divs[0].is_op("Div"):
-            return None
-        div = divs[0]
         node_output_shape = graph.get_output_shape_by_name(div.outputs[0])
-        # ensure Div consumes the Sub result and sqrt result (order-agnostic)
-        if pow_and_Div[1] is not div:
-            return None
-        
-        matched_nodes = [
-            reduce_mean1, 
-            sub, 
-            pown, 
-            reduce_mean2, 
-            add_eps, 
-            sqrt, 
-            div
-        ]
-        
-        # if Div connected with Mul and Add nodes: Div -> Mul -> Add (scale and bias)
-        muls = graph.get_successors(div)
-        # here mul node must be BiasMul
-        if len(muls) != 1 or not muls[0].is_op("Mul"):
-            return None
-        mul = muls[0]
-        scale_name = None
-        # Mul inputs: one should be Div output, other is scale const
-        for inp in mul.inputs:
-            if inp not in div.outputs:
-                scale_name = inp
-                break
+
+        scale_array = None
         bias_array = None
-        scale_array = graph.get_initializer_by_name(scale_name)
-        if scale_array is None:
-            outputs = div.outputs
-        else: 
-            matched_nodes.append(mul)
-            adds2 = graph.get_successors(mul)
-            # here add node must be BiasAdd
-            if len(adds2) != 1 or not adds2[0].is_op("Add"):
-                return None
-            add_bias = adds2[0]
-            # try to find scale and bias tensor names (constants) 
-            bias_name = None
-            for inp in add_bias.inputs:
-                if inp not in mul.outputs:
-                    bias_name = inp
-                    break
-            bias_array = graph.get_initializer_by_name(bias_name)
-            outputs = list(add_bias.outputs)
-            if bias_array is None:
-                outputs = mul.outputs 
-            else:
-                matched_nodes.append(add_bias)
+        if len(matched_nodes) > 7:
+            mul = matched_nodes[7]
+            scale_array = graph.get_initializer_by_name(self._other_input(mul, div), dtype=np.float32)
+        if len(matched_nodes) > 8:
+            bias_array = graph.get_initializer_by_name(self._other_input(matched_nodes[8], mul), dtype=np.float32)
+        outputs = list(matched_nodes[-1].outputs)
              
         # attempt to read epsilon from Add (one input is a scalar constant)
         eps = None
@@ -138,11 +95,16 @@ class LayerNormPattern(Pattern):
                 eps = graph.get_initializer_by_name(inp)
                           
         # parse axis from ReduceMean node
-        axis = reduce_mean1.attrs.get("axes", None)
+        axis = reduce_axes(reduce_mean1, graph)
         if not axis:
             logger.warning("Parse axis for LayerNorm failed.")
             return None
         ln_axis = len(node_output_shape) - len(axis)
+        if (scale_array is None or bias_array is None) and \
+                not all(isinstance(dim, int) for dim in node_output_shape[ln_axis:]):
+            # 默认 scale / bias 需要静态的归一化维度，batch 等其他维度可以是符号维度
+            logger.debug(f"LayerNorm at {div.name} has no static normalized shape for its default scale/bias.")
+            return None
         if scale_array is None:
             scale_array = np.ones(node_output_shape[ln_axis:], np.float32)
         if bias_array is None:
@@ -159,4 +121,77 @@ class LayerNormPattern(Pattern):
                            outputs=outputs, 
                            attrs=attrs)
 
-__all__ = ["LayerNormPattern"]
\ No newline at end of file
+
+@Pattern.register()
+class RMSNormPattern(SubgraphPattern):
+    '''
+        Input -- Pow(2) | Mul(x, x) -- ReduceMean -- Add(eps) -- Sqrt -- Div(x, .) | Reciprocal - Mul(x, .) -- (Mul) -- Output
+            -->  Input -> RMSNorm -> Output
+
+        LayerNorm without the mean subtraction and bias (T5, LLaMA).
+    '''
+    def __init__(self):
+        heads = [
+            [OpNode("square", "Pow", [Input("x"), Input("exponent", const=True, value=2.0)])],
+            [OpNode("square", "Mul", [Input("x"), Input("x")])],
+        ]
+        stats = [OpNode("mean", "ReduceMean", ["square"], attrs=_KEEPDIMS),
+                 OpNode("add_eps", "Add", ["mean", Input("epsilon", const=True)], commutative=True),
+                 OpNode("sqrt", "Sqrt", ["add_eps"])]
+        tails = [
+            [OpNode("norm", "Div", [Input("x"), "sqrt"])],
+            [OpNode("reciprocal", "Reciprocal", ["sqrt"]),
+             OpNode("norm", "Mul", [Input("x"), "reciprocal"], commutative=True)],
+        ]
+        # scale 只有是常量时才并入 RMSNorm
+        scale = [OpNode("mul", "Mul", ["norm", Input("scale", const=True)], commutative=True, optional=True)]
+        specs = [SubgraphSpec(nodes=head + stats + tail + scale, outputs=["mul", "norm"], anchor="mean")
+                 for head in heads for tail in tails]
+        super().__init__(name="RMSNormPattern", spec=specs, priority=10)
+
+    def bind(self, matched_nodes: List[ONNXNode], graph: ONNXGraph) -> Optional[MatchResult]:
+        """
+            matched_nodes: Pow|Mul, ReduceMean, Add, Sqrt, Div|(Reciprocal, Mul)[, Mul]
+            Returns MatchResult with:
+              - inputs: the main input tensor name, scale array
+              - outputs: output tensor names of the last matched node
+              - attrs: epsilon and axis
+        """
+        square, reduce_mean, add_eps, sqrt = matched_nodes[:4]
+        main_input = square.inputs[0]
+        norm_index = 4 if matched_nodes[4].op_type == "Div" else 5
+        norm = matched_nodes[norm_index]
+        eps = graph.get_initializer_by_name(LayerNormPattern._other_input(add_eps, reduce_mean))
+        axes = reduce_axes(reduce_mean, graph)
+        node_output_shape = graph.get_output_shape_by_name(norm.outputs[0])
+        axis = norm_axis(axes, len(node_output_shape)) if axes else None
+        if axis is None or eps is None or eps.size != 1:
+            logger.debug(f"RMSNorm at {norm.name} does not normalize the last dims.")
+            return None
+
+        if len(matched_nodes) > norm_index + 1:
+            mul = matched_nodes[norm_index + 1]
+            scale_array = graph.get_initializer_by_name(LayerNormPattern._other_input(mul, norm), dtype=np.float32)
+            # scale 只能沿归一化的维度变化
+            num_normalized = -axis if axis < 0 else len(node_output_shape) - axis
+            scale_shape = list(scale_array.shape)
+            while len(scale_shape) > num_normalized and scale_shape[0] == 1:
+                scale_shape.pop(0)
+            if len(scale_shape) > num_normalized:
+                return None
+            scale_array = scale_array.reshape(scale_shape)
+        else:
+            normalized_shape = node_output_shape[axis:] if node_output_shape else []
+            if not normalized_shape or not all(isinstance(dim, int) for dim in normalized_shape):
+                logger.debug(f"RMSNorm at {norm.name} has no static normalized shape for its default scale.")
+                return None
+            scale_array = np.ones(normalized_shape, np.float32)
+
+        return MatchResult(pattern=self,
+                           matched_nodes=matched_nodes,
+                           inputs=[main_input, scale_array],
+                           outputs=list(matched_nodes[-1].outputs),
+                           attrs={"epsilon": eps.item(), "axis": axis})
+
+
+__all__ = ["reduce_axes", "norm_axis", "LayerNormPattern", "RMSNormPattern"]
\ No newline at end of file
@@ -0,0 +1,126 @@
+import logging
+
+from .base_pattern import Pattern, MatchResult
+from .dsl import Input, OpNode, SubgraphSpec, SubgraphPattern
+from ..onnx_helper import ONNXNode, ONNXGraph
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def gemm_out_channels(linear: ONNXNode, weight_shape: Tuple[int, ...], graph: ONNXGraph) -> Optional[int]:
+    """N of a Gemm with a constant B, None if its bias C does not broadcast along N only."""
+    # Y: [M, N], W: [K, N] or [N, K] with transB
+    if len(weight_shape) != 2:
+        return None
+    channels = weight_shape[0] if linear.attrs.get("transB", 0) else weight_shape[1]
+    if len(linear.inputs) > 2 and linear.inputs[2]:
+        bias_shape = tuple(graph.initializers.get_constant(linear.inputs[2]).shape)
+        if bias_shape not in ((), (1,), (channels,), (1, 1), (1, channels)):
+            return None
+    return channels
+
+
+class LinearBNPattern(SubgraphPattern):
+    '''
+        Input -- Linear(W[, B]) -- BatchNormalization -- Output  -->  Input -- Linear(W', B') -- Output
+
+        Linear is Conv, ConvTranspose, Gemm or MatMul with a constant weight (and bias). The BN
+        (inference mode) becomes a per output channel scale of W and a new bias, see fuse_linear_bn.
+        Subclasses give the op type and where its output channels are.
+    '''
+    LINEAR_OP = ""
+
+    def __init__(self, name: str):
+        spec = SubgraphSpec(
+            nodes=[
+                OpNode("linear", self.LINEAR_OP, [None, Input("weight", const=True)]),
+                OpNode("bn", "BatchNormalization",
+                       ["linear", Input("bn_scale", const=True), Input("bn_bias", const=True),
+                        Input("bn_mean", const=True), Input("bn_var", const=True)],
+                       attrs={"training_mode": lambda value: not value}),
+            ],
+            outputs=["bn"],
+            anchor="bn")
+        super().__init__(name=name, spec=spec, priority=10)
+
+    def out_channels(self, linear: ONNXNode, weight_shape: Tuple[int, ...], graph: ONNXGraph) -> Optional[int]:
+        """number of output channels (BN axis 1 of the output), None if the BN cannot be folded."""
+        NotImplemented
+
+    def bind(self, matched_nodes: List[ONNXNode], graph: ONNXGraph) -> Optional[MatchResult]:
+        """
+            Returns MatchResult with:
+              - inputs: x, weight, bias (None when absent), BN scale, bias, mean, var (tensor names)
+              - outputs: the BN output
+              - attrs: op, epsilon
+        """
+        linear, bn = matched_nodes
+        if len([name for name in bn.outputs if name]) > 1:
+            return None
+        bias = linear.inputs[2] if len(linear.inputs) > 2 and linear.inputs[2] else None
+        if bias is not None and not graph.is_constant_input(bias):
+            return None
+        weight = graph.initializers.get_constant(linear.inputs[1])
+        channels = self.out_channels(linear, tuple(weight.shape), graph)
+        bn_scale = graph.initializers.get_constant(bn.inputs[1])
+        if channels is None or tuple(bn_scale.shape) != (channels,):
+            logger.debug(f"BatchNormalization {bn.name} does not scale the output channels of {linear.name}.")
+            return None
+        return MatchResult(pattern=self,
+                           matched_nodes=matched_nodes,
+                           inputs=[linear.inputs[0], linear.inputs[1], bias] + list(bn.inputs[1:5]),
+                           outputs=[bn.outputs[0]],
+                           attrs={"op": self.LINEAR_OP, "epsilon": bn.attrs.get("epsilon", 1e-5)})
+
+
+@Pattern.register()
+class ConvBNPattern(LinearBNPattern):
+    LINEAR_OP = "Conv"
+
+    def __init__(self):
+        super().__init__(name="ConvBNPattern")
+
+    def out_channels(self, linear, weight_shape, graph):
+        # W: [C_out, C_in/groups, k...]
+        return weight_shape[0] if len(weight_shape) >= 3 else None
+
+
+@Pattern.register()
+class ConvTransBNPattern(LinearBNPattern):
+    LINEAR_OP = "ConvTranspose"
+
+    def __init__(self):
+        super().__init__(name="ConvTransBNPattern")
+
+    def out_channels(self, linear, weight_shape, graph):
+        # W: [C_in, C_out/groups, k...]
+        return weight_shape[1] * linear.attrs.get("group", 1) if len(weight_shape) >= 3 else None
+
+
+@Pattern.register()
+class GemmBNPattern(LinearBNPattern):
+    LINEAR_OP = "Gemm"
+
+    def __init__(self):
+        super().__init__(name="GemmBNPattern")
+
+    def out_channels(self, linear, weight_shape, graph):
+        return gemm_out_channels(linear, weight_shape, graph)
+
+
+@Pattern.register()
+class MatMulBNPattern(LinearBNPattern):
+    '''the MatMul is replaced by a Gemm, so the input must be a matrix [M, K].'''
+    LINEAR_OP = "MatMul"
+
+    def __init__(self):
+        super().__init__(name="MatMulBNPattern")
+
+    def out_channels(self, linear, weight_shape, graph):
+        if len(weight_shape) != 2 or len(graph.get_output_shape_by_name(linear.inputs[0])) != 2:
+            return None
+        return weight_shape[1]
+
+
+__all__ = ["gemm_out_channels", "LinearBNPattern", "ConvBNPattern", "ConvTransBNPattern", "GemmBNPattern", "MatMulBNPattern"]
@@ -1,9 +1,10 @@
 from .base_pattern import Pattern, MatchResult
-from .constraints import OpTypeConstraint
+from .dsl import Input, OpNode, SubgraphSpec, SubgraphPattern
 from ..onnx_helper import ONNXNode, ONNXGraph   
+from typing import List, Optional
 
 @Pattern.register()
-class LogDivPattern(Pattern):
+class LogDivPattern(SubgraphPattern):
     '''
         To be configured with config file for each Project
         This pattern is expecially matched for Bevod model optimization, 
@@ -16,36 +17,24 @@ class LogDivPattern(Pattern):
         input2 ---                                 input2 --- Log ---
     '''
     def __init__(self):
-        super().__init__(name="LogDivPattern", priority=10)
-        self.add_constraint(OpTypeConstraint("Log"))
-
-    def match(self, node: ONNXNode, graph: ONNXGraph) -> MatchResult | None: 
-        if not all(ct.check(node, graph) for ct in self.constraints):
-            return None
- 
-        if len(node.inputs) < 1 or len(node.outputs) != 1:
-            return None
-
-        # only one node precedes the Log node
-        div_node = None
-        preds = graph.get_predecessors(node) 
-        if preds[0].is_op("Div"):
-            div_node = preds[0] 
-
-        if not div_node:
-            return None
-
-        for div_input in div_node.inputs:
-            if graph.is_constant_input(div_input):
-                return None
+        spec = SubgraphSpec(
+            nodes=[
+                OpNode("div", "Div", [Input("a", const=False), Input("b", const=False)]),
+                OpNode("log", "Log", ["div"]),
+            ],
+            outputs=["log"],
+            anchor="log")
+        super().__init__(name="LogDivPattern", spec=spec, priority=10)
 
+    def bind(self, matched_nodes: List[ONNXNode], graph: ONNXGraph) -> Optional[MatchResult]:
         # 返回匹配结果：matched_nodes 中先放 Div 再放 Log，
         # inputs 使用 Div 的 inputs（两个输入），outputs 使用 Log 的 outputs
+        div_node, log_node = matched_nodes
         return MatchResult(
             pattern=self,
-            matched_nodes=[div_node, node],
+            matched_nodes=matched_nodes,
             inputs=div_node.inputs,
-            outputs=node.outputs,
+            outputs=log_node.outputs,
             attrs={}
         )
     
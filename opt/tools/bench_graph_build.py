@@ -0,0 +1,41 @@
+import sys
+import time
+import logging
+import argparse
+import tracemalloc
+
+from opt.onnx_helper import ONNXModel, ONNXGraph
+
+
+def bench_graph_build(model_path: str, repeat: int = 3):
+    """时间取 repeat 次中的最小值，内存为构建一个 ONNXGraph 视图新分配的字节数（tracemalloc）"""
+    start = time.perf_counter()
+    model = ONNXModel.load(model_path)
+    load_time = time.perf_counter() - start
+    gs_graph = model.get_gs_graph()
+    num_nodes = len(gs_graph.nodes)
+    print(f"{model_path}: {num_nodes} nodes, load + import {load_time:.3f}s")
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ONNXGraph(gs_graph)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    graph = ONNXGraph(gs_graph)
+    total = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"build {best:8.3f}s  {best / num_nodes * 1e6:6.2f}us/node  "
+          f"memory {total / 2 ** 20:8.2f}MB  {total / num_nodes:7.1f}B/node")
+    return graph
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ONNXGraph construction time and memory per node.")
+    parser.add_argument("model", help="Path to the ONNX model")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, stream=sys.stdout)
+    bench_graph_build(args.model, args.repeat)
@@ -0,0 +1,47 @@
+import sys
+import time
+import logging
+import argparse
+
+from typing import List
+from opt.onnx_helper import ONNXModel
+from opt.graph_matcher import GraphMatcher
+
+
+def _signature(match_results) -> List:
+    return [(r.pattern.name, [node.name for node in r.matched_nodes]) for r in match_results]
+
+
+def bench_matching(model_path: str, workers: List[int], repeat: int = 3):
+    """时间取 repeat 次中的最小值，并校验每个进程数下的匹配结果与单进程一致"""
+    model = ONNXModel.load(model_path)
+    graph = model.get_digraph()
+    print(f"{model_path}: {len(graph.nodes)} nodes")
+
+    reference, base_time = None, None
+    for num_workers in workers:
+        matcher = GraphMatcher(graph, workers=num_workers)
+        # 测的是并行本身，小图也强制走进程池
+        matcher.PARALLEL_MIN_NODES = 0
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = matcher.match_all()
+            best = min(best, time.perf_counter() - start)
+        signature = _signature(results)
+        if reference is None:
+            reference, base_time = signature, best
+        status = "ok" if signature == reference else "MISMATCH"
+        print(f"workers={num_workers:<3d} {best:8.3f}s  speedup {base_time / best:5.2f}x  "
+              f"{len(results)} matches  {status}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark GraphMatcher.match_all against the number of worker processes.")
+    parser.add_argument("model", help="Path to the ONNX model")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Worker counts to measure, the first one is the reference")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, stream=sys.stdout)
+    bench_matching(args.model, args.workers, args.repeat)
@@ -1 +1,2 @@
-from .gs_helper import *
\ No newline at end of file
+from .gs_helper import *
+from .memory import *
\ No newline at end of file
@@ -12,6 +12,29 @@ def get_node_dict(graph: gs.Graph):
     """
     return {node.name: node for node in graph.nodes}
 
+def get_constants(graph: gs.Graph) -> list:
+    """
+    图中节点使用的 initializer（gs.Constant），按 id 去重，不构建 graph.tensors() 的张量表
+
+    Args:
+        graph: ONNX GraphSurgeon 图对象
+
+    Returns:
+        list: [gs.Constant]
+    """
+    constants = {}
+    for node in graph.nodes:
+        for tensor in node.inputs:
+            if isinstance(tensor, gs.Constant):
+                constants[id(tensor)] = tensor
+    return list(constants.values())
+
+def get_initializer_bytes(graph: gs.Graph) -> int:
+    """
+    图中节点使用的 initializer 总字节数，不解码数据（LazyValues.nbytes）
+    """
+    return sum(constant._values.nbytes for constant in get_constants(graph))
+
 @gs.Graph.register()
 def get_nodes_by_op(self, op_type: str) -> dict:
     """
@@ -60,4 +83,33 @@ def find_nodes_by_pattern(self, pattern: str) -> dict:
         node.name: node
         for node in self.nodes
         if pattern in node.name
-    }
\ No newline at end of file
+    }
+
+class TensorIndex(dict):
+    """
+    tensor name -> gs.Tensor 索引，在一批融合中持续有效，避免每次 builder 都调用 graph.tensors() 遍历整图
+
+    builders 新建张量后调用 `register`，融合完成后调用 `retire` 移除被吞掉的中间张量，
+    因此每次融合的开销只与匹配子图的大小相关。
+    """
+    @classmethod
+    def from_graph(cls, graph: gs.Graph) -> "TensorIndex":
+        return cls(graph.tensors())
+
+    def register(self, *tensors: gs.Tensor):
+        for tensor in tensors:
+            if tensor is not None and tensor.name:
+                self[tensor.name] = tensor
+
+    def retire(self, match_result):
+        """
+        移除匹配子图内部产生、且不是匹配输出的张量
+
+        Args:
+            match_result: MatchResult，matched_nodes 的 outputs 为张量名
+        """
+        kept = {out for out in match_result.outputs if isinstance(out, str)}
+        for node in match_result.matched_nodes:
+            for output in node.outputs:
+                if output not in kept:
+                    self.pop(output, None)
@@ -0,0 +1,24 @@
+import sys
+
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """
+    当前进程的峰值常驻内存 (peak RSS)，单位 MB；平台不支持时返回 None
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 下单位为 KB，macOS 下为字节
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+__all__ = ["get_peak_rss_mb"]